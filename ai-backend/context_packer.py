@@ -0,0 +1,195 @@
+"""
+Context Packer for PrepVista
+Packs retrieved chunks into a token-budgeted prompt context
+"""
+
+import logging
+from typing import List, Dict, Any, Optional
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+class ContextPacker:
+    def __init__(self, token_budget: int = 3000, min_fragment_tokens: int = 50):
+        """
+        Initialize context packer
+
+        Args:
+            token_budget: Default maximum number of tokens in the packed context
+            min_fragment_tokens: Smallest truncated chunk worth adding at the end of the budget
+        """
+        self.token_budget = token_budget
+        self.min_fragment_tokens = min_fragment_tokens
+        self.encoding = tiktoken.get_encoding("cl100k_base")  # Same encoding as PDFProcessor
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text"""
+        return len(self.encoding.encode(text))
+
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """
+        Truncate text to at most max_tokens tokens
+
+        Args:
+            text: Text to truncate
+            max_tokens: Maximum number of tokens to keep
+
+        Returns:
+            Truncated text
+        """
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def _chunk_tokens(self, chunk: Dict[str, Any]) -> int:
+        """Token count stored at ingestion time, counted only when missing"""
+        metadata = chunk.get('metadata') or {}
+        token_count = chunk.get('token_count') or (metadata.get('token_count') if isinstance(metadata, dict) else None)
+        if token_count:
+            return int(token_count)
+        return self.count_tokens(chunk.get('content', ''))
+
+    @staticmethod
+    def _find_overlap(left: str, right: str, probe_chars: int = 32) -> int:
+        """
+        Find how many leading characters of right repeat the end of left
+
+        Args:
+            left: Earlier chunk text
+            right: Following chunk text
+
+        Returns:
+            Length of the overlap in characters (0 if none)
+        """
+        probe = right[:probe_chars]
+        if not probe:
+            return 0
+
+        position = left.find(probe, max(0, len(left) - len(right)))
+        while position != -1:
+            if right.startswith(left[position:]):
+                return len(left) - position
+            position = left.find(probe, position + 1)
+        return 0
+
+    def _merge_segments(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge adjacent or overlapping chunks of the same document into segments"""
+        by_document: Dict[Any, List[Dict[str, Any]]] = {}
+        seen = set()
+        for chunk in chunks:
+            key = chunk.get('chunk_id') or chunk.get('id') or id(chunk)
+            if key in seen:
+                continue
+            seen.add(key)
+            by_document.setdefault(chunk.get('document_id') or chunk.get('file_name'), []).append(chunk)
+
+        segments = []
+        for document_chunks in by_document.values():
+            document_chunks.sort(key=lambda c: (c.get('chunk_index') is None, c.get('chunk_index') or 0))
+            current = None
+            for chunk in document_chunks:
+                content = chunk.get('content', '')
+                tokens = self._chunk_tokens(chunk)
+                score = chunk.get('similarity_score', 0.0)
+                index = chunk.get('chunk_index')
+
+                if (current is not None and index is not None and current['last_index'] is not None
+                        and index - current['last_index'] == 1):
+                    overlap = self._find_overlap(current['content'], content)
+                    overlap_tokens = self.count_tokens(content[:overlap]) if overlap else 0
+                    separator = "" if overlap else " "
+                    current['content'] += separator + content[overlap:]
+                    current['tokens'] += tokens - overlap_tokens
+                    current['tokens_saved'] += overlap_tokens
+                    current['score'] = max(current['score'], score)
+                    current['last_index'] = index
+                    current['chunk_count'] += 1
+                    continue
+
+                if current is not None:
+                    segments.append(current)
+                current = {
+                    'content': content,
+                    'tokens': tokens,
+                    'tokens_saved': 0,
+                    'score': score,
+                    'file_name': chunk.get('file_name', 'Unknown'),
+                    'page_number': chunk.get('page_number'),
+                    'last_index': index,
+                    'chunk_count': 1
+                }
+            if current is not None:
+                segments.append(current)
+
+        # Most relevant segments first
+        segments.sort(key=lambda segment: segment['score'], reverse=True)
+        return segments
+
+    def pack(self, chunks: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Pack retrieved chunks into context text within a token budget
+
+        Args:
+            chunks: Retrieved chunks with content, similarity_score and chunk metadata
+            token_budget: Maximum tokens in the packed context (defaults to the packer budget)
+
+        Returns:
+            Dictionary with context_text and packing statistics
+        """
+        budget = token_budget or self.token_budget
+        segments = self._merge_segments(chunks)
+
+        parts = []
+        tokens_used = 0
+        tokens_saved = 0
+        segments_used = 0
+        truncated = False
+
+        for i, segment in enumerate(segments, 1):
+            source_info = f"[Source {i}: {segment['file_name']}"
+            if segment['page_number']:
+                source_info += f", Page {segment['page_number']}"
+            source_info += f", Similarity: {segment['score']:.2f}]"
+
+            header_tokens = self.count_tokens(source_info) + 1
+            remaining = budget - tokens_used - header_tokens
+            tokens_saved += segment['tokens_saved']
+
+            if segment['tokens'] <= remaining:
+                parts.append(f"{source_info}\n{segment['content']}\n")
+                tokens_used += header_tokens + segment['tokens']
+                segments_used += 1
+                continue
+
+            # Fill what is left of the budget with the start of this segment
+            if remaining >= self.min_fragment_tokens:
+                fragment = self.truncate_to_tokens(segment['content'], remaining)
+                parts.append(f"{source_info}\n{fragment}\n")
+                tokens_used += header_tokens + remaining
+                segments_used += 1
+            truncated = True
+            break
+
+        context_text = "\n".join(parts)
+
+        # Token counts do not add up exactly across boundaries; enforce the budget on the final text
+        final_tokens = self.count_tokens(context_text)
+        if final_tokens > budget:
+            context_text = self.truncate_to_tokens(context_text, budget)
+            final_tokens = budget
+            truncated = True
+
+        logger.info(f"Packed {segments_used}/{len(segments)} segments from {len(chunks)} chunks into {final_tokens}/{budget} tokens (saved {tokens_saved} overlap tokens)")
+        return {
+            'context_text': context_text,
+            'tokens_used': final_tokens,
+            'token_budget': budget,
+            'tokens_saved': tokens_saved,
+            'chunks_in': len(chunks),
+            'segments_used': segments_used,
+            'segments_total': len(segments),
+            'truncated': truncated
+        }
@@ -0,0 +1,58 @@
+"""
+Request Deadlines for PrepVista
+Carries one time budget through every stage of a request
+"""
+
+import time
+from typing import Optional
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage starts after the request deadline has passed"""
+
+class Deadline:
+    def __init__(self, timeout: float):
+        """
+        Initialize a deadline
+
+        Args:
+            timeout: Total time budget in seconds, starting now
+        """
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_timeout(cls, timeout: Optional[float]) -> Optional["Deadline"]:
+        """Create a deadline, or None when no timeout is given"""
+        return cls(timeout) if timeout else None
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed"""
+        return self.remaining() <= 0
+
+    def budget(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """
+        Time a stage may use
+
+        Args:
+            cap: Upper bound for this stage, in seconds
+            reserve: Time to keep back for later stages, in seconds
+
+        Returns:
+            Seconds available to the stage (never negative)
+        """
+        available = max(self.remaining() - reserve, 0.0)
+        return min(available, cap) if cap is not None else available
+
+    def check(self, stage: str) -> None:
+        """
+        Raise DeadlineExceeded if no time is left for a stage
+
+        Args:
+            stage: Name of the stage about to start
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.timeout}s exceeded before {stage}")
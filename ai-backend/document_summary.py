@@ -0,0 +1,112 @@
+"""
+Document Summary Builder for PrepVista
+Computes per-document summary artifacts once, when a document's embeddings are stored
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either etc few for from further had has
+have having he her here hers herself him himself his how however i if in into is it its itself just
+may me might more most must my myself no nor not now of off on once only or other our ours ourselves
+out over own same shall she should so some such than that the their theirs them themselves then there
+these they this those through thus to too under until up upon us use used using very was we were what
+when where which while who whom why will with within without would yet you your yours yourself
+yourselves one two three also page chapter figure table example fig section
+""".split())
+
+WORD_PATTERN = re.compile(r"[a-z][a-z\-]{2,}")
+
+class DocumentSummaryBuilder:
+    def __init__(self, sample_size: int = 5, keyword_count: int = 15):
+        """
+        Initialize document summary builder
+
+        Args:
+            sample_size: Number of representative chunks to keep per document
+            keyword_count: Number of topic keywords to keep per document
+        """
+        self.sample_size = sample_size
+        self.keyword_count = keyword_count
+
+    def _keywords(self, contents: List[str]) -> List[Dict[str, Any]]:
+        """Rank terms by frequency, favouring terms spread across many chunks"""
+        term_counts: Counter = Counter()
+        chunk_counts: Counter = Counter()
+        for content in contents:
+            words = [word.strip('-') for word in WORD_PATTERN.findall(content.lower())]
+            words = [word for word in words if len(word) > 2 and word not in STOPWORDS]
+            term_counts.update(words)
+            chunk_counts.update(set(words))
+
+        total_chunks = max(len(contents), 1)
+        scored = [
+            (count * (1 + math.log(1 + chunk_counts[term] * 10 / total_chunks)), term)
+            for term, count in term_counts.items()
+        ]
+        scored.sort(reverse=True)
+        return [
+            {'keyword': term, 'count': term_counts[term], 'chunks': chunk_counts[term]}
+            for _, term in scored[:self.keyword_count]
+        ]
+
+    def build(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build summary artifacts for one document
+
+        Args:
+            chunks: Chunks of the document with content, chunk_index, page_number,
+                metadata and embedding (float32 array)
+
+        Returns:
+            Summary dictionary with counts, keywords and representative chunks
+        """
+        with_embeddings = [chunk for chunk in chunks if chunk.get('embedding') is not None and len(chunk['embedding'])]
+
+        representative = []
+        dimensions = 0
+        if with_embeddings:
+            matrix = np.stack([np.asarray(chunk['embedding'], dtype=np.float32) for chunk in with_embeddings])
+            dimensions = int(matrix.shape[1])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+
+            centroid = matrix.mean(axis=0)
+            centroid /= (np.linalg.norm(centroid) or 1.0)
+            centrality = matrix @ centroid
+
+            for index in np.argsort(-centrality)[:self.sample_size]:
+                chunk = with_embeddings[int(index)]
+                representative.append({
+                    'chunk_id': chunk.get('chunk_id'),
+                    'content': chunk.get('content', ''),
+                    'page_number': chunk.get('page_number'),
+                    'chunk_index': chunk.get('chunk_index'),
+                    'metadata': chunk.get('metadata'),
+                    'centrality': float(centrality[int(index)])
+                })
+
+        token_count = 0
+        for chunk in chunks:
+            metadata = chunk.get('metadata') or {}
+            if isinstance(metadata, dict):
+                token_count += int(metadata.get('token_count') or 0)
+
+        return {
+            'chunk_count': len(chunks),
+            'embedding_count': len(with_embeddings),
+            'token_count': token_count,
+            'char_count': sum(len(chunk.get('content') or '') for chunk in chunks),
+            'dimensions': dimensions,
+            'keywords': self._keywords([chunk.get('content') or '' for chunk in chunks]),
+            'representative_chunks': representative
+        }
@@ -0,0 +1,115 @@
+"""
+Embedding Micro-Batcher for PrepVista
+Coalesces concurrent single-text embedding requests into batched upstream calls
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingMicroBatcher:
+    def __init__(self, embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Initialize embedding micro-batcher
+
+        Args:
+            embed_batch: Coroutine function making one upstream call for a list of texts
+            max_batch_size: Flush as soon as this many texts are waiting
+            max_wait_ms: Flush at most this long after the first text arrives
+        """
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._pending: List[Tuple[str, "asyncio.Future"]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.requests = 0
+        self.batches = 0
+        self.texts_sent = 0
+        self.failures = 0
+        self._upstream_time = 0.0
+        logger.info(f"Initialized EmbeddingMicroBatcher (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed a single text as part of the next batch
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Embedding vector (raises if the upstream call failed)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Send everything pending as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._send(pending))
+
+    async def _send(self, pending: List[Tuple[str, "asyncio.Future"]]) -> None:
+        # Identical texts in one window share a single upstream slot
+        unique_texts: Dict[str, int] = {}
+        for text, _ in pending:
+            unique_texts.setdefault(text, len(unique_texts))
+        texts = list(unique_texts)
+
+        start = time.perf_counter()
+        try:
+            embeddings = await self.embed_batch(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Batched embedding call for {len(texts)} texts failed: {e}")
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.texts_sent += len(texts)
+            self._upstream_time += time.perf_counter() - start
+
+        for text, future in pending:
+            if not future.done():
+                future.set_result(embeddings[unique_texts[text]])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get batcher metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'texts_sent': self.texts_sent,
+            'avg_batch_size': self.texts_sent / self.batches if self.batches else 0.0,
+            'failures': self.failures,
+            'avg_upstream_ms': (self._upstream_time / self.batches * 1000) if self.batches else 0.0,
+            'pending': len(self._pending),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms
+        }
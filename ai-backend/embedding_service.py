@@ -3,25 +3,38 @@ Embedding Service for PrepVista
 Handles text embedding generation using Google Gemini API
 """
 
+import asyncio
+import hashlib
 import logging
 import os
+import re
+import time
 from typing import List, Dict, Any, Optional
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
 import numpy as np
+from embedding_batcher import EmbeddingMicroBatcher
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
-    def __init__(self, api_key: Optional[str] = None, model: str = "models/text-embedding-004"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "models/text-embedding-004",
+                 batch_window_ms: float = 0.0, max_batch_size: int = 32,
+                 api_endpoint: Optional[str] = None):
         """
         Initialize embedding service
         
         Args:
             api_key: Google API key (if None, will use environment variable)
             model: Embedding model to use
+            batch_window_ms: Micro-batching window for single-text requests (0 disables it)
+            max_batch_size: Maximum texts per micro-batch
+            api_endpoint: Alternative API endpoint (e.g. http://127.0.0.1:8080 for a
+                local fake server), reached over REST; None uses Google's endpoint
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         self.model = model
+        self.upstream_calls = 0
         
         if not self.api_key:
             raise ValueError("Google API key not provided")
@@ -29,6 +42,14 @@ class EmbeddingService:
         # Configure Google Generative AI
         genai.configure(api_key=self.api_key)
         
+        # An alternative endpoint gets its own client, so generation calls keep the default one
+        self.client = None
+        if api_endpoint:
+            self.client = glm.GenerativeServiceClient(
+                transport="rest",
+                client_options={"api_endpoint": api_endpoint, "api_key": self.api_key}
+            )
+        
         # Model dimensions for Google embedding models
         self.model_dimensions = {
             "models/text-embedding-004": 768,
@@ -37,12 +58,66 @@ class EmbeddingService:
         }
         
         self.dimension = self.model_dimensions.get(model, 768)
+        self._init_batcher(batch_window_ms, max_batch_size)
         logger.info(f"Initialized EmbeddingService with Google model {model} (dimensions: {self.dimension})")
     
+    def _init_batcher(self, batch_window_ms: float, max_batch_size: int) -> None:
+        """Set up micro-batching of concurrent single-text requests"""
+        self.batcher = None
+        if batch_window_ms > 0:
+            self.batcher = EmbeddingMicroBatcher(
+                self.embed_texts,
+                max_batch_size=max_batch_size,
+                max_wait_ms=batch_window_ms
+            )
+    
+    def _embed_sync(self, texts: List[str]) -> List[List[float]]:
+        """
+        Make one upstream embedding call for a list of texts
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Embedding vectors in input order
+        """
+        self.upstream_calls += 1
+        if len(texts) == 1:
+            result = genai.embed_content(
+                model=self.model,
+                content=texts[0],
+                task_type="retrieval_document",
+                client=self.client
+            )
+            return [result['embedding']]
+        
+        result = genai.embed_content(
+            model=self.model,
+            content=texts,
+            task_type="retrieval_document",
+            client=self.client
+        )
+        return result['embedding']
+    
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of texts with a single batched upstream call
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Embedding vectors in input order (raises on failure)
+        """
+        return await asyncio.to_thread(self._embed_sync, texts)
+    
     async def generate_embedding(self, text: str) -> Optional[List[float]]:
         """
         Generate embedding for a single text using Google Gemini
         
+        Concurrent calls are coalesced into batched upstream calls when
+        micro-batching is enabled.
+        
         Args:
             text: Text to embed
             
@@ -52,14 +127,11 @@ class EmbeddingService:
         try:
             logger.debug(f"Generating embedding for text: {text[:100]}...")
             
-            # Use Google's embedding model
-            result = genai.embed_content(
-                model=self.model,
-                content=text,
-                task_type="retrieval_document"
-            )
+            if self.batcher:
+                embedding = await self.batcher.embed(text)
+            else:
+                embedding = (await self.embed_texts([text]))[0]
             
-            embedding = result['embedding']
             logger.debug(f"Generated embedding with {len(embedding)} dimensions")
             
             return embedding
@@ -93,12 +165,7 @@ class EmbeddingService:
                     batch_embeddings = []
                     for text in batch_texts:
                         try:
-                            result = genai.embed_content(
-                                model=self.model,
-                                content=text,
-                                task_type="retrieval_document"
-                            )
-                            batch_embeddings.append(result['embedding'])
+                            batch_embeddings.append(self._embed_sync([text])[0])
                         except Exception as e:
                             logger.warning(f"Failed to generate embedding for text in batch: {e}")
                             batch_embeddings.append(None)
@@ -158,7 +225,8 @@ class EmbeddingService:
         return {
             'model': self.model,
             'dimensions': self.dimension,
-            'api_key_configured': bool(self.api_key)
+            'api_key_configured': bool(self.api_key),
+            'micro_batching': self.batcher.get_stats() if self.batcher else None
         }
     
     async def test_embedding(self) -> bool:
@@ -182,3 +250,47 @@ class EmbeddingService:
         except Exception as e:
             logger.error(f"Embedding service test failed: {e}")
             return False
+
+class OfflineEmbeddingService(EmbeddingService):
+    def __init__(self, dimension: int = 768, latency_ms: float = 0.0, per_text_ms: float = 0.0,
+                 batch_window_ms: float = 0.0, max_batch_size: int = 32):
+        """
+        Initialize offline embedding service
+        
+        Produces deterministic hashed bag-of-words vectors without any API calls,
+        for local development and benchmarks. Optional latency simulates the
+        round trip to a real embedding server.
+        
+        Args:
+            dimension: Embedding dimensions
+            latency_ms: Simulated fixed latency per upstream call
+            per_text_ms: Simulated additional latency per text in a call
+            batch_window_ms: Micro-batching window for single-text requests (0 disables it)
+            max_batch_size: Maximum texts per micro-batch
+        """
+        self.api_key = None
+        self.model = "offline-hashing"
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.upstream_calls = 0
+        self._init_batcher(batch_window_ms, max_batch_size)
+        logger.info(f"Initialized OfflineEmbeddingService (dimensions: {dimension})")
+    
+    def _embed_text(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r'\w+', text.lower()):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+            vector[value % self.dimension] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+    
+    def _embed_sync(self, texts: List[str]) -> List[List[float]]:
+        self.upstream_calls += 1
+        delay = self.latency_ms + self.per_text_ms * len(texts)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return [self._embed_text(text) for text in texts]
@@ -0,0 +1,153 @@
+"""
+Ingest Pipeline for PrepVista
+Streams a document through extraction, chunking, embedding and storage as overlapping stages
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def take(iterator: Iterator[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+    """Next count items of an iterator (fewer at its end)"""
+    return list(itertools.islice(iterator, count))
+
+class IngestPipeline:
+    def __init__(self, embedding_service, vector_storage, batch_size: int = 100, queue_size: int = 4):
+        """
+        Initialize ingest pipeline
+
+        Chunks flow through three stages connected by bounded queues: extraction
+        (chunks are pulled from the PDF in batches on a worker thread), batched
+        embedding and bulk storage. While one batch is stored the next is
+        embedded and the one after is extracted, and a slow stage holds the
+        earlier ones back once its queue is full, so memory stays at a few
+        batches however large the document.
+
+        Args:
+            embedding_service: Service whose embed_texts embeds a batch in one call
+            vector_storage: VectorStorageService storing the chunks and embeddings
+            batch_size: Chunks per embedding call and per storage transaction
+            queue_size: Batches waiting between two stages before the earlier one pauses
+        """
+        self.embedding_service = embedding_service
+        self.vector_storage = vector_storage
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        logger.info(f"Initialized IngestPipeline (batch_size={batch_size}, queue_size={queue_size})")
+
+    async def ingest(self, chunks: Iterable[Dict[str, Any]], document_id: str,
+                     progress: Optional[Dict[str, Any]] = None,
+                     run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread) -> Dict[str, Any]:
+        """
+        Embed and store the chunks of a document
+
+        Args:
+            chunks: Chunks in document order, e.g. PDFProcessor.iter_pdf_chunks
+                (a lazy iterator is consumed on a worker thread)
+            document_id: Document ID (from VectorStorageService.begin_document_ingest)
+            progress: Optional dictionary updated with embeddings_stored and batches_stored
+            run_blocking: Runs the blocking extraction and storage work off the event
+                loop (background jobs pass their own thread pool)
+
+        Returns:
+            Dictionary with chunks_embedded, embeddings_stored, batches and
+            seconds spent in each stage
+
+        Raises:
+            RuntimeError: If a batch could not be stored (earlier batches stay stored);
+                errors from extraction or embedding are raised as they are
+        """
+        progress = progress if progress is not None else {}
+        progress.update({'embeddings_stored': 0, 'batches_stored': 0})
+
+        chunk_batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        embedded_batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        failed = asyncio.Event()
+        timings = {'extract_seconds': 0.0, 'embed_seconds': 0.0, 'store_seconds': 0.0}
+        counts = {'chunks_embedded': 0, 'batches': 0}
+        iterator = iter(chunks)
+
+        async def extract() -> None:
+            try:
+                while not failed.is_set():
+                    start = time.perf_counter()
+                    batch = await run_blocking(take, iterator, self.batch_size)
+                    timings['extract_seconds'] += time.perf_counter() - start
+                    if not batch:
+                        break
+                    await chunk_batches.put(batch)
+            except Exception:
+                failed.set()
+                await chunk_batches.put(None)
+                raise
+            await chunk_batches.put(None)
+
+        async def embed() -> None:
+            try:
+                while (batch := await chunk_batches.get()) is not None:
+                    if failed.is_set():
+                        continue
+                    start = time.perf_counter()
+                    embeddings = await self.embedding_service.embed_texts([chunk['content'] for chunk in batch])
+                    timings['embed_seconds'] += time.perf_counter() - start
+                    counts['chunks_embedded'] += len(batch)
+                    await embedded_batches.put((batch, embeddings))
+            except Exception:
+                failed.set()
+                # Keep draining so extraction is never stuck on a full queue
+                while await chunk_batches.get() is not None:
+                    pass
+                await embedded_batches.put(None)
+                raise
+            await embedded_batches.put(None)
+
+        async def store() -> None:
+            error = None
+            while (item := await embedded_batches.get()) is not None:
+                if failed.is_set():
+                    continue
+                batch, embeddings = item
+                start = time.perf_counter()
+                stored = await self.vector_storage.store_document_chunks(
+                    document_id, batch, embeddings, model=self.embedding_service.model,
+                    run_blocking=run_blocking
+                )
+                timings['store_seconds'] += time.perf_counter() - start
+                if stored != len(batch):
+                    # Keep draining so embedding is never stuck on a full queue
+                    failed.set()
+                    error = RuntimeError(f"Failed to store chunks {batch[0]['chunk_index']}-{batch[-1]['chunk_index']} "
+                                         f"of document {document_id}")
+                    continue
+                progress['embeddings_stored'] += stored
+                progress['batches_stored'] += 1
+                counts['batches'] += 1
+            if error:
+                raise error
+
+        try:
+            results = await asyncio.gather(extract(), embed(), store(), return_exceptions=True)
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                try:
+                    close()
+                except ValueError:
+                    # Still running on a worker thread after a cancellation; it finishes on its own
+                    pass
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        result = {
+            **counts,
+            'embeddings_stored': progress['embeddings_stored'],
+            **{name: round(seconds, 3) for name, seconds in timings.items()}
+        }
+        logger.info(f"Ingested document {document_id}: {result}")
+        return result
@@ -0,0 +1,220 @@
+"""
+Ingestion Job Queue for PrepVista
+Runs document ingestion in the background on a bounded in-process worker pool
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class IngestionQueueFullError(Exception):
+    """Raised when the ingestion queue is at capacity"""
+
+class IngestionJobQueue:
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 16, max_finished_jobs: int = 256,
+                 result_ttl: float = 600.0):
+        """
+        Initialize ingestion job queue
+
+        Args:
+            max_workers: Jobs running at once (with two threads each for their blocking
+                work, since a server-side ingest extracts and stores at the same time)
+            max_queue_size: Jobs waiting for a worker before new submissions are rejected
+            max_finished_jobs: Finished jobs whose status is kept for polling
+            result_ttl: Seconds a finished job's result is kept when nobody fetches it;
+                a result is released as soon as it has been fetched
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.max_finished_jobs = max_finished_jobs
+        self.result_ttl = result_ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=2 * max_workers, thread_name_prefix="ingest")
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # Finished jobs in the order they finished, with whether their result is still held
+        self._finished: "OrderedDict[str, bool]" = OrderedDict()
+        self._sequence = itertools.count(1)
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        logger.info(f"Initialized IngestionJobQueue (max_workers={max_workers}, max_queue_size={max_queue_size})")
+
+    def _ensure_workers(self) -> None:
+        """Start the worker tasks on the running event loop the first time a job is submitted"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    def submit(self, run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+               description: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Queue an ingestion job
+
+        Args:
+            run: Coroutine function doing the work; it is passed the job's progress
+                dictionary to update and returns the job result
+            description: Details reported with the job status (e.g. file name, agent)
+
+        Returns:
+            Job ID
+
+        Raises:
+            IngestionQueueFullError: If max_queue_size jobs are already waiting
+        """
+        self._ensure_workers()
+        job_id = f"job_{uuid.uuid4().hex}"
+        job = {
+            'job_id': job_id,
+            'sequence': next(self._sequence),
+            'status': JOB_QUEUED,
+            'description': description or {},
+            'progress': {},
+            'result': None,
+            'result_released': False,
+            'error': None,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        try:
+            self._queue.put_nowait((job, run))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise IngestionQueueFullError("Ingestion queue is full. Please try again later.")
+
+        self._jobs[job_id] = job
+        self.submitted += 1
+        return job_id
+
+    async def run_blocking(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run blocking work of a job (file I/O, PDF processing) on the queue's thread pool
+
+        Args:
+            function: Blocking function
+            *args: Arguments for the function
+
+        Returns:
+            The function's return value
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _worker(self) -> None:
+        while True:
+            job, run = await self._queue.get()
+            job['status'] = JOB_RUNNING
+            job['started_at'] = time.time()
+            try:
+                job['result'] = await run(job['progress'])
+                job['status'] = JOB_SUCCEEDED
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job['job_id']} failed: {e}")
+                job['status'] = JOB_FAILED
+                job['error'] = str(e)
+                self.failed += 1
+            finally:
+                job['finished_at'] = time.time()
+                self._queue.task_done()
+                self._mark_finished(job['job_id'])
+
+    def _mark_finished(self, job_id: str) -> None:
+        """Keep finished jobs for polling, forgetting the oldest beyond max_finished_jobs"""
+        self._finished[job_id] = True
+        while len(self._finished) > self.max_finished_jobs:
+            old_job_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_job_id, None)
+        self._expire_results()
+
+    def _release_result(self, job: Dict[str, Any]) -> None:
+        """Drop a finished job's result (e.g. its chunks), keeping its status"""
+        if job['result'] is not None:
+            job['result'] = None
+            job['result_released'] = True
+        self._finished[job['job_id']] = False
+
+    def _expire_results(self) -> None:
+        """Release results nobody fetched within result_ttl"""
+        cutoff = time.time() - self.result_ttl
+        for job_id, held in self._finished.items():
+            job = self._jobs[job_id]
+            if job['finished_at'] > cutoff:
+                break
+            if held:
+                self._release_result(job)
+
+    def _queued_ahead(self, job: Dict[str, Any]) -> int:
+        return sum(1 for other in self._jobs.values()
+                   if other['status'] == JOB_QUEUED and other['sequence'] < job['sequence'])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the status of a job
+
+        Args:
+            job_id: Job ID from submit
+
+        Returns:
+            Job status dictionary, or None if unknown. The result of a
+            succeeded job is returned once and then released (result_released
+            is set on later polls).
+        """
+        self._expire_results()
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        status = {key: value for key, value in job.items() if key != 'sequence'}
+        status['progress'] = dict(job['progress'])
+        if job['status'] == JOB_QUEUED:
+            status['queue_position'] = self._queued_ahead(job) + 1
+        if job_id in self._finished:
+            self._release_result(job)
+        return status
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        statuses = [job['status'] for job in self._jobs.values()]
+        return {
+            'queued': statuses.count(JOB_QUEUED),
+            'running': statuses.count(JOB_RUNNING),
+            'results_held': sum(self._finished.values()),
+            'submitted': self.submitted,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'max_workers': self.max_workers,
+            'max_queue_size': self.max_queue_size
+        }
+
+    async def shutdown(self) -> None:
+        """Stop the workers, abandoning queued jobs"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
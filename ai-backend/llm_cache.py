@@ -0,0 +1,347 @@
+"""
+LLM Response Cache for PrepVista
+Caches model responses by (model, generation config, prompt) in memory and on disk
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Set per request (e.g. from a header) to skip cached responses and refresh them
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+def set_cache_bypass(bypass: bool) -> contextvars.Token:
+    """Skip cache reads for the current request; returns a token for reset_cache_bypass"""
+    return _bypass.set(bypass)
+
+def reset_cache_bypass(token: contextvars.Token) -> None:
+    """Restore the bypass flag set before set_cache_bypass"""
+    _bypass.reset(token)
+
+def describe_model(model: Any) -> Tuple[str, Any]:
+    """Model name and generation config of a Gemini model, for cache keys"""
+    return (
+        getattr(model, 'model_name', None) or type(model).__name__,
+        getattr(model, '_generation_config', None)
+    )
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int = 512, disk_path: Optional[str] = None,
+                 disk_max_entries: int = 10000, default_ttl: float = 3600.0,
+                 endpoint_ttls: Optional[Dict[str, float]] = None):
+        """
+        Initialize LLM response cache
+
+        Args:
+            max_entries: Maximum number of responses kept in memory
+            disk_path: SQLite file for the on-disk tier (None keeps responses in memory only)
+            disk_max_entries: Maximum number of responses kept on disk
+            default_ttl: Time-to-live in seconds for endpoints without their own TTL
+            endpoint_ttls: Time-to-live per endpoint in seconds (0 disables caching for it)
+        """
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.default_ttl = default_ttl
+        self.endpoint_ttls = endpoint_ttls or {}
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # The SQLite tier has its own lock so disk I/O on a worker thread never
+        # holds up memory lookups on the event loop
+        self._disk_lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._puts_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.expired = 0
+        self._endpoint_stats: Dict[str, Dict[str, int]] = {}
+
+        if disk_path:
+            self._open_disk(disk_path)
+        logger.info(f"Initialized LLMResponseCache (max_entries={max_entries}, disk_path={self.disk_path})")
+
+    def _open_disk(self, disk_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._disk.execute("CREATE INDEX IF NOT EXISTS llm_responses_accessed ON llm_responses (accessed_at)")
+            self._disk.commit()
+        except Exception as e:
+            logger.error(f"Failed to open LLM response cache at {disk_path}, using memory only: {e}")
+            self._disk = None
+            self.disk_path = None
+
+    @staticmethod
+    def make_key(model_name: str, generation_config: Any, prompt: str) -> str:
+        """
+        Build a cache key for a model call
+
+        Args:
+            model_name: Model name
+            generation_config: Generation config the model was created with
+            prompt: Rendered prompt
+
+        Returns:
+            Hex digest identifying the call
+        """
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        payload = json.dumps([model_name, generation_config, prompt_hash], default=str, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def ttl_for(self, endpoint: str) -> float:
+        """Time-to-live in seconds for responses of an endpoint"""
+        return self.endpoint_ttls.get(endpoint, self.default_ttl)
+
+    def _count(self, endpoint: str, outcome: str) -> None:
+        stats = self._endpoint_stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'bypassed': 0})
+        stats[outcome] += 1
+
+    def get(self, key: str, endpoint: str, bypass: bool = False) -> Optional[str]:
+        """
+        Get a cached response, checking memory before disk
+
+        Blocks on disk I/O; async callers use generate, which reads the disk
+        tier on a worker thread.
+
+        Args:
+            key: Cache key from make_key
+            endpoint: Endpoint the call is made for
+            bypass: Skip the cached response (also skipped when the request asked for it)
+
+        Returns:
+            Cached response text, or None on a miss or when bypassed
+        """
+        text, found = self._memory_get(key, endpoint, bypass)
+        if found:
+            return text
+        return self._disk_get(key, endpoint)
+
+    def _memory_get(self, key: str, endpoint: str, bypass: bool) -> Tuple[Optional[str], bool]:
+        """Look a response up in memory; the flag is False when the disk tier still has to be checked"""
+        with self._lock:
+            if bypass or _bypass.get():
+                self.bypassed += 1
+                self._count(endpoint, 'bypassed')
+                return None, True
+
+            if self.ttl_for(endpoint) <= 0:
+                return None, True
+
+            entry = self._memory.get(key)
+            if entry is not None:
+                text, expires_at = entry
+                if expires_at > time.time():
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self._count(endpoint, 'hits')
+                    return text, True
+                del self._memory[key]
+                self.expired += 1
+
+            if self._disk is None:
+                self.misses += 1
+                self._count(endpoint, 'misses')
+                return None, True
+            return None, False
+
+    def _disk_get(self, key: str, endpoint: str) -> Optional[str]:
+        """Look a response up on disk, promoting a hit to memory"""
+        now = time.time()
+        text = None
+        expired = False
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT response, expires_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] <= now:
+                    self._disk.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    self._disk.commit()
+                    expired = True
+                elif row is not None:
+                    self._disk.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._disk.commit()
+                    text = row[0]
+        except Exception as e:
+            logger.warning(f"LLM response cache disk read failed: {e}")
+
+        with self._lock:
+            if expired:
+                self.expired += 1
+            if text is not None:
+                self._memory_put(key, text, row[1])
+                self.disk_hits += 1
+                self._count(endpoint, 'hits')
+            else:
+                self.misses += 1
+                self._count(endpoint, 'misses')
+        return text
+
+    def put(self, key: str, endpoint: str, text: str) -> None:
+        """
+        Store a response in memory and on disk
+
+        Blocks on disk I/O; async callers use generate, which writes the disk
+        tier on a worker thread.
+
+        Args:
+            key: Cache key from make_key
+            endpoint: Endpoint the call was made for
+            text: Response text
+        """
+        expires_at = self._memory_store(key, endpoint, text)
+        if expires_at is not None and self._disk is not None:
+            self._disk_put(key, endpoint, text, expires_at)
+
+    def _memory_store(self, key: str, endpoint: str, text: str) -> Optional[float]:
+        """Store a response in memory, returning its expiry (None if the endpoint isn't cached)"""
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0 or not text:
+            return None
+
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory_put(key, text, expires_at)
+            self.stores += 1
+        return expires_at
+
+    def _disk_put(self, key: str, endpoint: str, text: str, expires_at: float) -> None:
+        now = time.time()
+        try:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, endpoint, response, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, endpoint, text, expires_at, now)
+                )
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= 100:
+                    self._prune_disk(now)
+                self._disk.commit()
+        except Exception as e:
+            logger.warning(f"LLM response cache disk write failed: {e}")
+
+    def _memory_put(self, key: str, text: str, expires_at: float) -> None:
+        self._memory[key] = (text, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now: float) -> None:
+        """Drop expired responses and the least recently used ones over the disk bound"""
+        self._puts_since_prune = 0
+        self._disk.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,))
+        self._disk.execute("""
+            DELETE FROM llm_responses WHERE key IN (
+                SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.disk_max_entries,))
+
+    async def generate(self, model: Any, prompt: str, endpoint: str,
+                       call: Callable[[], Awaitable[Any]], bypass: bool = False) -> Optional[str]:
+        """
+        Return the cached response for a prompt, or make the model call and cache it
+
+        Args:
+            model: Gemini model the prompt is sent to
+            prompt: Rendered prompt
+            endpoint: Endpoint the call is made for (selects the TTL)
+            call: Coroutine function making the model call and returning its response
+            bypass: Make the call even if a response is cached, replacing it
+
+        Returns:
+            Response text (None if the model returned no text)
+        """
+        key = self.make_key(*describe_model(model), prompt)
+        text, found = self._memory_get(key, endpoint, bypass)
+        if not found:
+            # SQLite I/O stays off the event loop
+            text = await asyncio.to_thread(self._disk_get, key, endpoint)
+        if text is not None:
+            return text
+
+        response = await call()
+        text = response.text if response else None
+        if text:
+            expires_at = self._memory_store(key, endpoint, text)
+            if expires_at is not None and self._disk is not None:
+                await asyncio.to_thread(self._disk_put, key, endpoint, text, expires_at)
+        return text
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        disk_entries = 0
+        if self._disk is not None:
+            try:
+                with self._disk_lock:
+                    disk_entries = self._disk.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            except Exception:
+                pass
+
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'bypassed': self.bypassed,
+                'stores': self.stores,
+                'expired': self.expired,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk_entries,
+                'disk_path': self.disk_path,
+                'endpoints': {endpoint: dict(stats) for endpoint, stats in self._endpoint_stats.items()}
+            }
+
+async def generate_text(model: Any, prompt: str, call: Callable[[], Awaitable[Any]],
+                        cache: Optional[LLMResponseCache] = None, endpoint: str = "default",
+                        bypass: bool = False) -> Optional[str]:
+    """
+    Make a model call through the response cache when one is configured
+
+    Args:
+        model: Gemini model the prompt is sent to
+        prompt: Rendered prompt
+        call: Coroutine function making the model call and returning its response
+        cache: Response cache (optional)
+        endpoint: Endpoint the call is made for
+        bypass: Make the call even if a response is cached, replacing it
+
+    Returns:
+        Response text (None if the model returned no text)
+    """
+    if cache is not None:
+        return await cache.generate(model, prompt, endpoint, call, bypass=bypass)
+    response = await call()
+    return response.text if response else None
@@ -0,0 +1,186 @@
+"""
+LLM Executor for PrepVista
+Runs blocking AI model calls on a shared, bounded pool with priorities and timeouts
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+class LLMQueueFullError(Exception):
+    """Raised when the wait queue is at capacity"""
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call does not finish within its timeout"""
+
+class LLMExecutor:
+    def __init__(self, max_concurrency: int = 4, max_queue_size: int = 100):
+        """
+        Initialize LLM executor
+
+        Args:
+            max_concurrency: Maximum number of model calls running at once
+            max_queue_size: Maximum number of calls waiting for a free slot
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+
+        # Heap of (priority, sequence, future); futures are resolved when a slot is granted
+        self._waiters: List[Any] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled_in_queue = 0
+        self.rejected = 0
+        self._total_wait_time = 0.0
+        self._started = 0
+        logger.info(f"Initialized LLMExecutor (max_concurrency={max_concurrency}, max_queue_size={max_queue_size})")
+
+    def _queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    async def _acquire(self, priority: int, deadline: Optional[float]) -> None:
+        """Wait for a free slot, honouring priority order and the deadline"""
+        loop = asyncio.get_running_loop()
+
+        if self._in_flight < self.max_concurrency and not self._queue_depth():
+            self._in_flight += 1
+            return
+
+        if self._queue_depth() >= self.max_queue_size:
+            self.rejected += 1
+            raise LLMQueueFullError("LLM queue is full. Please try again later.")
+
+        waiter = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+        try:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we gave up; hand it on
+                self._release()
+            else:
+                waiter.cancel()
+                self.cancelled_in_queue += 1
+            raise
+
+    def _release(self) -> None:
+        """Free a slot and grant it to the highest-priority live waiter"""
+        self._in_flight -= 1
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(True)
+                break
+
+    async def start(self, fn: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE,
+                    queue_timeout: Optional[float] = None) -> "asyncio.Future":
+        """
+        Wait for a slot and start a blocking call on the pool
+
+        The slot stays taken until the call really returns, so the number of
+        running model calls never exceeds max_concurrency.
+
+        Args:
+            fn: Blocking callable to run
+            priority: Scheduling priority (PRIORITY_INTERACTIVE or PRIORITY_BULK)
+            queue_timeout: Maximum time to wait for a slot, in seconds
+
+        Returns:
+            Future resolving to the callable's result
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if queue_timeout is None else loop.time() + queue_timeout
+        self.submitted += 1
+
+        enqueued_at = time.monotonic()
+        try:
+            await self._acquire(priority, deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMTimeoutError(f"LLM call exceeded timeout of {queue_timeout}s while queued")
+
+        self._started += 1
+        self._total_wait_time += time.monotonic() - enqueued_at
+
+        future = loop.run_in_executor(self._pool, fn)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: "asyncio.Future") -> None:
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._release()
+
+    async def run(self, fn: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE,
+                  timeout: Optional[float] = None) -> Any:
+        """
+        Run a blocking call under the concurrency cap
+
+        The timeout covers both queueing and execution. A call that times out
+        while queued never starts.
+
+        Args:
+            fn: Blocking callable to run
+            priority: Scheduling priority (PRIORITY_INTERACTIVE or PRIORITY_BULK)
+            timeout: Overall timeout in seconds
+
+        Returns:
+            The callable's result
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        future = await self.start(fn, priority=priority, queue_timeout=timeout)
+        remaining = None if deadline is None else max(deadline - loop.time(), 0)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMTimeoutError(f"LLM call exceeded timeout of {timeout}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get executor metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue_size': self.max_queue_size,
+            'in_flight': self._in_flight,
+            'queue_depth': self._queue_depth(),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'cancelled_in_queue': self.cancelled_in_queue,
+            'rejected': self.rejected,
+            'avg_queue_wait_ms': (self._total_wait_time / self._started * 1000) if self._started else 0.0
+        }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release pool threads"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
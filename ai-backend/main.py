@@ -1,8 +1,8 @@
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Awaitable, Callable
 import os
 from dotenv import load_dotenv
 import json
@@ -11,18 +11,25 @@ import traceback
 import time
 import asyncio
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import yaml
 from pathlib import Path
 import tempfile
-import shutil
 import uuid
 
 # Import RAG services
 from pdf_processor import PDFProcessor
-from embedding_service import EmbeddingService
+from embedding_service import EmbeddingService, OfflineEmbeddingService
 from vector_storage import VectorStorageService
 from rag_service import RAGService
+from semantic_cache import SemanticAnswerCache
+from retrieval_cache import RetrievalCache
+from llm_executor import LLMExecutor, PRIORITY_BULK
+from context_packer import ContextPacker
+from deadline import Deadline
+from llm_cache import LLMResponseCache, generate_text, set_cache_bypass, reset_cache_bypass
+from pdf_artifact_cache import PDFArtifactCache, copy_and_hash
+from ingestion_jobs import IngestionJobQueue, IngestionQueueFullError, JOB_QUEUED
+from ingest_pipeline import IngestPipeline
 
 # Configure logging
 logging.basicConfig(
@@ -38,6 +45,104 @@ load_dotenv()
 AI_TIMEOUT = 30.0  # 30 seconds timeout for AI calls
 AI_ENABLED = True  # Can be disabled via environment variable
 
+# Shared executor for blocking AI model calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "100"))
+llm_executor = LLMExecutor(max_concurrency=LLM_MAX_CONCURRENCY, max_queue_size=LLM_MAX_QUEUE)
+
+# Opt-in cache of model responses keyed by model, generation config and prompt
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# Per-endpoint TTLs in seconds, e.g. "rag_query=600,basic_question_generation=86400"
+LLM_CACHE_TTLS = {
+    endpoint.strip(): float(ttl)
+    for endpoint, ttl in (
+        item.split("=", 1) for item in os.getenv("LLM_CACHE_TTLS", "").split(",") if "=" in item
+    )
+}
+LLM_CACHE_BYPASS_HEADER = "X-LLM-Cache-Bypass"
+
+llm_response_cache = LLMResponseCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    disk_path=LLM_CACHE_PATH or None,
+    disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES,
+    default_ttl=LLM_CACHE_TTL,
+    endpoint_ttls=LLM_CACHE_TTLS
+) if LLM_CACHE_ENABLED else None
+
+# Token budgets for prompt context
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+AGENT_DOCUMENT_TOKEN_BUDGET = int(os.getenv("AGENT_DOCUMENT_TOKEN_BUDGET", "500"))
+
+# PDF page extraction worker processes (0 uses one per CPU core)
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", "0"))
+
+# Page text extractor: auto (PyPDF2, pdfplumber for complex pages), pypdf2 or pdfplumber
+PDF_PAGE_ENGINE = os.getenv("PDF_PAGE_ENGINE", "auto")
+
+# Pages searched for repeated headers/footers and the share of them a line must appear on (window 0 disables)
+PDF_BOILERPLATE_WINDOW = int(os.getenv("PDF_BOILERPLATE_WINDOW", "24"))
+PDF_BOILERPLATE_MIN_FRACTION = float(os.getenv("PDF_BOILERPLATE_MIN_FRACTION", "0.6"))
+
+# Chunks at least this similar (shingle Jaccard) to an earlier chunk of the same PDF are dropped (0 disables)
+PDF_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("PDF_NEAR_DUPLICATE_THRESHOLD", "0.9"))
+
+# Processed results of uploaded PDFs, reused when the same bytes are uploaded again
+PDF_ARTIFACT_CACHE_ENABLED = os.getenv("PDF_ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+PDF_ARTIFACT_CACHE_DIR = os.getenv("PDF_ARTIFACT_CACHE_DIR", str(Path(tempfile.gettempdir()) / "prepvt_pdf_artifacts"))
+PDF_ARTIFACT_CACHE_MAX_MB = int(os.getenv("PDF_ARTIFACT_CACHE_MAX_MB", "512"))
+
+# Background ingestion: uploads processed at once, waiting uploads before rejecting, finished jobs kept for polling
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+INGEST_MAX_QUEUE = int(os.getenv("INGEST_MAX_QUEUE", "16"))
+INGEST_MAX_FINISHED_JOBS = int(os.getenv("INGEST_MAX_FINISHED_JOBS", "256"))
+INGEST_RESULT_TTL = float(os.getenv("INGEST_RESULT_TTL", "600"))
+ingestion_queue = IngestionJobQueue(
+    max_workers=INGEST_MAX_WORKERS,
+    max_queue_size=INGEST_MAX_QUEUE,
+    max_finished_jobs=INGEST_MAX_FINISHED_JOBS,
+    result_ttl=INGEST_RESULT_TTL
+)
+
+# Server-side ingest (upload-pdf with mode=server): chunks per embedding call and storage
+# transaction, and batches buffered between pipeline stages
+INGEST_PIPELINE_BATCH_SIZE = int(os.getenv("INGEST_PIPELINE_BATCH_SIZE", "100"))
+INGEST_PIPELINE_QUEUE_SIZE = int(os.getenv("INGEST_PIPELINE_QUEUE_SIZE", "4"))
+
+# End-to-end time budget for a RAG query; stages share what is left of it
+RAG_REQUEST_TIMEOUT = float(os.getenv("RAG_REQUEST_TIMEOUT", "30"))
+
+# Largest number of questions accepted by /api/rag/query/batch
+RAG_BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "32"))
+
+# Diversity reranking of retrieved chunks (lambda 1.0 disables it)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_MMR_CANDIDATES = int(os.getenv("RAG_MMR_CANDIDATES", "4"))
+
+# Per-document fan-out for agent-wide retrieval (quota 0 keeps a single global search)
+RAG_FANOUT_PER_DOCUMENT = int(os.getenv("RAG_FANOUT_PER_DOCUMENT", "0"))
+RAG_FANOUT_MAX_SHARDS = int(os.getenv("RAG_FANOUT_MAX_SHARDS", "8"))
+
+# Retrieval result cache for /api/rag/search and /api/rag/query
+RAG_RETRIEVAL_CACHE_ENABLED = os.getenv("RAG_RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RAG_RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RAG_RETRIEVAL_CACHE_MAX_ENTRIES", "1024"))
+RAG_RETRIEVAL_CACHE_MAX_MB = int(os.getenv("RAG_RETRIEVAL_CACHE_MAX_MB", "64"))
+
+# Embedding backend ("google" or "offline" for local development) and query micro-batching
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google").lower()
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_API_ENDPOINT = os.getenv("EMBEDDING_API_ENDPOINT") or None
+
+# Semantic answer cache for RAG queries
+RAG_ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE_ENABLED", "true").lower() == "true"
+RAG_ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("RAG_ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+RAG_ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+RAG_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "256"))
+
 # Session storage removed - focusing on question generation only
 
 # AI Model (will be initialized lazily)
@@ -49,9 +154,14 @@ prompts = None
 
 # RAG Services (will be initialized lazily)
 pdf_processor = None
+pdf_artifact_cache = None
+context_packer = None
 embedding_service = None
 vector_storage = None
 rag_service = None
+ingest_pipeline = None
+answer_cache = None
+retrieval_cache = None
 rag_initialized = False
 
 def load_prompts():
@@ -77,25 +187,58 @@ def get_prompt(prompt_key: str, **kwargs) -> str:
     template = prompts[prompt_key]["template"]
     return template.format(**kwargs)
 
+def request_deadline(timeout_ms: Optional[int] = None) -> Deadline:
+    """Start a request deadline from a client timeout, capped at RAG_REQUEST_TIMEOUT"""
+    if timeout_ms and timeout_ms > 0:
+        return Deadline(min(timeout_ms / 1000, RAG_REQUEST_TIMEOUT))
+    return Deadline(RAG_REQUEST_TIMEOUT)
+
 async def initialize_rag_services():
     """Initialize RAG services"""
-    global pdf_processor, embedding_service, vector_storage, rag_service, rag_initialized
+    global pdf_processor, pdf_artifact_cache, context_packer, embedding_service, vector_storage, rag_service, ingest_pipeline, answer_cache, retrieval_cache, rag_initialized
     
     try:
         logger.info("Initializing RAG services...")
         
         # Initialize PDF processor
-        pdf_processor = PDFProcessor(chunk_size=1000, chunk_overlap=200)
+        pdf_processor = PDFProcessor(chunk_size=1000, chunk_overlap=200,
+                                     extraction_workers=PDF_EXTRACTION_WORKERS or None,
+                                     boilerplate_window=PDF_BOILERPLATE_WINDOW,
+                                     boilerplate_min_fraction=PDF_BOILERPLATE_MIN_FRACTION,
+                                     page_engine=PDF_PAGE_ENGINE,
+                                     near_duplicate_threshold=PDF_NEAR_DUPLICATE_THRESHOLD)
         logger.info("PDF processor initialized")
         
+        # Initialize processed PDF cache
+        if PDF_ARTIFACT_CACHE_ENABLED:
+            pdf_artifact_cache = PDFArtifactCache(
+                cache_dir=PDF_ARTIFACT_CACHE_DIR,
+                max_bytes=PDF_ARTIFACT_CACHE_MAX_MB * 1024 * 1024,
+                signature=pdf_processor.signature()
+            )
+        
+        # Initialize context packer
+        context_packer = ContextPacker(token_budget=RAG_CONTEXT_TOKEN_BUDGET)
+        logger.info("Context packer initialized")
+        
         # Initialize embedding service
         google_api_key = os.getenv("GOOGLE_API_KEY")
-        if not google_api_key:
+        if EMBEDDING_BACKEND == "offline":
+            embedding_service = OfflineEmbeddingService(
+                batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=EMBEDDING_MAX_BATCH
+            )
+        elif not google_api_key:
             logger.warning("No GOOGLE_API_KEY found, RAG services will be limited")
             rag_initialized = False
             return
-        
-        embedding_service = EmbeddingService(api_key=google_api_key)
+        else:
+            embedding_service = EmbeddingService(
+                api_key=google_api_key,
+                batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=EMBEDDING_MAX_BATCH,
+                api_endpoint=EMBEDDING_API_ENDPOINT
+            )
         logger.info("Embedding service initialized")
         
         # Initialize vector storage
@@ -106,8 +249,40 @@ async def initialize_rag_services():
         await vector_storage.create_vector_tables()
         logger.info("Vector storage service initialized")
         
+        # Initialize server-side ingest pipeline
+        ingest_pipeline = IngestPipeline(
+            embedding_service,
+            vector_storage,
+            batch_size=INGEST_PIPELINE_BATCH_SIZE,
+            queue_size=INGEST_PIPELINE_QUEUE_SIZE
+        )
+        
+        # Initialize semantic answer cache
+        if RAG_ANSWER_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(
+                max_distance=RAG_ANSWER_CACHE_MAX_DISTANCE,
+                ttl_seconds=RAG_ANSWER_CACHE_TTL,
+                max_entries_per_agent=RAG_ANSWER_CACHE_MAX_ENTRIES
+            )
+        
+        # Initialize retrieval result cache
+        if RAG_RETRIEVAL_CACHE_ENABLED:
+            retrieval_cache = RetrievalCache(
+                max_entries=RAG_RETRIEVAL_CACHE_MAX_ENTRIES,
+                max_bytes=RAG_RETRIEVAL_CACHE_MAX_MB * 1024 * 1024
+            )
+        
         # Initialize RAG service
-        rag_service = RAGService(embedding_service, vector_storage, ai_model)
+        rag_service = RAGService(embedding_service, vector_storage, ai_model,
+                                 answer_cache=answer_cache, llm_executor=llm_executor,
+                                 context_packer=context_packer,
+                                 mmr_lambda=RAG_MMR_LAMBDA,
+                                 mmr_candidate_multiplier=RAG_MMR_CANDIDATES,
+                                 retrieval_cache=retrieval_cache,
+                                 request_timeout=RAG_REQUEST_TIMEOUT,
+                                 fanout_per_document=RAG_FANOUT_PER_DOCUMENT,
+                                 fanout_max_shards=RAG_FANOUT_MAX_SHARDS,
+                                 response_cache=llm_response_cache)
         logger.info("RAG service initialized")
         
         # Test embedding service
@@ -174,6 +349,17 @@ class PDFUploadResponse(BaseModel):
     chunks_created: Optional[int] = None
     processing_time: Optional[float] = None
     chunks: Optional[List[dict]] = None
+    cached: bool = False
+    # Background uploads only
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+    # Incremental updates only
+    chunks_unchanged: Optional[int] = None
+    chunks_deleted: Optional[int] = None
+    # Incremental updates and server-side ingest
+    chunks_embedded: Optional[int] = None
+    # Server-side ingest only
+    embeddings_stored: Optional[int] = None
 
 class RAGQueryRequest(BaseModel):
     query: str
@@ -181,6 +367,7 @@ class RAGQueryRequest(BaseModel):
     document_id: Optional[str] = None
     max_context_chunks: int = 5
     include_sources: bool = True
+    timeout_ms: Optional[int] = None
 
 class RAGQueryResponse(BaseModel):
     answer: str
@@ -188,6 +375,34 @@ class RAGQueryResponse(BaseModel):
     context_used: bool
     context_chunks_count: int
     similarity_scores: Optional[List[float]] = None
+    degraded: bool = False
+    timed_out_stage: Optional[str] = None
+
+class BatchRAGQueryRequest(BaseModel):
+    queries: List[str]
+    agent_id: str
+    document_id: Optional[str] = None
+    max_context_chunks: int = 5
+    include_sources: bool = True
+    timeout_ms: Optional[int] = None
+    stream: bool = False
+
+class BatchRAGQueryResult(BaseModel):
+    index: int
+    query: str
+    answer: str
+    source_ids: List[str]
+    context_used: bool
+    context_chunks_count: int
+    similarity_scores: Optional[List[float]] = None
+    cached: bool = False
+    degraded: bool = False
+    timed_out_stage: Optional[str] = None
+
+class BatchRAGQueryResponse(BaseModel):
+    results: List[BatchRAGQueryResult]
+    sources: List[Dict[str, Any]]
+    total_queries: int
 
 class DocumentSearchRequest(BaseModel):
     query: str
@@ -249,17 +464,12 @@ async def initialize_ai_model():
         logger.info(f"Initializing {model_name}...")
         
         # Test initialization with timeout
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(lambda: genai.GenerativeModel(model_name))
-            ai_model = await loop.run_in_executor(None, lambda: future.result(timeout=5.0))
+        ai_model = await llm_executor.run(lambda: genai.GenerativeModel(model_name), timeout=5.0)
         
         logger.info(f"AI model object created: {ai_model}")
         
         # Quick test with timeout
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(lambda: ai_model.generate_content("Hello"))
-            test_response = await loop.run_in_executor(None, lambda: future.result(timeout=30.0))
+        test_response = await llm_executor.run(lambda: ai_model.generate_content("Hello"), timeout=30.0)
             
         logger.info(f"Test response: {test_response}")
         logger.info(f"Test response text: {test_response.text if test_response.text else 'None'}")
@@ -301,22 +511,30 @@ async def generate_ai_questions(request: QuestionRequest) -> List[Question]:
             
             logger.info(f"Sending prompt to AI: {prompt[:200]}...")
             
-            # Execute AI call with timeout
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor() as executor:
-                future = executor.submit(lambda: ai_model.generate_content(prompt))
-                response = await loop.run_in_executor(None, lambda: future.result(timeout=AI_TIMEOUT))
+            # Execute AI call with timeout on the shared executor; retries replace the cached response
+            response_text = await generate_text(
+                ai_model,
+                prompt,
+                lambda: llm_executor.run(
+                    lambda: ai_model.generate_content(prompt),
+                    priority=PRIORITY_BULK,
+                    timeout=AI_TIMEOUT
+                ),
+                cache=llm_response_cache,
+                endpoint="basic_question_generation",
+                bypass=attempt > 0
+            )
             
-            logger.info(f"AI response received: {response.text[:200] if response.text else 'No text'}...")
+            logger.info(f"AI response received: {response_text[:200] if response_text else 'No text'}...")
             
-            if not response.text:
+            if not response_text:
                 logger.error("AI response has no text content")
                 continue  # Try again
             
             # Parse response
             try:
                 # Clean response
-                text = response.text.strip()
+                text = response_text.strip()
                 if text.startswith("```json"):
                     text = text[7:]
                 if text.endswith("```"):
@@ -355,7 +573,7 @@ async def generate_ai_questions(request: QuestionRequest) -> List[Question]:
                             
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse AI response as JSON: {e}")
-                logger.error(f"Raw response text: {response.text}")
+                logger.error(f"Raw response text: {response_text}")
                 continue  # Try again
                 
         except Exception as e:
@@ -390,38 +608,37 @@ async def generate_ai_questions(request: QuestionRequest) -> List[Question]:
     logger.error("All retry attempts failed")
     raise Exception("AI service temporarily unavailable. Please try again later.")
 
-async def generate_ai_agent_questions(request: AIQuestionRequest) -> List[AIQuestion]:
+async def generate_ai_agent_questions(request: AIQuestionRequest,
+                                      rag_context_data: Optional[Dict[str, Any]] = None) -> List[AIQuestion]:
     """Generate questions for AI agents based on document content with RAG context"""
     if not ai_model or not ai_initialized:
         logger.error("AI model not available or not initialized")
         raise Exception("AI model not available")
     
+    # Retrieve RAG context once (no answer generation) and reuse it across retries;
+    # callers that already tried pass their result, even an unused one
+    if rag_context_data is None and rag_initialized and rag_service:
+        try:
+            rag_context_data = await rag_service.build_context(
+                query=f"Generate questions about {request.subject}",
+                agent_id=request.agent_id,
+                max_context_chunks=3
+            )
+        except Exception as e:
+            logger.warning(f"Failed to get RAG context: {e}, using provided document content")
+    
+    rag_context = ""
+    if rag_context_data and rag_context_data.get('context_used', False):
+        rag_context = f"\n\nRELEVANT CONTEXT FROM UPLOADED DOCUMENTS:\n{rag_context_data.get('context_text', '')}"
+        logger.info(f"Using RAG context for question generation: {len(rag_context)} characters")
+    else:
+        logger.info("No relevant RAG context found, using provided document content")
+    
     max_retries = 2
     for attempt in range(max_retries):
         try:
             logger.info(f"Attempt {attempt + 1}/{max_retries} to generate AI agent questions")
             
-            # Try to get RAG context if available
-            rag_context = ""
-            if rag_initialized and rag_service:
-                try:
-                    # Use the document content as a query to get relevant context
-                    rag_response = await rag_service.generate_contextual_response(
-                        query=f"Generate questions about {request.subject}",
-                        agent_id=request.agent_id,
-                        max_context_chunks=3,
-                        include_sources=False
-                    )
-                    
-                    if rag_response.get('context_used', False):
-                        rag_context = f"\n\nRELEVANT CONTEXT FROM UPLOADED DOCUMENTS:\n{rag_response.get('context_text', '')}"
-                        logger.info(f"Using RAG context for question generation: {len(rag_context)} characters")
-                    else:
-                        logger.info("No relevant RAG context found, using provided document content")
-                        
-                except Exception as e:
-                    logger.warning(f"Failed to get RAG context: {e}, using provided document content")
-            
             # Create a comprehensive prompt for different question types
             question_type_instructions = []
             for q_type in request.question_types:
@@ -430,8 +647,12 @@ async def generate_ai_agent_questions(request: AIQuestionRequest) -> List[AIQues
                 else:
                     question_type_instructions.append(f"{q_type} questions")
             
-            # Combine document content with RAG context
-            full_document_content = request.document_content[:2000] + rag_context
+            # Combine token-budgeted document content with RAG context
+            if context_packer:
+                document_content = context_packer.truncate_to_tokens(request.document_content, AGENT_DOCUMENT_TOKEN_BUDGET)
+            else:
+                document_content = request.document_content[:AGENT_DOCUMENT_TOKEN_BUDGET * 4]  # ~4 chars per token
+            full_document_content = document_content + rag_context
             
             prompt = get_prompt(
                 "ai_agent_question_generation",
@@ -444,22 +665,30 @@ async def generate_ai_agent_questions(request: AIQuestionRequest) -> List[AIQues
             
             logger.info(f"Sending AI agent prompt to AI: {prompt[:200]}...")
             
-            # Execute AI call with timeout
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor() as executor:
-                future = executor.submit(lambda: ai_model.generate_content(prompt))
-                response = await loop.run_in_executor(None, lambda: future.result(timeout=AI_TIMEOUT))
+            # Execute AI call with timeout on the shared executor; retries replace the cached response
+            response_text = await generate_text(
+                ai_model,
+                prompt,
+                lambda: llm_executor.run(
+                    lambda: ai_model.generate_content(prompt),
+                    priority=PRIORITY_BULK,
+                    timeout=AI_TIMEOUT
+                ),
+                cache=llm_response_cache,
+                endpoint="ai_agent_question_generation",
+                bypass=attempt > 0
+            )
             
-            logger.info(f"AI response received: {response.text[:200] if response.text else 'No text'}...")
+            logger.info(f"AI response received: {response_text[:200] if response_text else 'No text'}...")
             
-            if not response.text:
+            if not response_text:
                 logger.error("AI response has no text content")
                 continue  # Try again
             
             # Parse response
             try:
                 # Clean response
-                text = response.text.strip()
+                text = response_text.strip()
                 if text.startswith("```json"):
                     text = text[7:]
                 if text.endswith("```"):
@@ -503,7 +732,7 @@ async def generate_ai_agent_questions(request: AIQuestionRequest) -> List[AIQues
                             
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse AI response as JSON: {e}")
-                logger.error(f"Raw response text: {response.text}")
+                logger.error(f"Raw response text: {response_text}")
                 continue  # Try again
                 
         except Exception as e:
@@ -587,12 +816,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def llm_cache_bypass(request: Request, call_next):
+    """Let clients skip cached model responses with the X-LLM-Cache-Bypass header"""
+    bypass = request.headers.get(LLM_CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+    token = set_cache_bypass(bypass)
+    try:
+        return await call_next(request)
+    finally:
+        reset_cache_bypass(token)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize AI model, RAG services, and load prompts on startup"""
     load_prompts()
     await initialize_ai_model()
     await initialize_rag_services()
+    
+    # Summarise documents ingested before summaries were stored, once, off the request path
+    if rag_initialized:
+        job_id = ingestion_queue.submit(rag_service.backfill_document_summaries,
+                                        description={'task': 'summary_backfill'})
+        logger.info(f"Queued document summary backfill as job {job_id}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop ingestion workers and PDF extraction worker processes"""
+    await ingestion_queue.shutdown()
+    if pdf_processor:
+        pdf_processor.shutdown()
 
 @app.get("/debug")
 async def debug_info():
@@ -679,65 +931,212 @@ async def generate_rag_enhanced_questions(request: AIQuestionRequest):
     logger.info(f"Generating {request.question_count} RAG-enhanced questions for AI agent {request.agent_id}")
     
     try:
-        # Get RAG context for the subject
-        rag_response = await rag_service.generate_contextual_response(
+        # Get RAG context for the subject without generating an answer
+        rag_context_data = await rag_service.build_context(
             query=f"Generate comprehensive questions about {request.subject} for {request.difficulty} level",
             agent_id=request.agent_id,
-            max_context_chunks=5,
-            include_sources=False
+            max_context_chunks=5
         )
         
-        if not rag_response.get('context_used', False):
-            # Fallback to regular question generation if no RAG context
-            logger.warning("No RAG context available, falling back to regular question generation")
-            questions = await generate_ai_agent_questions(request)
-            return questions
+        if not rag_context_data.get('context_used', False):
+            # Without RAG context this is regular question generation from the provided content
+            logger.warning("No RAG context available, generating from provided document content")
+    
+    except Exception as e:
+        # Fall back to regular question generation from the provided content; an
+        # empty context (rather than None) keeps the generator from retrieving again
+        logger.error(f"RAG context retrieval failed, generating without it: {e}")
+        rag_context_data = {'context_used': False}
+    
+    try:
+        # Generate questions with the retrieved context; the generator already retries
+        questions = await generate_ai_agent_questions(request, rag_context_data=rag_context_data)
+    except Exception as e:
+        logger.error(f"RAG-enhanced question generation failed: {e}")
+        raise HTTPException(status_code=503, detail=f"Question generation failed: {str(e)}")
+    
+    context_chunks = rag_context_data.get('context_chunks_count', 0) if rag_context_data else 0
+    logger.info(f"Generated {len(questions)} RAG-enhanced questions using {context_chunks} context chunks")
+    return questions
+
+def save_upload(source, file_path: Path) -> str:
+    """Write an uploaded file to disk, returning the SHA-256 of its bytes"""
+    with open(file_path, "wb") as buffer:
+        return copy_and_hash(source, buffer)
+
+async def ingest_pdf(file_path: Path, file_hash: str, agent_id: str, document_id: str, mode: str,
+                     progress: Dict[str, Any],
+                     run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread) -> Dict[str, Any]:
+    """
+    Process a saved PDF upload and, in incremental mode, update the stored document
+    
+    Blocking work runs through run_blocking so the event loop stays free. The
+    uploaded file is removed afterwards.
+    
+    Args:
+        file_path: Path of the saved upload
+        file_hash: SHA-256 of the upload
+        agent_id: AI Agent ID
+        document_id: Document ID
+        mode: "full" or "incremental"
+        progress: Dictionary updated with pages_extracted, chunks_created and embeddings_stored
+        run_blocking: Runs a blocking function off the event loop (background jobs
+            pass the ingestion queue's, so they do not hold up synchronous uploads)
         
-        # Create enhanced request with RAG context
-        enhanced_request = AIQuestionRequest(
-            agent_id=request.agent_id,
-            subject=request.subject,
-            question_types=request.question_types,
-            question_count=request.question_count,
-            difficulty=request.difficulty,
-            document_content=rag_response.get('context_text', request.document_content)
-        )
+    Returns:
+        Dictionary with document_id, chunks, cached, metadata and (incremental mode) update counts
+    """
+    try:
+        progress.setdefault('embeddings_stored', 0)
         
-        # Generate questions with RAG context
-        questions = await generate_ai_agent_questions(enhanced_request)
+        # Reuse the result of an earlier upload of the same bytes
+        processing_result = None
+        if pdf_artifact_cache:
+            processing_result = await run_blocking(
+                pdf_artifact_cache.get, file_hash, agent_id, document_id, file_path.name
+            )
+        cached = processing_result is not None
         
-        # Add RAG metadata to questions
-        for question in questions:
-            if hasattr(question, 'metadata'):
-                question.metadata = {
-                    'rag_enhanced': True,
-                    'context_chunks_used': rag_response.get('context_chunks_count', 0),
-                    'similarity_scores': rag_response.get('similarity_scores', [])
-                }
+        if cached:
+            logger.info(f"Reusing processed PDF {file_hash[:12]} for document {document_id} (agent {agent_id})")
+            progress.update({
+                'total_pages': processing_result['metadata']['total_pages'],
+                'pages_extracted': processing_result['metadata']['total_pages']
+            })
+        else:
+            processing_result = await run_blocking(
+                pdf_processor.process_pdf, str(file_path), agent_id, document_id, progress
+            )
+            if not processing_result['success']:
+                raise RuntimeError(f"PDF processing failed: {processing_result['error']}")
+            
+            if pdf_artifact_cache:
+                await run_blocking(pdf_artifact_cache.put, file_hash, processing_result)
         
-        logger.info(f"Generated {len(questions)} RAG-enhanced questions")
-        return questions
+        chunks = processing_result['chunks']
+        progress['chunks_created'] = len(chunks)
+        result = {
+            'document_id': document_id,
+            'chunks': chunks,
+            'cached': cached,
+            'metadata': processing_result['metadata']
+        }
         
-    except Exception as e:
-        logger.error(f"RAG-enhanced question generation failed: {e}")
-        # Fallback to regular question generation
-        questions = await generate_ai_agent_questions(request)
-        return questions
+        if mode == "incremental":
+            update = await rag_service.update_document_chunks(document_id, agent_id, chunks)
+            if not update['success']:
+                raise RuntimeError(f"Incremental update failed: {update['error']}")
+            progress['embeddings_stored'] = update['chunks_embedded']
+            result['update'] = update
+        
+        return result
+    finally:
+        file_path.unlink(missing_ok=True)
+
+async def ingest_pdf_server(file_path: Path, file_hash: str, agent_id: str, document_id: str,
+                            original_name: str, progress: Dict[str, Any],
+                            run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread) -> Dict[str, Any]:
+    """
+    Ingest a saved PDF upload entirely on the server
+    
+    The document record is created here, and chunks stream through the ingest
+    pipeline (extraction, batched embedding, bulk storage) instead of being sent
+    back to the client. The uploaded file is removed afterwards.
+    
+    Args:
+        file_path: Path of the saved upload
+        file_hash: SHA-256 of the upload
+        agent_id: AI Agent ID
+        document_id: Document ID (an existing document is replaced)
+        original_name: Uploaded file name
+        progress: Dictionary updated with pages_extracted, chunks_created and embeddings_stored
+        run_blocking: Runs a blocking function off the event loop
+        
+    Returns:
+        Dictionary with document_id, cached, total_pages, the chunk and embedding
+        counts and the time spent in each pipeline stage
+    """
+    try:
+        file_size = file_path.stat().st_size
+        if not await vector_storage.begin_document_ingest(document_id, agent_id, original_name, file_size):
+            raise RuntimeError(f"Failed to create document {document_id}; it may belong to another agent")
+        
+        # Chunks of an earlier upload of the same bytes skip extraction
+        processing_result = None
+        if pdf_artifact_cache:
+            processing_result = await run_blocking(
+                pdf_artifact_cache.get, file_hash, agent_id, document_id, file_path.name
+            )
+        
+        if processing_result is not None:
+            logger.info(f"Reusing processed PDF {file_hash[:12]} for document {document_id} (agent {agent_id})")
+            chunks = processing_result['chunks']
+            progress.update({
+                'total_pages': processing_result['metadata']['total_pages'],
+                'pages_extracted': processing_result['metadata']['total_pages'],
+                'chunks_created': len(chunks)
+            })
+        else:
+            chunks = pdf_processor.iter_pdf_chunks(str(file_path), agent_id, document_id, progress)
+        
+        success = False
+        try:
+            pipeline_result = await ingest_pipeline.ingest(chunks, document_id, progress, run_blocking)
+            success = True
+        finally:
+            await vector_storage.finish_document_ingest(document_id, agent_id, success)
+        
+        await rag_service.refresh_document_summaries(documents=[{'document_id': document_id, 'agent_id': agent_id}])
+        
+        return {
+            'document_id': document_id,
+            'cached': processing_result is not None,
+            'total_pages': progress.get('total_pages'),
+            'chunks_created': progress.get('chunks_created', 0),
+            **pipeline_result
+        }
+    finally:
+        file_path.unlink(missing_ok=True)
 
 # RAG Endpoints
 @app.post("/api/rag/upload-pdf", response_model=PDFUploadResponse)
 async def upload_pdf(
     file: UploadFile = File(...),
     agent_id: str = Form(...),
-    document_id: Optional[str] = Form(None)
+    document_id: Optional[str] = Form(None),
+    mode: str = Form("full"),
+    background: bool = Form(False)
 ):
-    """Upload and process a PDF file for RAG"""
+    """Upload and process a PDF file for RAG
+    
+    With mode=incremental the PDF is a new version of an existing document:
+    only its new or changed chunks are embedded and stored, and chunks that
+    are gone are deleted. With mode=server the document, its chunks and their
+    embeddings are all stored here and only IDs and counts are returned, so
+    no chunks or vectors travel to the client and back. With background=true the upload is queued and a
+    job ID is returned at once; poll /api/rag/jobs/{job_id} for progress
+    and the result.
+    """
     if not rag_initialized:
         raise HTTPException(status_code=503, detail="RAG services not initialized")
     
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
+    if mode not in ("full", "incremental", "server"):
+        raise HTTPException(status_code=400, detail="mode must be 'full', 'incremental' or 'server'")
+    
+    if mode == "incremental" and not document_id:
+        raise HTTPException(status_code=400, detail="document_id is required for incremental updates")
+    
+    # An existing document may only be updated or replaced by the agent that owns it
+    if document_id and mode in ("incremental", "server"):
+        owner = await vector_storage.get_document_agent_id(document_id)
+        if owner is None and mode == "incremental":
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        if owner is not None and owner != agent_id:
+            raise HTTPException(status_code=403, detail=f"Document {document_id} belongs to another agent")
+    
     try:
         start_time = time.time()
         
@@ -750,27 +1149,73 @@ async def upload_pdf(
         file_extension = Path(file.filename).suffix
         unique_filename = f"{file_id}{file_extension}"
         file_path = uploads_dir / unique_filename
+        document_id = document_id or file_id
+        
+        # Save uploaded file off the event loop, hashing it on the way
+        file_hash = await asyncio.to_thread(save_upload, file.file, file_path)
         
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        def ingest(progress: Dict[str, Any], run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread):
+            if mode == "server":
+                return ingest_pdf_server(file_path, file_hash, agent_id, document_id, file.filename, progress,
+                                         run_blocking)
+            return ingest_pdf(file_path, file_hash, agent_id, document_id, mode, progress, run_blocking)
+        
+        if background:
+            try:
+                job_id = ingestion_queue.submit(
+                    lambda progress: ingest(progress, ingestion_queue.run_blocking),
+                    description={'file_name': file.filename, 'agent_id': agent_id,
+                                 'document_id': document_id, 'mode': mode}
+                )
+            except IngestionQueueFullError as e:
+                file_path.unlink(missing_ok=True)
+                raise HTTPException(status_code=503, detail=str(e))
+            
+            logger.info(f"Queued ingestion job {job_id} for {file.filename} (agent {agent_id})")
+            return PDFUploadResponse(
+                success=True,
+                document_id=document_id,
+                message=f"PDF queued for processing. Poll /api/rag/jobs/{job_id} for progress.",
+                job_id=job_id,
+                status=JOB_QUEUED
+            )
         
         logger.info(f"Processing PDF: {file.filename} for agent {agent_id}")
+        result = await ingest({})
         
-        # Process PDF
-        processing_result = pdf_processor.process_pdf(
-            pdf_path=str(file_path),
-            agent_id=agent_id,
-            document_id=document_id or file_id
-        )
+        if mode == "server":
+            return PDFUploadResponse(
+                success=True,
+                document_id=document_id,
+                message=(f"PDF ingested on the server. Stored {result['embeddings_stored']} chunks "
+                         f"with embeddings from {result['total_pages']} pages."),
+                chunks_created=result['chunks_created'],
+                processing_time=time.time() - start_time,
+                cached=result['cached'],
+                chunks_embedded=result['chunks_embedded'],
+                embeddings_stored=result['embeddings_stored']
+            )
         
-        if not processing_result['success']:
-            # Clean up uploaded file
-            file_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=500, detail=f"PDF processing failed: {processing_result['error']}")
+        chunks = result['chunks']
+        cached = result['cached']
+        
+        if mode == "incremental":
+            update = result['update']
+            return PDFUploadResponse(
+                success=True,
+                document_id=document_id,
+                message=(f"Document updated incrementally. {update['chunks_unchanged']} chunks unchanged, "
+                         f"{update['chunks_added']} added, {update['chunks_deleted']} deleted."),
+                chunks_created=update['chunks_added'],
+                processing_time=time.time() - start_time,
+                chunks=chunks,
+                cached=cached,
+                chunks_unchanged=update['chunks_unchanged'],
+                chunks_deleted=update['chunks_deleted'],
+                chunks_embedded=update['chunks_embedded']
+            )
         
         # Generate embeddings for chunks
-        chunks = processing_result['chunks']
         embeddings_data = []
         
         # Store document chunks in database first
@@ -792,22 +1237,30 @@ async def upload_pdf(
         
         processing_time = time.time() - start_time
         
-        # Clean up uploaded file
-        file_path.unlink(missing_ok=True)
-        
         return PDFUploadResponse(
             success=True,
-            document_id=document_id or file_id,
+            document_id=document_id,
             message=f"PDF processed successfully. Created {len(chunks)} chunks and stored {stored_count} embeddings.",
             chunks_created=len(chunks),
             processing_time=processing_time,
-            chunks=chunks
+            chunks=chunks,
+            cached=cached
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"PDF upload failed: {e}")
         raise HTTPException(status_code=500, detail=f"PDF upload failed: {str(e)}")
 
+@app.get("/api/rag/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Get the status, progress and (once finished) result of a background ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    return job
+
 @app.post("/api/rag/generate-embedding")
 async def generate_embedding(request: dict):
     """Generate embedding for a single text"""
@@ -843,10 +1296,17 @@ async def store_embeddings(request: dict):
         
         stored_count = await vector_storage.store_embeddings_batch(embeddings)
         
+        # Precompute summaries now so the stats endpoint stays a pure read
+        summaries_refreshed = 0
+        if stored_count and rag_service:
+            chunk_ids = [data['chunk_id'] for data in embeddings if isinstance(data, dict) and data.get('chunk_id')]
+            summaries_refreshed = await rag_service.refresh_document_summaries(chunk_ids=chunk_ids)
+        
         return {
             "success": True,
             "stored_count": stored_count,
-            "total_count": len(embeddings)
+            "total_count": len(embeddings),
+            "summaries_refreshed": summaries_refreshed
         }
     except Exception as e:
         logger.error(f"Embedding storage failed: {e}")
@@ -867,7 +1327,8 @@ async def rag_query(request: RAGQueryRequest):
             agent_id=request.agent_id,
             document_id=request.document_id,
             max_context_chunks=request.max_context_chunks,
-            include_sources=request.include_sources
+            include_sources=request.include_sources,
+            deadline=request_deadline(request.timeout_ms)
         )
         
         # Extract similarity scores from sources
@@ -878,13 +1339,125 @@ async def rag_query(request: RAGQueryRequest):
             sources=response.get('sources', []),
             context_used=response.get('context_used', False),
             context_chunks_count=response.get('context_chunks_count', 0),
-            similarity_scores=similarity_scores
+            similarity_scores=similarity_scores,
+            degraded=response.get('degraded', False),
+            timed_out_stage=response.get('timed_out_stage')
         )
         
     except Exception as e:
         logger.error(f"RAG query failed: {e}")
         raise HTTPException(status_code=500, detail=f"RAG query failed: {str(e)}")
 
+@app.post("/api/rag/query/stream")
+async def rag_query_stream(request: RAGQueryRequest):
+    """Query the RAG system, streaming sources first and then answer tokens as NDJSON"""
+    if not rag_initialized:
+        raise HTTPException(status_code=503, detail="RAG services not initialized")
+    
+    logger.info(f"Streaming RAG query for agent {request.agent_id}: {request.query[:100]}...")
+    
+    async def event_stream():
+        async for event in rag_service.generate_contextual_response_stream(
+            query=request.query,
+            agent_id=request.agent_id,
+            document_id=request.document_id,
+            max_context_chunks=request.max_context_chunks,
+            include_sources=request.include_sources,
+            deadline=request_deadline(request.timeout_ms)
+        ):
+            yield json.dumps(event, default=str) + "\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def batch_result(index: int, query: str, response: Dict[str, Any], shared_sources: Dict[str, Dict[str, Any]]) -> BatchRAGQueryResult:
+    """Build one batch result, moving its sources into the shared source map"""
+    source_ids = []
+    for source in response.get('sources', []):
+        source_id = source.get('chunk_id') or source.get('id')
+        source_ids.append(source_id)
+        if source_id not in shared_sources:
+            # Scores differ per question, so they stay with the result
+            shared_sources[source_id] = {key: value for key, value in source.items() if key != 'similarity_score'}
+    
+    return BatchRAGQueryResult(
+        index=index,
+        query=query,
+        answer=response['answer'],
+        source_ids=source_ids,
+        context_used=response.get('context_used', False),
+        context_chunks_count=response.get('context_chunks_count', 0),
+        similarity_scores=[source.get('similarity_score', 0.0) for source in response.get('sources', [])],
+        cached=response.get('cached', False),
+        degraded=response.get('degraded', False),
+        timed_out_stage=response.get('timed_out_stage')
+    )
+
+@app.post("/api/rag/query/batch", response_model=BatchRAGQueryResponse)
+async def rag_query_batch(request: BatchRAGQueryRequest):
+    """
+    Answer several questions for one agent with shared embedding and retrieval work
+    
+    Sources shared between answers are returned once and referenced by chunk ID.
+    With stream=true, results are sent as NDJSON lines as each answer completes,
+    each carrying only the sources not sent before.
+    """
+    if not rag_initialized:
+        raise HTTPException(status_code=503, detail="RAG services not initialized")
+    
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="At least one query is required")
+    if len(request.queries) > RAG_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {RAG_BATCH_MAX_QUERIES} queries are allowed per batch")
+    
+    logger.info(f"Batch RAG query for agent {request.agent_id}: {len(request.queries)} questions")
+    
+    def batch_responses():
+        return rag_service.iter_contextual_responses_batch(
+            queries=request.queries,
+            agent_id=request.agent_id,
+            document_id=request.document_id,
+            max_context_chunks=request.max_context_chunks,
+            include_sources=request.include_sources,
+            deadline=request_deadline(request.timeout_ms)
+        )
+    
+    if request.stream:
+        async def event_stream():
+            shared_sources: Dict[str, Dict[str, Any]] = {}
+            async for index, response in batch_responses():
+                sent = len(shared_sources)
+                result = batch_result(index, request.queries[index], response, shared_sources)
+                event = {'type': 'result', **result.model_dump(), 'sources': list(shared_sources.values())[sent:]}
+                yield json.dumps(event, default=str) + "\n"
+            yield json.dumps({'type': 'done', 'total_queries': len(request.queries),
+                              'unique_sources': len(shared_sources)}) + "\n"
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        results: List[Optional[BatchRAGQueryResult]] = [None] * len(request.queries)
+        shared_sources: Dict[str, Dict[str, Any]] = {}
+        async for index, response in batch_responses():
+            results[index] = batch_result(index, request.queries[index], response, shared_sources)
+        
+        return BatchRAGQueryResponse(
+            results=results,
+            sources=list(shared_sources.values()),
+            total_queries=len(request.queries)
+        )
+        
+    except Exception as e:
+        logger.error(f"Batch RAG query failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Batch RAG query failed: {str(e)}")
+
 @app.post("/api/rag/search", response_model=DocumentSearchResponse)
 async def search_documents(request: DocumentSearchRequest):
     """Search through uploaded documents"""
@@ -932,6 +1505,20 @@ async def get_rag_stats(agent_id: str):
         logger.error(f"Failed to get RAG stats: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get RAG stats: {str(e)}")
 
+@app.get("/api/rag/metrics")
+async def get_rag_metrics():
+    """Get RAG cache and LLM executor metrics"""
+    return {
+        "answer_cache": answer_cache.get_stats() if answer_cache else None,
+        "retrieval_cache": retrieval_cache.get_stats() if retrieval_cache else None,
+        "embedding_batcher": embedding_service.batcher.get_stats() if embedding_service and embedding_service.batcher else None,
+        "llm_executor": llm_executor.get_stats(),
+        "llm_response_cache": llm_response_cache.get_stats() if llm_response_cache else None,
+        "pdf_artifact_cache": pdf_artifact_cache.get_stats() if pdf_artifact_cache else None,
+        "ingestion_jobs": ingestion_queue.get_stats(),
+        "timestamp": time.time()
+    }
+
 # Session creation removed - focusing on question generation only
 
 # Session answer submission removed
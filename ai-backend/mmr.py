@@ -0,0 +1,54 @@
+"""
+Maximal Marginal Relevance reranking for PrepVista
+Selects relevant but mutually diverse chunks from a retrieved candidate pool
+"""
+
+from typing import List, Sequence
+import numpy as np
+
+def mmr_select(query_embedding: Sequence[float], candidate_embeddings: Sequence[Sequence[float]],
+               k: int, lambda_mult: float = 0.7) -> List[int]:
+    """
+    Select k candidates by maximal marginal relevance
+
+    Each step picks the candidate maximising
+    lambda * sim(query, c) - (1 - lambda) * max(sim(c, already selected)).
+
+    Args:
+        query_embedding: Query embedding vector
+        candidate_embeddings: Candidate embedding vectors (one row per candidate)
+        k: Number of candidates to select
+        lambda_mult: Trade-off between relevance (1.0) and diversity (0.0)
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    candidates = candidates / norms
+
+    relevance = candidates @ query
+    k = min(k, len(candidates))
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_similarity = candidates @ candidates[first]
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+
+    relevance_term = lambda_mult * relevance
+    for _ in range(1, k):
+        scores = relevance_term - (1.0 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, candidates @ candidates[chosen], out=max_similarity)
+
+    return selected
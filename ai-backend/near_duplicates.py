@@ -0,0 +1,145 @@
+"""
+Near-duplicate detection for PrepVista
+MinHash signatures over word shingles, bucketed with locality-sensitive hashing
+"""
+
+import itertools
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# Mersenne prime for the universal hash family; shingle hashes are reduced below it
+MERSENNE_PRIME = (1 << 31) - 1
+
+WORD = re.compile(r'\w+')
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """
+    Hashed word shingles of a text
+
+    Args:
+        text: Text to shingle
+        size: Words per shingle
+
+    Returns:
+        Sorted array of distinct stable 32-bit shingle hashes (a single shingle
+        for shorter texts)
+    """
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        hashes = {zlib.crc32(" ".join(words).encode('utf-8'))} if words else set()
+    else:
+        hashes = {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+    return np.sort(np.fromiter(hashes, dtype=np.uint32, count=len(hashes)))
+
+def jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """Jaccard similarity of two shingle arrays from shingles()"""
+    if not first.size and not second.size:
+        return 1.0
+    common = np.intersect1d(first, second, assume_unique=True).size
+    return common / (first.size + second.size - common)
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, shingle_size: int = 5, seed: int = 1,
+                 max_entries: int = 2000):
+        """
+        Initialize near-duplicate index
+
+        Texts whose shingle sets have a Jaccard similarity of at least threshold
+        are near-duplicates. LSH bands are sized so that pairs around the
+        threshold almost always share a bucket; candidates are then confirmed
+        with the exact Jaccard similarity. Shingles are kept as compact uint32
+        arrays, and only the latest max_entries texts are kept, so memory stays
+        bounded however long the document.
+
+        Args:
+            threshold: Jaccard similarity at which texts count as near-duplicates
+            num_perm: MinHash permutations per signature
+            shingle_size: Words per shingle
+            seed: Seed for the hash permutations (fixed, so results are deterministic)
+            max_entries: Texts kept for comparison; the oldest are forgotten beyond it
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.rows = self._rows_per_band(threshold, num_perm)
+        self.bands = num_perm // self.rows
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MERSENNE_PRIME, size=(self.bands * self.rows, 1), dtype=np.int64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=(self.bands * self.rows, 1), dtype=np.int64)
+
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        # Shingles and caller's key of each kept text, oldest first, by sequence number
+        self._entries: Dict[int, Tuple[np.ndarray, Any]] = {}
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def _rows_per_band(threshold: float, num_perm: int) -> int:
+        """Most rows per band whose LSH threshold (1/bands)^(1/rows) stays at or below threshold"""
+        best = 1
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows == 0 and (rows / num_perm) ** (1 / rows) <= threshold:
+                best = rows
+        return best
+
+    def signature(self, text_shingles: np.ndarray) -> np.ndarray:
+        """MinHash signature of a shingle array"""
+        values = text_shingles.astype(np.int64) % MERSENNE_PRIME
+        return ((self._a * values + self._b) % MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, text_shingles: np.ndarray) -> List[Tuple[int, bytes]]:
+        bands = self.signature(text_shingles).reshape(self.bands, self.rows)
+        return [(band, bands[band].tobytes()) for band in range(self.bands)]
+
+    def add(self, text: str, key: Any = None) -> Optional[Tuple[Any, float]]:
+        """
+        Look a text up and add it to the index unless it is a near-duplicate
+
+        Args:
+            text: Text to check
+            key: Value returned for this text when a later text duplicates it
+                (defaults to the number of texts added before it)
+
+        Returns:
+            (key of the canonical text, Jaccard similarity) if the text is a
+            near-duplicate of one still in the index, otherwise None
+        """
+        text_shingles = shingles(text, self.shingle_size)
+        if not text_shingles.size:
+            return None
+
+        keys = self._band_keys(text_shingles)
+        best: Optional[Tuple[int, float]] = None
+        checked = set()
+        for bucket_key in keys:
+            for candidate in self._buckets.get(bucket_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = jaccard(text_shingles, self._entries[candidate][0])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+        if best is not None:
+            return self._entries[best[0]][1], best[1]
+
+        number = next(self._sequence)
+        self._entries[number] = (text_shingles, number if key is None else key)
+        for bucket_key in keys:
+            self._buckets.setdefault(bucket_key, []).append(number)
+        if len(self._entries) > self.max_entries:
+            self._evict_oldest()
+        return None
+
+    def _evict_oldest(self) -> None:
+        number = next(iter(self._entries))
+        text_shingles, _ = self._entries.pop(number)
+        for bucket_key in self._band_keys(text_shingles):
+            bucket = self._buckets[bucket_key]
+            bucket.remove(number)
+            if not bucket:
+                del self._buckets[bucket_key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
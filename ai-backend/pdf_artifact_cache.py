@@ -0,0 +1,195 @@
+"""
+PDF Artifact Cache for PrepVista
+Keeps processed PDF results on disk, keyed by a hash of the file bytes
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def copy_and_hash(source: BinaryIO, destination: BinaryIO) -> str:
+    """
+    Copy a file object to another while hashing it, in a single pass
+
+    Args:
+        source: File object to read
+        destination: File object to write
+
+    Returns:
+        SHA-256 hex digest of the bytes copied
+    """
+    digest = hashlib.sha256()
+    while True:
+        block = source.read(COPY_BUFFER_SIZE)
+        if not block:
+            break
+        digest.update(block)
+        destination.write(block)
+    return digest.hexdigest()
+
+class PDFArtifactCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, signature: str = ""):
+        """
+        Initialize PDF artifact cache
+
+        Args:
+            cache_dir: Directory holding one compressed result file per PDF
+            max_bytes: Disk budget; least recently used results are evicted beyond it
+            signature: Processing settings the results depend on (part of every key)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.signature = signature
+
+        # Result files by key, least recently used first, with their sizes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+        logger.info(f"Initialized PDFArtifactCache (cache_dir={cache_dir}, max_bytes={max_bytes}, entries={len(self._entries)})")
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from the files already on disk, oldest access first"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json.gz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-len('.json.gz')], stat.st_size))
+            except OSError:
+                continue
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _key(self, file_hash: str) -> str:
+        return hashlib.sha256(f"{file_hash}:{self.signature}".encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def get(self, file_hash: str, agent_id: str, document_id: str, file_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the processed result of a PDF, stamped for a new upload
+
+        Args:
+            file_hash: SHA-256 of the PDF bytes
+            agent_id: AI Agent ID of the new upload
+            document_id: Document ID of the new upload
+            file_name: File name of the new upload
+
+        Returns:
+            Processing result like PDFProcessor.process_pdf, or None on a miss
+        """
+        key = self._key(file_hash)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as file:
+                result = json.load(file)
+            # Keep the on-disk order in step for the next restart
+            os.utime(self._path(key))
+        except Exception as e:
+            logger.warning(f"Failed to read cached PDF artifacts {key}: {e}")
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        for chunk in result['chunks']:
+            chunk['metadata'].update({'agent_id': agent_id, 'document_id': document_id, 'file_name': file_name})
+
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, file_hash: str, result: Dict[str, Any]) -> None:
+        """
+        Store the processed result of a PDF
+
+        Args:
+            file_hash: SHA-256 of the PDF bytes
+            result: Successful result of PDFProcessor.process_pdf
+        """
+        key = self._key(file_hash)
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with gzip.open(os.fdopen(fd, 'wb'), 'wt', encoding='utf-8') as file:
+                json.dump(result, file)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, self._path(key))
+        except Exception as e:
+            logger.warning(f"Failed to cache PDF artifacts {key}: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self.stores += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used results until the cache fits its disk budget"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except OSError as e:
+                logger.warning(f"Failed to evict cached PDF artifacts {key}: {e}")
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'disk_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
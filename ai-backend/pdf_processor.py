@@ -3,34 +3,313 @@ PDF Processing Service for PrepVista
 Handles PDF text extraction and chunking for vector storage
 """
 
+import bisect
+import hashlib
+import itertools
+import json
 import logging
+import math
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable, Iterator
 from pathlib import Path
 import tiktoken
 import pdfplumber
 from PyPDF2 import PdfReader
 import re
+from near_duplicates import NearDuplicateIndex
 
 logger = logging.getLogger(__name__)
 
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Standalone page-number lines, and runs of characters outside the kept set
+PAGE_NUMBER_LINES = re.compile(r'^[ \t]*\d+[ \t]*$', re.MULTILINE)
+TEXT_ARTIFACTS = re.compile(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\/\@\#\$\%\&\*\+\=\<\>\|\\\~\`]+')
+# The same characters for ASCII text, where str.translate removes them much faster
+ASCII_ARTIFACTS = str.maketrans('', '', ''.join(chr(code) for code in range(128) if TEXT_ARTIFACTS.match(chr(code))))
+WHITESPACE = re.compile(r'\s+')
+DIGITS = re.compile(r'\d+')
+
+# Bump when the output of process_pdf changes, so cached results are not reused
+PROCESSING_VERSION = 6
+
+# Chunk cuts are content-defined so an edit only changes the chunks around it:
+# each cut is chosen by hashing this many characters before every candidate
+CUT_CONTEXT_CHARS = 32
+# Cut anchors occur about once per this fraction of chunk_size tokens
+CUT_ANCHOR_SPACING = 0.2
+
+# A line must repeat on at least this many pages to count as a header or footer
+MIN_BOILERPLATE_PAGES = 3
+
+# Pages the fast extractor reads are re-read with pdfplumber when their text
+# is shorter than this, has too many garbage characters or glued-together
+# words, or has too many column-aligned or numeric lines
+PAGE_ENGINES = ('auto', 'pypdf2', 'pdfplumber')
+MIN_FAST_PATH_CHARS = 200
+MAX_GARBAGE_RATIO = 0.02
+MAX_MEAN_WORD_LENGTH = 12
+MAX_LAYOUT_LINE_RATIO = 0.3
+GARBAGE_TEXT = re.compile(r'\(cid:\d+\)|[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]')
+COLUMN_GAP = re.compile(r'\S(?: {3,}|\t)\S')
+NUMERIC_LINE = re.compile(r'^[\s\d.,%$()+\-/]+$')
+# Pages escalated for columns are read column by column when a vertical gutter
+# at least this wide (in points) runs through the middle half of the page
+MIN_GUTTER_WIDTH = 12
+
+def content_hash(content: str) -> str:
+    """Hash identifying a chunk's content across versions of a document"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def _count_pages(pdf_path: str) -> int:
+    """Number of pages in a PDF, trying PyPDF2 before pdfplumber"""
+    try:
+        with open(pdf_path, 'rb') as file:
+            return len(PdfReader(file).pages)
+    except Exception as e:
+        logger.warning(f"PyPDF2 failed to open PDF, trying pdfplumber: {e}")
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+def _escalation_reason(text: Optional[str]) -> Optional[str]:
+    """
+    Why a page read by the fast extractor should be re-read with pdfplumber
+    
+    Args:
+        text: Text PyPDF2 extracted from the page (None if it failed)
+        
+    Returns:
+        Reason (empty, low_density, garbage, columns or table), or None if the text looks fine
+    """
+    if text is None or not text.strip():
+        return 'empty'
+    
+    stripped = text.strip()
+    if len(stripped) < MIN_FAST_PATH_CHARS:
+        return 'low_density'
+    
+    garbage = sum(len(match) for match in GARBAGE_TEXT.findall(stripped))
+    words = stripped.split()
+    if garbage > len(stripped) * MAX_GARBAGE_RATIO or len(stripped) / len(words) > MAX_MEAN_WORD_LENGTH:
+        return 'garbage'
+    
+    lines = [line for line in stripped.splitlines() if line.strip()]
+    if len(lines) >= 5:
+        if sum(1 for line in lines if COLUMN_GAP.search(line)) > len(lines) * MAX_LAYOUT_LINE_RATIO:
+            return 'columns'
+        if sum(1 for line in lines if NUMERIC_LINE.match(line)) > len(lines) * MAX_LAYOUT_LINE_RATIO:
+            return 'table'
+    return None
+
+def _column_gutter(spans: List[Tuple[float, float]], width: float) -> Optional[float]:
+    """
+    x position of the gutter between two text columns
+    
+    The widest run of x positions in the middle half of the page crossed by
+    the fewest words is taken, allowing a few crossings for full-width titles
+    and footers, as long as most words lie on either side of it.
+    
+    Args:
+        spans: (x0, x1) of each word on the page
+        width: Page width
+        
+    Returns:
+        x position of the gutter's middle, or None if the page has no gutter
+    """
+    if not spans:
+        return None
+    allowed = max(2, len(spans) // 50)
+    positions = range(int(width * 0.25), int(width * 0.75) + 1)
+    crossings = [sum(1 for x0, x1 in spans if x0 < x < x1) for x in positions]
+    fewest = min(crossings)
+    if fewest > allowed:
+        return None
+    
+    best_start = best_length = run_start = 0
+    for index, count in enumerate(crossings + [fewest + 1]):
+        if count != fewest:
+            if index - run_start > best_length:
+                best_start, best_length = run_start, index - run_start
+            run_start = index + 1
+    if best_length < MIN_GUTTER_WIDTH:
+        return None
+    
+    gutter = positions[best_start] + best_length / 2
+    left = sum(1 for x0, x1 in spans if x1 <= gutter)
+    if min(left, len(spans) - left) < len(spans) // 5:
+        return None
+    return gutter
+
+def _extract_page_range(pdf_path: str, start: int, end: int, engine: str = 'auto') -> List[Dict[str, Any]]:
+    """
+    Extract text from pages [start, end) of a PDF
+    
+    Runs in a worker process, so it opens the file itself.
+    
+    Args:
+        pdf_path: Path to PDF file
+        start: Index of the first page (0-based)
+        end: Index after the last page
+        engine: Page engine (auto, pypdf2 or pdfplumber)
+        
+    Returns:
+        Page dictionaries for pages with text, in page order
+    """
+    return list(_iter_page_range(pdf_path, start, end, engine))
+
+def _iter_page_range(pdf_path: str, start: int, end: int, engine: str = 'auto') -> Iterator[Dict[str, Any]]:
+    """
+    Yield text from pages [start, end) of a PDF one page at a time
+    
+    With the auto engine each page is read with PyPDF2 and re-read with the
+    slower, layout-aware pdfplumber only when the text looks empty, sparse,
+    garbled, multi-column or tabular; multi-column pages are read column by
+    column when a gutter separates them. The pdfplumber engine reads every page
+    with pdfplumber and falls back to PyPDF2 if that fails.
+    
+    Args:
+        pdf_path: Path to PDF file
+        start: Index of the first page (0-based)
+        end: Index after the last page
+        engine: Page engine (auto, pypdf2 or pdfplumber)
+        
+    Yields:
+        Page dictionaries for pages with text, in page order
+    """
+    readers: Dict[str, Any] = {}
+    files = []
+    
+    def pypdf2_text(index: int) -> Optional[str]:
+        try:
+            if 'pypdf2' not in readers:
+                files.append(open(pdf_path, 'rb'))
+                readers['pypdf2'] = PdfReader(files[-1])
+            return readers['pypdf2'].pages[index].extract_text()
+        except Exception as e:
+            logger.warning(f"PyPDF2 failed on page {index + 1}: {e}")
+            return None
+    
+    def pdfplumber_text(index: int, columns: bool = False) -> Optional[str]:
+        try:
+            if 'pdfplumber' not in readers:
+                readers['pdfplumber'] = None
+                readers['pdfplumber'] = pdfplumber.open(pdf_path)
+            if readers['pdfplumber'] is None:
+                return None
+            page = readers['pdfplumber'].pages[index]
+            gutter = None
+            if columns:
+                words = page.extract_words()
+                gutter = _column_gutter([(word['x0'] - page.bbox[0], word['x1'] - page.bbox[0]) for word in words],
+                                        page.width)
+            if gutter is None:
+                text = page.extract_text()
+            else:
+                x0, top, x1, bottom = page.bbox
+                parts = [page.crop((x0, top, x0 + gutter, bottom)).extract_text(),
+                         page.crop((x0 + gutter, top, x1, bottom)).extract_text()]
+                text = "\n".join(part for part in parts if part)
+            # Release the parsed layout so long ranges don't accumulate memory
+            page.flush_cache()
+            return text
+        except Exception as e:
+            logger.warning(f"pdfplumber failed on page {index + 1}: {e}")
+            return None
+    
+    try:
+        for index in range(start, end):
+            page_num = index + 1
+            escalation = None
+            
+            if engine == 'pdfplumber':
+                text, method = pdfplumber_text(index), 'pdfplumber'
+                if text is None:
+                    text, method = pypdf2_text(index), 'pypdf2'
+            else:
+                text, method = pypdf2_text(index), 'pypdf2'
+                escalation = _escalation_reason(text) if engine == 'auto' else None
+                if escalation:
+                    layout_text = pdfplumber_text(index, columns=escalation == 'columns')
+                    if layout_text and layout_text.strip():
+                        text, method = layout_text, 'pdfplumber'
+            
+            if text and text.strip():
+                yield {
+                    'page_number': page_num,
+                    'text': text.strip(),
+                    'char_count': len(text),
+                    'method': method,
+                    'escalation': escalation
+                }
+            elif text is None:
+                logger.warning(f"Failed to extract text from page {page_num}")
+    finally:
+        if readers.get('pdfplumber') is not None:
+            readers['pdfplumber'].close()
+        for file in files:
+            file.close()
+
 class PDFProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 extraction_workers: Optional[int] = None, min_pages_per_worker: int = 16,
+                 pages_per_range: int = 8, boilerplate_window: int = 24,
+                 boilerplate_min_fraction: float = 0.6, boilerplate_edge_lines: int = 3,
+                 page_engine: str = 'auto', near_duplicate_threshold: float = 0.9):
         """
         Initialize PDF processor
         
         Args:
             chunk_size: Maximum number of tokens per chunk
             chunk_overlap: Number of tokens to overlap between chunks
+            extraction_workers: Worker processes for page extraction (defaults to the CPU count)
+            min_pages_per_worker: Documents with fewer pages per worker are extracted in-process
+            pages_per_range: Pages handed to a worker at a time
+            boilerplate_window: Pages around each page searched for repeated headers and footers (0 disables stripping)
+            boilerplate_min_fraction: Fraction of the window's pages a line must appear on to be stripped
+            boilerplate_edge_lines: Lines at the top and bottom of each page that may be headers or footers
+            page_engine: auto (PyPDF2, escalating complex pages to pdfplumber), pypdf2 or pdfplumber
+            near_duplicate_threshold: Shingle Jaccard similarity above which a chunk is dropped as a
+                near-duplicate of an earlier one (0 disables it)
         """
+        if page_engine not in PAGE_ENGINES:
+            raise ValueError(f"Unknown page engine {page_engine!r}, expected one of {', '.join(PAGE_ENGINES)}")
+        
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.cut_spacing = max(int(chunk_size * CUT_ANCHOR_SPACING), 1)
         self.encoding = tiktoken.get_encoding("cl100k_base")  # GPT-4 encoding
+        self.extraction_workers = max(extraction_workers or os.cpu_count() or 1, 1)
+        self.min_pages_per_worker = max(min_pages_per_worker, 1)
+        self.pages_per_range = max(pages_per_range, 1)
+        self.boilerplate_window = boilerplate_window
+        self.boilerplate_min_fraction = boilerplate_min_fraction
+        self.boilerplate_edge_lines = max(boilerplate_edge_lines, 1)
+        self.page_engine = page_engine
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._extraction_pool: Optional[ProcessPoolExecutor] = None
+        self._extraction_pool_lock = threading.Lock()
+        self._token_lengths: Dict[int, int] = {}  # Byte length of each token seen so far
         
+    def signature(self) -> str:
+        """Settings that determine the output of process_pdf, for keying cached results"""
+        return json.dumps([
+            PROCESSING_VERSION, self.chunk_size, self.chunk_overlap, self.page_engine,
+            self.boilerplate_window, self.boilerplate_min_fraction, self.boilerplate_edge_lines,
+            self.near_duplicate_threshold
+        ])
+    
     def extract_text_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """
         Extract text from PDF file
         
+        Collects iter_pages into one result; use iter_pages directly to avoid
+        holding the whole document in memory.
+        
         Args:
             pdf_path: Path to PDF file
             
@@ -40,68 +319,20 @@ class PDFProcessor:
         try:
             logger.info(f"Extracting text from PDF: {pdf_path}")
             
-            # Try pdfplumber first (better for complex layouts)
-            try:
-                with pdfplumber.open(pdf_path) as pdf:
-                    pages_text = []
-                    total_pages = len(pdf.pages)
-                    
-                    for page_num, page in enumerate(pdf.pages, 1):
-                        try:
-                            text = page.extract_text()
-                            if text and text.strip():
-                                pages_text.append({
-                                    'page_number': page_num,
-                                    'text': text.strip(),
-                                    'char_count': len(text)
-                                })
-                        except Exception as e:
-                            logger.warning(f"Failed to extract text from page {page_num}: {e}")
-                            continue
-                    
-                    full_text = '\n\n'.join([page['text'] for page in pages_text])
-                    
-                    return {
-                        'success': True,
-                        'full_text': full_text,
-                        'pages': pages_text,
-                        'total_pages': total_pages,
-                        'total_chars': len(full_text),
-                        'method': 'pdfplumber'
-                    }
-                    
-            except Exception as e:
-                logger.warning(f"pdfplumber failed, trying PyPDF2: {e}")
-                
-                # Fallback to PyPDF2
-                with open(pdf_path, 'rb') as file:
-                    pdf_reader = PdfReader(file)
-                    pages_text = []
-                    total_pages = len(pdf_reader.pages)
-                    
-                    for page_num, page in enumerate(pdf_reader.pages, 1):
-                        try:
-                            text = page.extract_text()
-                            if text and text.strip():
-                                pages_text.append({
-                                    'page_number': page_num,
-                                    'text': text.strip(),
-                                    'char_count': len(text)
-                                })
-                        except Exception as e:
-                            logger.warning(f"Failed to extract text from page {page_num}: {e}")
-                            continue
-                    
-                    full_text = '\n\n'.join([page['text'] for page in pages_text])
-                    
-                    return {
-                        'success': True,
-                        'full_text': full_text,
-                        'pages': pages_text,
-                        'total_pages': total_pages,
-                        'total_chars': len(full_text),
-                        'method': 'pypdf2'
-                    }
+            stats: Dict[str, Any] = {}
+            pages_text = list(self.iter_pages(pdf_path, stats))
+            full_text = '\n\n'.join([page['text'] for page in pages_text])
+            
+            return {
+                'success': True,
+                'full_text': full_text,
+                'pages': pages_text,
+                'total_pages': stats['total_pages'],
+                'total_chars': len(full_text),
+                'method': stats['method'],
+                'pages_by_method': stats['pages_by_method'],
+                'escalations': stats['escalations']
+            }
                     
         except Exception as e:
             logger.error(f"Failed to extract text from PDF {pdf_path}: {e}")
@@ -114,6 +345,141 @@ class PDFProcessor:
                 'total_chars': 0
             }
     
+    def iter_pages(self, pdf_path: str, stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield extracted pages in order as they become available
+        
+        Page ranges are extracted in parallel worker processes, each opening the
+        file itself. Only a couple of ranges per worker are in flight at once,
+        so memory stays bounded however long the document is. The extractor is
+        chosen page by page according to page_engine.
+        
+        Args:
+            pdf_path: Path to PDF file
+            stats: Optional dictionary filled with total_pages up front,
+                pages_extracted as pages are yielded, and total_chars, method,
+                pages_by_method and escalations once all pages were yielded
+            
+        Yields:
+            Page dictionaries with page_number, text, char_count, method and
+            escalation (why pdfplumber was used, or None)
+        """
+        stats = stats if stats is not None else {}
+        total_pages = _count_pages(pdf_path)
+        stats.update({'total_pages': total_pages, 'pages_extracted': 0, 'total_chars': 0, 'method': 'pdfplumber'})
+        methods = Counter()
+        escalations = Counter()
+        
+        for page in self._iter_extracted_pages(pdf_path, total_pages):
+            methods[page['method']] += 1
+            stats['pages_extracted'] = page['page_number']
+            if page['escalation']:
+                escalations[page['escalation']] += 1
+            # Matches the length of the pages joined with blank lines
+            stats['total_chars'] += len(page['text']) + (2 if stats['total_chars'] else 0)
+            yield page
+        
+        stats['method'] = 'pdfplumber+pypdf2' if len(methods) > 1 else next(iter(methods), 'pdfplumber')
+        stats['pages_by_method'] = dict(methods)
+        stats['escalations'] = dict(escalations)
+        logger.info(f"Extracted {total_pages} pages ({stats['method']}, escalated to pdfplumber: {dict(escalations)})")
+    
+    def _iter_extracted_pages(self, pdf_path: str, total_pages: int) -> Iterator[Dict[str, Any]]:
+        page_ranges = self._page_ranges(total_pages)
+        if len(page_ranges) == 1:
+            yield from _iter_page_range(pdf_path, 0, total_pages, self.page_engine)
+            return
+        
+        remaining = iter(page_ranges)
+        in_flight = deque()
+        pool = None
+        
+        def submit_next() -> None:
+            page_range = next(remaining, None)
+            if page_range:
+                future = pool.submit(_extract_page_range, pdf_path, *page_range, self.page_engine)
+                in_flight.append((page_range[0], future))
+        
+        def cancel_in_flight() -> None:
+            # Only this document's ranges; other uploads share the pool
+            while in_flight:
+                in_flight.popleft()[1].cancel()
+        
+        try:
+            pool = self._get_extraction_pool()
+            for _ in range(self.extraction_workers * 2):
+                submit_next()
+        except Exception as e:
+            logger.warning(f"Failed to start parallel extraction, extracting in-process: {e}")
+            cancel_in_flight()
+            self._discard_broken_pool(pool, e)
+            yield from _iter_page_range(pdf_path, 0, total_pages, self.page_engine)
+            return
+        
+        try:
+            while in_flight:
+                range_start, future = in_flight[0]
+                try:
+                    pages = future.result()
+                    in_flight.popleft()
+                    submit_next()
+                except Exception as e:
+                    logger.warning(f"Parallel extraction failed at page {range_start + 1}, extracting the rest in-process: {e}")
+                    cancel_in_flight()
+                    self._discard_broken_pool(pool, e)
+                    yield from _iter_page_range(pdf_path, range_start, total_pages, self.page_engine)
+                    return
+                yield from pages
+        finally:
+            # A consumer that stops early should not leave ranges queued
+            cancel_in_flight()
+    
+    def _page_ranges(self, total_pages: int) -> List[Tuple[int, int]]:
+        """
+        Split pages into contiguous [start, end) ranges for the workers
+        
+        Args:
+            total_pages: Number of pages in the document
+            
+        Returns:
+            Page ranges in document order
+        """
+        if self.extraction_workers <= 1 or total_pages < 2 * self.min_pages_per_worker:
+            return [(0, total_pages)]
+        
+        range_size = min(self.pages_per_range, -(-total_pages // self.extraction_workers))
+        return [(start, min(start + range_size, total_pages)) for start in range(0, total_pages, range_size)]
+    
+    def _get_extraction_pool(self) -> ProcessPoolExecutor:
+        """Process pool for page extraction, created on first use (uploads on several threads share it)"""
+        with self._extraction_pool_lock:
+            if self._extraction_pool is None:
+                self._extraction_pool = ProcessPoolExecutor(max_workers=self.extraction_workers)
+            return self._extraction_pool
+    
+    def _discard_broken_pool(self, pool: Optional[ProcessPoolExecutor], error: Exception) -> None:
+        """
+        Replace the process pool on next use if a worker process died
+        
+        Other errors (e.g. a page range that failed to parse) only affect the
+        document being extracted, so the pool is kept for other uploads. A
+        broken pool has already failed every upload using it, so nothing else
+        is cancelled.
+        """
+        if pool is None or not isinstance(error, BrokenProcessPool):
+            return
+        with self._extraction_pool_lock:
+            if self._extraction_pool is pool:
+                self._extraction_pool = None
+        pool.shutdown(wait=False)
+    
+    def shutdown(self) -> None:
+        """Stop the page extraction worker processes"""
+        with self._extraction_pool_lock:
+            pool, self._extraction_pool = self._extraction_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
     def clean_text(self, text: str) -> str:
         """
         Clean and normalize extracted text
@@ -124,19 +490,91 @@ class PDFProcessor:
         Returns:
             Cleaned text
         """
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
+        # Page-number lines need the line breaks, so they go before whitespace is collapsed
+        text = PAGE_NUMBER_LINES.sub('', text)
+        text = text.translate(ASCII_ARTIFACTS) if text.isascii() else TEXT_ARTIFACTS.sub('', text)
+        return ' '.join(text.split())
+    
+    def strip_boilerplate(self, pages: Iterable[Dict[str, Any]],
+                          stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Remove running headers, footers and watermarks repeated across pages
+        
+        The top and bottom lines of each page are compared, with digits
+        ignored so "Page 3" matches "Page 4", against the pages around it: a
+        sliding window of boilerplate_window pages, half of them still ahead.
+        Lines found on at least boilerplate_min_fraction of the window are
+        dropped. Pages are yielded in order with at most half a window held back.
+        
+        Args:
+            pages: Page dictionaries with page_number and text
+            stats: Optional dictionary filled with boilerplate_lines_removed
+                and boilerplate_tokens_removed
+            
+        Yields:
+            Page dictionaries with boilerplate lines removed from their text
+        """
+        stats = stats if stats is not None else {}
+        stats.update({'boilerplate_lines_removed': 0, 'boilerplate_tokens_removed': 0})
+        if self.boilerplate_window < MIN_BOILERPLATE_PAGES:
+            yield from pages
+            return
         
-        # Remove page numbers and headers/footers (basic patterns)
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
+        window = deque()        # Edge line keys of the pages counted, oldest first
+        counts = Counter()      # Pages in the window each key appears on
+        pending = deque()       # Pages read but not yet yielded, with their keys
+        lookahead = self.boilerplate_window // 2
         
-        # Remove excessive newlines
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+        for page in pages:
+            keys = self._edge_line_keys(page['text'])
+            window.append(keys)
+            counts.update(keys)
+            if len(window) > self.boilerplate_window:
+                for key in window.popleft():
+                    counts[key] -= 1
+                    if not counts[key]:
+                        del counts[key]
+            
+            pending.append((page, keys))
+            if len(pending) > lookahead:
+                yield self._strip_page_boilerplate(*pending.popleft(), counts, len(window), stats)
+        
+        while pending:
+            yield self._strip_page_boilerplate(*pending.popleft(), counts, len(window), stats)
+        
+        if stats['boilerplate_lines_removed']:
+            logger.info(f"Stripped {stats['boilerplate_lines_removed']} boilerplate lines "
+                        f"({stats['boilerplate_tokens_removed']} tokens)")
+    
+    def _edge_lines(self, lines: List[str]) -> List[int]:
+        """Indices of the first and last non-empty lines of a page"""
+        filled = [index for index, line in enumerate(lines) if line.strip()]
+        edge = self.boilerplate_edge_lines
+        return filled if len(filled) <= 2 * edge else filled[:edge] + filled[-edge:]
+    
+    @staticmethod
+    def _line_key(line: str) -> str:
+        """Normalised form of a line for comparing headers and footers across pages"""
+        return DIGITS.sub('#', WHITESPACE.sub(' ', line).strip().lower())
+    
+    def _edge_line_keys(self, text: str) -> Set[str]:
+        lines = text.splitlines()
+        return {self._line_key(lines[index]) for index in self._edge_lines(lines)}
+    
+    def _strip_page_boilerplate(self, page: Dict[str, Any], keys: Set[str], counts: Counter,
+                                window_pages: int, stats: Dict[str, Any]) -> Dict[str, Any]:
+        threshold = max(MIN_BOILERPLATE_PAGES, math.ceil(self.boilerplate_min_fraction * window_pages))
+        if not any(counts[key] >= threshold for key in keys):
+            return page
         
-        # Clean up common PDF artifacts
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\/\@\#\$\%\&\*\+\=\<\>\|\\\~\`]', '', text)
+        lines = page['text'].splitlines()
+        removed = {index for index in self._edge_lines(lines) if counts[self._line_key(lines[index])] >= threshold}
+        for index in removed:
+            stats['boilerplate_lines_removed'] += 1
+            stats['boilerplate_tokens_removed'] += len(self.encoding.encode_ordinary(lines[index]))
         
-        return text.strip()
+        text = '\n'.join(line for index, line in enumerate(lines) if index not in removed)
+        return {**page, 'text': text}
     
     def split_text_into_chunks(self, text: str, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """
@@ -151,74 +589,268 @@ class PDFProcessor:
         """
         try:
             logger.info(f"Splitting text into chunks (chunk_size={self.chunk_size}, overlap={self.chunk_overlap})")
+            chunks = list(self.iter_chunks([{'page_number': None, 'text': text}], metadata))
+            logger.info(f"Created {len(chunks)} chunks from text")
+            return chunks
+            
+        except Exception as e:
+            logger.error(f"Failed to split text into chunks: {e}")
+            return []
+    
+    def iter_chunks(self, pages: Iterable[Dict[str, Any]], metadata: Optional[Dict] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield chunks as soon as they are complete
+        
+        Each page is cleaned and tokenized once, and chunks are cut straight from
+        the token stream: a chunk is an exact window of at most chunk_size tokens,
+        ending at a content-defined cut in the second half of the window, usually
+        close to its end (see _cut_point), and the next chunk starts exactly
+        chunk_overlap tokens before that cut. Because cuts depend only on nearby text, the cuts after
+        an inserted or deleted passage soon land where they did before, so a
+        revised document keeps the hashes of its unchanged chunks. Text and
+        tokens before the next chunk are dropped after each page, so only about
+        one chunk and one page are held in memory.
+        
+        Page attribution is exact: the start offset of every buffered page is
+        kept, and a chunk's first and last characters are looked up in it by
+        binary search.
+        
+        Args:
+            pages: Page dictionaries with page_number and text
+            metadata: Optional metadata to include with chunks
             
-            # Clean the text first
-            cleaned_text = self.clean_text(text)
+        Yields:
+            Chunk dictionaries with page_number (first page) and end_page_number
+        """
+        text = ""
+        char_base = 0                        # Characters dropped from the front of text
+        offsets: List[int] = []              # Character offset in the document of each buffered token
+        page_starts: List[int] = []          # Character offset in the document where each buffered page starts
+        page_numbers: List[int] = []
+        sentence_ends: List[int] = []        # Token indices at which a sentence has just ended
+        dropped = 0                          # Tokens dropped from the front of the buffers
+        total = 0                            # Tokens seen so far
+        start = 0                            # First token of the next chunk
+        emitted_end = 0                      # Token index where the last emitted chunk ended
+        chunk_index = 0
+        
+        for page in pages:
+            page_text = self.clean_text(page['text'])
+            if not page_text:
+                continue
             
-            # Split into sentences first
-            sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+            doc_chars = char_base + len(text)
+            segment = " " + page_text if total else page_text
+            segment_tokens = self.encoding.encode_ordinary(segment)
             
-            chunks = []
-            current_chunk = ""
-            current_tokens = 0
-            chunk_index = 0
+            offsets.extend(self._token_offsets(segment_tokens, segment, doc_chars))
+            page_starts.append(doc_chars)
+            page_numbers.append(page['page_number'])
             
-            for sentence in sentences:
-                sentence_tokens = len(self.encoding.encode(sentence))
-                
-                # If adding this sentence would exceed chunk size, save current chunk
-                if current_tokens + sentence_tokens > self.chunk_size and current_chunk:
-                    chunks.append({
-                        'content': current_chunk.strip(),
-                        'chunk_index': chunk_index,
-                        'token_count': current_tokens,
-                        'metadata': metadata or {}
-                    })
-                    
-                    # Start new chunk with overlap
-                    overlap_text = self._get_overlap_text(current_chunk)
-                    current_chunk = overlap_text + " " + sentence
-                    current_tokens = len(self.encoding.encode(current_chunk))
-                    chunk_index += 1
-                else:
-                    current_chunk += " " + sentence if current_chunk else sentence
-                    current_tokens += sentence_tokens
+            # Sentence ends map to the first token at or after the whitespace that follows them
+            if total and text[-1] in '.!?':
+                sentence_ends.append(total)
+            for match in SENTENCE_BOUNDARY.finditer(segment):
+                position = bisect.bisect_left(offsets, doc_chars + match.start(), lo=total - dropped)
+                sentence_ends.append(dropped + position)
             
-            # Add the last chunk if it has content
-            if current_chunk.strip():
-                chunks.append({
-                    'content': current_chunk.strip(),
-                    'chunk_index': chunk_index,
-                    'token_count': current_tokens,
-                    'metadata': metadata or {}
-                })
+            text += segment
+            total += len(segment_tokens)
             
-            logger.info(f"Created {len(chunks)} chunks from text")
-            return chunks
+            while total - start > self.chunk_size:
+                end = self._cut_point(text, char_base, offsets, dropped, sentence_ends,
+                                      start + self.chunk_size // 2, start + self.chunk_size)
+                first_char, end_char = offsets[start - dropped], offsets[end - dropped]
+                yield self._make_chunk(text[first_char - char_base:end_char - char_base], chunk_index, end - start,
+                                       metadata, self._page_at(page_starts, page_numbers, first_char),
+                                       self._page_at(page_starts, page_numbers, end_char - 1))
+                chunk_index += 1
+                emitted_end = end
+                start = max(end - self.chunk_overlap, start + 1)
             
-        except Exception as e:
-            logger.error(f"Failed to split text into chunks: {e}")
-            return []
+            # Drop everything before the next chunk, once per page
+            cut = start - dropped
+            if cut:
+                text = text[offsets[cut] - char_base:]
+                char_base = offsets[cut]
+                del offsets[:cut]
+                first_page = bisect.bisect_right(page_starts, char_base) - 1
+                del page_starts[:first_page]
+                del page_numbers[:first_page]
+                del sentence_ends[:bisect.bisect_right(sentence_ends, start)]
+                dropped = start
+        
+        # Emit the rest unless it is only the overlap of the last chunk
+        if total > emitted_end:
+            first_char = offsets[start - dropped]
+            content = text[first_char - char_base:]
+            if content.strip():
+                yield self._make_chunk(content, chunk_index, total - start, metadata,
+                                       self._page_at(page_starts, page_numbers, first_char), page_numbers[-1])
+    
+    def _token_offsets(self, tokens: List[int], text: str, base: int = 0) -> List[int]:
+        """Character offset of each token of text, shifted by base"""
+        if not text.isascii():
+            _, offsets = self.encoding.decode_with_offsets(tokens)
+            return [base + offset for offset in offsets]
+        
+        # In ASCII text a token's byte length is its character length
+        lengths = self._token_lengths
+        for token in set(tokens).difference(lengths):
+            lengths[token] = len(self.encoding.decode_single_token_bytes(token))
+        offsets = list(itertools.accumulate(map(lengths.__getitem__, tokens), initial=base))
+        offsets.pop()
+        return offsets
+    
+    @staticmethod
+    def _page_at(page_starts: List[int], page_numbers: List[int], offset: int) -> int:
+        """Number of the page containing a character offset, by binary search over page start offsets"""
+        return page_numbers[bisect.bisect_right(page_starts, offset) - 1]
     
-    def _get_overlap_text(self, text: str) -> str:
+    def _cut_point(self, text: str, char_base: int, offsets: List[int], dropped: int,
+                   sentence_ends: List[int], lowest: int, highest: int) -> int:
         """
-        Get overlap text from the end of current chunk
+        Token index in (lowest, highest] at which to end a chunk
+        
+        Candidates are the sentence ends in the window (or the word starts, when
+        it has none). A candidate is an anchor when the hash of the text before
+        it falls below a threshold proportional to the tokens since the previous
+        candidate, so anchors occur about every cut_spacing tokens however dense
+        the candidates are. The last anchor is taken, keeping chunks close to
+        chunk_size, and a window without one falls back to its highest-hashing
+        candidate. Both depend only on the text near each candidate, so after an
+        edit the shifted windows soon pick the same cuts again.
+        """
+        def strength(token: int) -> int:
+            char = offsets[token - dropped] - char_base
+            return zlib.crc32(text[max(0, char - CUT_CONTEXT_CHARS):char].encode('utf-8'))
+        
+        def is_word_start(token: int) -> bool:
+            return text[offsets[token - dropped] - char_base].isspace()
+        
+        first = bisect.bisect_right(sentence_ends, lowest)
+        candidates = sentence_ends[first:bisect.bisect_right(sentence_ends, highest)]
+        previous = sentence_ends[first - 1] if first else None
+        if not candidates:
+            candidates = [token for token in range(lowest + 1, highest + 1) if is_word_start(token)]
+            previous = next((token for token in range(lowest, dropped, -1) if is_word_start(token)), None)
+        if not candidates:
+            return highest
+        
+        for token, before in zip(reversed(candidates), reversed([previous] + candidates[:-1])):
+            if before is not None and strength(token) < (1 << 32) * min(token - before, self.cut_spacing) / self.cut_spacing:
+                return token
+        return max(candidates, key=strength)
+    
+    def _make_chunk(self, content: str, chunk_index: int, token_count: int, metadata: Optional[Dict],
+                    start_page: Optional[int], end_page: Optional[int]) -> Dict[str, Any]:
+        # Content is the exact token window (it may start with the space of its
+        # first token), so token_count matches re-encoding it
+        chunk_hash = content_hash(content)
+        return {
+            'content': content,
+            'chunk_index': chunk_index,
+            'token_count': token_count,
+            'content_hash': chunk_hash,
+            'metadata': {**(metadata or {}), 'token_count': token_count, 'content_hash': chunk_hash},
+            'page_number': start_page,
+            'end_page_number': end_page
+        }
+    
+    def iter_pdf_chunks(self, pdf_path: str, agent_id: str, document_id: str,
+                        stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a PDF through extraction, boilerplate stripping, cleaning, chunking
+        and near-duplicate suppression
+        
+        Chunks are yielded as soon as they are complete, so peak memory is a few
+        pages rather than the whole document.
         
         Args:
-            text: Current chunk text
+            pdf_path: Path to PDF file
+            agent_id: AI Agent ID
+            document_id: Document ID
+            stats: Optional dictionary filled with total_pages, pages_extracted,
+                chunks_created, total_chars, method and the counts from
+                strip_boilerplate and suppress_near_duplicates
             
-        Returns:
-            Overlap text
+        Yields:
+            Chunk dictionaries with the exact pages each chunk spans attached
         """
-        words = text.split()
-        if len(words) <= self.chunk_overlap // 4:  # Rough word to token ratio
-            return text
+        stats = stats if stats is not None else {}
+        pages = self.strip_boilerplate(self.iter_pages(pdf_path, stats), stats)
+        
+        # Pull the first page so the page count is known for the chunk metadata
+        first_page = list(itertools.islice(pages, 1))
+        metadata = {
+            'agent_id': agent_id,
+            'document_id': document_id,
+            'file_name': os.path.basename(pdf_path),
+            'total_pages': stats['total_pages']
+        }
+        
+        chunks = self.iter_chunks(itertools.chain(first_page, pages), metadata)
+        stats['chunks_created'] = 0
+        for chunk in self.suppress_near_duplicates(chunks, stats):
+            start_page, end_page = chunk['page_number'], chunk['end_page_number']
+            chunk['page_info'] = {
+                'likely_pages': list(range(start_page, end_page + 1)),
+                'primary_page': start_page
+            }
+            stats['chunks_created'] += 1
+            yield chunk
+    
+    def suppress_near_duplicates(self, chunks: Iterable[Dict[str, Any]],
+                                 stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Drop chunks that nearly repeat an earlier chunk of the document
+        
+        Chunks are compared by MinHash/LSH over word shingles, so each chunk is
+        checked against only the few earlier chunks sharing an LSH bucket
+        (among the latest kept chunks, see NearDuplicateIndex.max_entries).
+        Kept chunks are renumbered so chunk indices stay contiguous, and every
+        dropped chunk is linked to the index of the chunk it duplicates.
+        
+        Args:
+            chunks: Chunks in document order
+            stats: Optional dictionary filled with near_duplicates_removed,
+                near_duplicate_tokens_removed and near_duplicates (the links)
+            
+        Yields:
+            Chunks that are not near-duplicates
+        """
+        stats = stats if stats is not None else {}
+        stats.update({'near_duplicates_removed': 0, 'near_duplicate_tokens_removed': 0, 'near_duplicates': []})
+        if not 0 < self.near_duplicate_threshold <= 1:
+            yield from chunks
+            return
+        
+        index = NearDuplicateIndex(threshold=self.near_duplicate_threshold)
+        kept = 0
+        for chunk in chunks:
+            # Indexed under its output chunk index, which duplicates link to
+            match = index.add(chunk['content'], key=kept)
+            if match is not None:
+                canonical, similarity = match
+                stats['near_duplicates_removed'] += 1
+                stats['near_duplicate_tokens_removed'] += chunk['token_count']
+                stats['near_duplicates'].append({
+                    'page_number': chunk['page_number'],
+                    'canonical_chunk_index': canonical,
+                    'similarity': round(similarity, 3)
+                })
+                continue
+            
+            chunk['chunk_index'] = kept
+            kept += 1
+            yield chunk
         
-        # Take last portion of text for overlap
-        overlap_words = words[-(self.chunk_overlap // 4):]
-        return " ".join(overlap_words)
+        if stats['near_duplicates_removed']:
+            logger.info(f"Suppressed {stats['near_duplicates_removed']} near-duplicate chunks "
+                        f"({stats['near_duplicate_tokens_removed']} tokens)")
     
-    def process_pdf(self, pdf_path: str, agent_id: str, document_id: str) -> Dict[str, Any]:
+    def process_pdf(self, pdf_path: str, agent_id: str, document_id: str,
+                    stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Complete PDF processing pipeline
         
@@ -226,6 +858,8 @@ class PDFProcessor:
             pdf_path: Path to PDF file
             agent_id: AI Agent ID
             document_id: Document ID
+            stats: Optional dictionary updated with progress while processing
+                (pages_extracted, chunks_created, ... as in iter_pdf_chunks)
             
         Returns:
             Processing result with chunks and metadata
@@ -233,43 +867,30 @@ class PDFProcessor:
         try:
             logger.info(f"Processing PDF: {pdf_path} for agent {agent_id}")
             
-            # Extract text from PDF
-            extraction_result = self.extract_text_from_pdf(pdf_path)
+            stats = stats if stats is not None else {}
+            chunks = list(self.iter_pdf_chunks(pdf_path, agent_id, document_id, stats))
             
-            if not extraction_result['success']:
-                return {
-                    'success': False,
-                    'error': extraction_result['error'],
-                    'chunks': []
-                }
-            
-            # Create metadata for chunks
-            metadata = {
-                'agent_id': agent_id,
-                'document_id': document_id,
-                'file_name': os.path.basename(pdf_path),
-                'total_pages': extraction_result['total_pages'],
-                'total_chars': extraction_result['total_chars']
-            }
-            
-            # Split into chunks
-            chunks = self.split_text_into_chunks(extraction_result['full_text'], metadata)
-            
-            # Add page information to chunks
+            # The character total is only known once every page was read
             for chunk in chunks:
-                chunk['page_info'] = self._get_page_info_for_chunk(
-                    chunk['content'], 
-                    extraction_result['pages']
-                )
+                chunk['metadata']['total_chars'] = stats['total_chars']
             
+            logger.info(f"Created {len(chunks)} chunks from {stats['total_pages']} pages "
+                        f"({stats['boilerplate_tokens_removed']} boilerplate tokens removed, "
+                        f"{stats['near_duplicates_removed']} near-duplicate chunks suppressed)")
             return {
                 'success': True,
                 'chunks': chunks,
                 'metadata': {
                     'total_chunks': len(chunks),
-                    'total_pages': extraction_result['total_pages'],
-                    'total_chars': extraction_result['total_chars'],
-                    'extraction_method': extraction_result['method']
+                    'total_pages': stats['total_pages'],
+                    'total_chars': stats['total_chars'],
+                    'extraction_method': stats['method'],
+                    'pages_by_method': stats['pages_by_method'],
+                    'boilerplate_lines_removed': stats['boilerplate_lines_removed'],
+                    'boilerplate_tokens_removed': stats['boilerplate_tokens_removed'],
+                    'near_duplicates_removed': stats['near_duplicates_removed'],
+                    'near_duplicate_tokens_removed': stats['near_duplicate_tokens_removed'],
+                    'near_duplicates': stats['near_duplicates']
                 }
             }
             
@@ -280,38 +901,3 @@ class PDFProcessor:
                 'error': str(e),
                 'chunks': []
             }
-    
-    def _get_page_info_for_chunk(self, chunk_content: str, pages: List[Dict]) -> Dict[str, Any]:
-        """
-        Determine which pages a chunk likely came from
-        
-        Args:
-            chunk_content: Content of the chunk
-            pages: List of page dictionaries
-            
-        Returns:
-            Page information for the chunk
-        """
-        try:
-            # Simple heuristic: find pages that contain parts of the chunk
-            chunk_words = set(chunk_content.lower().split())
-            matching_pages = []
-            
-            for page in pages:
-                page_words = set(page['text'].lower().split())
-                # If more than 30% of chunk words are in this page, consider it a match
-                overlap = len(chunk_words.intersection(page_words))
-                if overlap > len(chunk_words) * 0.3:
-                    matching_pages.append(page['page_number'])
-            
-            return {
-                'likely_pages': matching_pages,
-                'primary_page': matching_pages[0] if matching_pages else None
-            }
-            
-        except Exception as e:
-            logger.warning(f"Failed to determine page info for chunk: {e}")
-            return {
-                'likely_pages': [],
-                'primary_page': None
-            }
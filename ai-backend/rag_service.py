@@ -5,15 +5,52 @@ Handles context retrieval and response generation for AI agents
 
 import logging
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Any, Optional, Tuple
+import heapq
+import itertools
+import threading
+from collections import defaultdict, deque
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from embedding_service import EmbeddingService
 from vector_storage import VectorStorageService
+from semantic_cache import SemanticAnswerCache
+from llm_executor import LLMExecutor, PRIORITY_INTERACTIVE
+from deadline import Deadline
+from llm_cache import LLMResponseCache, generate_text
+from context_packer import ContextPacker
+from mmr import mmr_select
+from retrieval_cache import RetrievalCache
+from document_summary import DocumentSummaryBuilder
+from pdf_processor import content_hash
 
 logger = logging.getLogger(__name__)
 
+# Timeout for a single AI answer generation
+GENERATION_TIMEOUT = 30.0
+
+# Below this much remaining request time, answer generation is skipped
+MIN_GENERATION_TIME = 1.0
+
+TIMED_OUT_ANSWER = "I couldn't finish an answer in time. Here are the most relevant passages I found in your study materials."
+
+# Texts per embedding call when re-ingesting a document
+DOCUMENT_EMBEDDING_BATCH_SIZE = 100
+
+NO_CONTEXT_ANSWER = "I don't have enough relevant information in the uploaded documents to answer this question accurately. Please try rephrasing your question or upload more relevant documents."
+
 class RAGService:
-    def __init__(self, embedding_service: EmbeddingService, vector_storage: VectorStorageService, ai_model=None):
+    def __init__(self, embedding_service: EmbeddingService, vector_storage: VectorStorageService, ai_model=None,
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 llm_executor: Optional[LLMExecutor] = None,
+                 context_packer: Optional[ContextPacker] = None,
+                 context_token_budget: Optional[int] = None,
+                 mmr_lambda: float = 0.7,
+                 mmr_candidate_multiplier: int = 4,
+                 retrieval_cache: Optional[RetrievalCache] = None,
+                 summary_builder: Optional[DocumentSummaryBuilder] = None,
+                 request_timeout: float = 30.0,
+                 fanout_per_document: int = 0,
+                 fanout_max_shards: int = 8,
+                 response_cache: Optional[LLMResponseCache] = None):
         """
         Initialize RAG service
         
@@ -21,25 +58,84 @@ class RAGService:
             embedding_service: Service for generating embeddings
             vector_storage: Service for storing and retrieving vectors
             ai_model: AI model for generating responses (optional)
+            answer_cache: Semantic cache for generated answers (optional)
+            llm_executor: Shared executor for AI model calls (optional)
+            context_packer: Packer that fits retrieved chunks into a token budget (optional)
+            context_token_budget: Token budget for packed context (defaults to the packer's)
+            mmr_lambda: MMR relevance/diversity trade-off (1.0 disables reranking)
+            mmr_candidate_multiplier: Candidate pool size as a multiple of the requested results
+            retrieval_cache: Cache for vector search results (optional)
+            summary_builder: Builder for precomputed document summaries (optional)
+            request_timeout: Default end-to-end time budget for a query in seconds
+            fanout_per_document: Per-document result quota for agent-wide retrieval (0 searches globally)
+            fanout_max_shards: Maximum number of concurrent document-group searches when fanning out
+            response_cache: Prompt-level cache for model responses (optional)
         """
         self.embedding_service = embedding_service
         self.vector_storage = vector_storage
         self.ai_model = ai_model
+        self.answer_cache = answer_cache
+        self.llm_executor = llm_executor or LLMExecutor()
+        self.context_packer = context_packer or ContextPacker()
+        self.context_token_budget = context_token_budget
+        self.mmr_lambda = mmr_lambda
+        self.mmr_candidate_multiplier = mmr_candidate_multiplier
+        self.retrieval_cache = retrieval_cache
+        self.summary_builder = summary_builder or DocumentSummaryBuilder()
+        self.request_timeout = request_timeout
+        self.fanout_per_document = fanout_per_document
+        self.fanout_max_shards = max(fanout_max_shards, 1)
+        self._document_ids: Dict[str, Tuple[int, List[str]]] = {}
+        self.response_cache = response_cache
         logger.info("Initialized RAGService")
     
+    async def _embed_query(self, query: str, deadline: Optional[Deadline] = None) -> Optional[List[float]]:
+        """
+        Embed a query within the remaining request time
+        
+        Args:
+            query: Query text
+            deadline: Request deadline (optional)
+            
+        Returns:
+            Query embedding, or None if it failed or ran out of time
+        """
+        if deadline is None:
+            return await self.embedding_service.generate_embedding(query)
+        
+        try:
+            return await asyncio.wait_for(self.embedding_service.generate_embedding(query),
+                                          timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.warning(f"Query embedding ran out of time ({deadline.timeout}s deadline)")
+            return None
+    
     async def retrieve_relevant_context(self, query: str, agent_id: str, 
                                       document_id: Optional[str] = None,
                                       max_results: int = 5,
-                                      similarity_threshold: float = 0.5) -> List[Dict[str, Any]]:
+                                      similarity_threshold: float = 0.5,
+                                      query_embedding: Optional[List[float]] = None,
+                                      mmr_lambda: Optional[float] = None,
+                                      deadline: Optional[Deadline] = None,
+                                      per_document: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Retrieve relevant context for a query using semantic search
         
+        A larger candidate pool is fetched with its vectors and reranked with
+        maximal marginal relevance, so near-duplicate chunks are not all returned.
+        With a per-document quota, agent-wide searches fan out over the agent's
+        documents so one large document cannot fill every slot.
+        
         Args:
             query: User query/question
             agent_id: AI Agent ID
             document_id: Optional specific document ID to search in
             max_results: Maximum number of results to return
             similarity_threshold: Minimum similarity score threshold
+            query_embedding: Precomputed query embedding (optional)
+            mmr_lambda: MMR trade-off override (defaults to the service setting)
+            deadline: Request deadline bounding embedding and search (optional)
+            per_document: Per-document result quota override (defaults to the service setting)
             
         Returns:
             List of relevant context chunks
@@ -47,25 +143,58 @@ class RAGService:
         try:
             logger.info(f"Retrieving context for query: {query[:100]}...")
             
-            # Generate embedding for the query
-            query_embedding = await self.embedding_service.generate_embedding(query)
+            mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+            rerank = mmr_lambda < 1.0 and self.mmr_candidate_multiplier > 1
+            per_document = self.fanout_per_document if per_document is None else per_document
+            fan_out = document_id is None and per_document > 0
+            
+            # Identical searches against an unchanged corpus skip embedding and SQL
+            corpus_version = await self.vector_storage.get_corpus_version(agent_id)
+            cache_key = None
+            if self.retrieval_cache:
+                cache_key = self._context_cache_key(query, agent_id, document_id, max_results,
+                                                    similarity_threshold, mmr_lambda if rerank else None,
+                                                    per_document if fan_out else None)
+                cached_results = self.retrieval_cache.get(cache_key, corpus_version)
+                if cached_results is not None:
+                    logger.info(f"Retrieval cache hit: {len(cached_results)} context chunks")
+                    return cached_results
+            
+            # Generate embedding for the query unless the caller already has one
+            if not query_embedding:
+                query_embedding = await self._embed_query(query, deadline)
             if not query_embedding:
                 logger.error("Failed to generate query embedding")
                 return []
             
-            # Search for similar embeddings
-            similar_embeddings = await self.vector_storage.search_similar_embeddings(
-                query_embedding=query_embedding,
-                limit=max_results * 2,  # Get more results to filter by threshold
-                agent_id=agent_id,
-                document_id=document_id
-            )
+            if deadline and deadline.expired():
+                logger.warning("Request deadline passed before vector search")
+                return []
+            
+            pool_size = max_results * self.mmr_candidate_multiplier if rerank else max_results
+            if fan_out:
+                candidates = await self._fan_out_search(
+                    query_embedding, agent_id, corpus_version, pool_size, per_document,
+                    similarity_threshold, include_embeddings=rerank, deadline=deadline
+                )
+            else:
+                # Search for similar embeddings above the threshold in a single query
+                candidates = await self.vector_storage.search_similar_embeddings(
+                    query_embedding=query_embedding,
+                    limit=pool_size,
+                    agent_id=agent_id,
+                    document_id=document_id,
+                    min_similarity=similarity_threshold,
+                    include_embeddings=rerank,
+                    timeout=deadline.remaining() if deadline else None
+                )
+            
+            relevant_context = self._select_context(query_embedding, candidates, max_results,
+                                                   mmr_lambda if rerank else None)
             
-            # Filter by similarity threshold and limit results
-            relevant_context = [
-                result for result in similar_embeddings 
-                if result['similarity_score'] >= similarity_threshold
-            ][:max_results]
+            # Empty results are not cached since failed searches also come back empty
+            if cache_key and relevant_context:
+                self.retrieval_cache.put(cache_key, corpus_version, relevant_context)
             
             logger.info(f"Retrieved {len(relevant_context)} relevant context chunks")
             return relevant_context
@@ -74,76 +203,246 @@ class RAGService:
             logger.error(f"Failed to retrieve relevant context: {e}")
             return []
     
+    async def _fan_out_search(self, query_embedding: List[float], agent_id: str, corpus_version: int,
+                              pool_size: int, per_document: int, similarity_threshold: float,
+                              include_embeddings: bool, deadline: Optional[Deadline]) -> List[Dict[str, Any]]:
+        """
+        Search each of an agent's documents concurrently and merge the rankings
+        
+        Documents are split into at most fanout_max_shards groups; every group is
+        one query returning up to `per_document` rows per document, and the
+        groups run concurrently, so latency stays flat as documents are added.
+        
+        Args:
+            query_embedding: Query embedding vector
+            agent_id: AI Agent ID
+            corpus_version: Current corpus version of the agent
+            pool_size: Number of candidates to return
+            per_document: Maximum number of candidates from each document
+            similarity_threshold: Minimum similarity score threshold
+            include_embeddings: Whether candidates need their vectors
+            deadline: Request deadline (optional)
+            
+        Returns:
+            Candidates from all documents, most similar first
+        """
+        document_ids = await self._get_document_ids(agent_id, corpus_version)
+        if not document_ids:
+            return []
+        
+        shard_count = min(self.fanout_max_shards, len(document_ids))
+        shards = [document_ids[i::shard_count] for i in range(shard_count)]
+        timeout = deadline.remaining() if deadline else None
+        
+        shard_results = await asyncio.gather(*(
+            self.vector_storage.search_similar_embeddings_per_document(
+                query_embedding, shard, per_document,
+                min_similarity=similarity_threshold,
+                include_embeddings=include_embeddings,
+                timeout=timeout
+            )
+            for shard in shards
+        ))
+        
+        # Each shard is already sorted, so a k-way heap merge gives the global order
+        merged = heapq.merge(*shard_results, key=lambda result: -result['similarity_score'])
+        candidates = list(itertools.islice(merged, pool_size))
+        logger.info(f"Fan-out search over {len(document_ids)} documents in {shard_count} shards: {len(candidates)} candidates")
+        return candidates
+    
+    async def _get_document_ids(self, agent_id: str, corpus_version: int) -> List[str]:
+        """Document IDs of an agent, reloaded only when its corpus changes"""
+        cached = self._document_ids.get(agent_id)
+        if cached and cached[0] == corpus_version:
+            return cached[1]
+        
+        documents = await self.vector_storage.get_agent_documents(agent_id)
+        document_ids = sorted(document['document_id'] for document in documents)
+        if document_ids:
+            self._document_ids[agent_id] = (corpus_version, document_ids)
+        return document_ids
+    
+    @staticmethod
+    def _context_cache_key(query: str, agent_id: str, document_id: Optional[str], max_results: int,
+                           similarity_threshold: float, mmr_lambda: Optional[float],
+                           per_document: Optional[int] = None) -> str:
+        """Retrieval cache key for a context search (mmr_lambda / per_document are None when unused)"""
+        return RetrievalCache.make_key(
+            'context', agent_id, document_id, query, max_results,
+            threshold=similarity_threshold, mmr_lambda=mmr_lambda, per_document=per_document
+        )
+    
+    @staticmethod
+    def _select_context(query_embedding: List[float], candidates: List[Dict[str, Any]], max_results: int,
+                        mmr_lambda: Optional[float]) -> List[Dict[str, Any]]:
+        """
+        Pick the final context chunks from a candidate pool
+        
+        Args:
+            query_embedding: Query embedding vector
+            candidates: Search results, with vectors when reranking
+            max_results: Number of chunks to keep
+            mmr_lambda: MMR trade-off, or None to keep the top results as ranked
+            
+        Returns:
+            Selected chunks without their vectors
+        """
+        if mmr_lambda is not None and len(candidates) > max_results:
+            selected = mmr_select(
+                query_embedding,
+                [candidate['embedding'] for candidate in candidates],
+                k=max_results,
+                lambda_mult=mmr_lambda
+            )
+            candidates = [candidates[i] for i in selected]
+        else:
+            candidates = candidates[:max_results]
+        
+        # Vectors are only needed for reranking
+        return [
+            {key: value for key, value in candidate.items() if key != 'embedding'}
+            for candidate in candidates
+        ]
+    
+    async def build_context(self, query: str, agent_id: str,
+                            document_id: Optional[str] = None,
+                            max_context_chunks: int = 5,
+                            query_embedding: Optional[List[float]] = None,
+                            deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Retrieve and pack context for a query without generating an answer
+        
+        Args:
+            query: User query/question
+            agent_id: AI Agent ID
+            document_id: Optional specific document ID to search in
+            max_context_chunks: Maximum number of context chunks to use
+            query_embedding: Precomputed query embedding (optional)
+            deadline: Request deadline bounding retrieval (optional)
+            
+        Returns:
+            Context dictionary with packed context text, sources and scores
+        """
+        context_chunks = await self.retrieve_relevant_context(
+            query=query,
+            agent_id=agent_id,
+            document_id=document_id,
+            max_results=max_context_chunks,
+            query_embedding=query_embedding,
+            deadline=deadline
+        )
+        return self._context_from_chunks(context_chunks)
+    
+    def _context_from_chunks(self, context_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Pack retrieved chunks into a context dictionary
+        
+        Args:
+            context_chunks: Retrieved context chunks
+            
+        Returns:
+            Context dictionary with packed context text, sources and scores
+        """
+        if not context_chunks:
+            return {
+                'context_used': False,
+                'context_text': "",
+                'sources': [],
+                'similarity_scores': [],
+                'context_chunks_count': 0,
+                'context_tokens': 0,
+                'context_tokens_saved': 0
+            }
+        
+        packed_context = self._pack_context(context_chunks)
+        return {
+            'context_used': True,
+            'context_text': packed_context['context_text'],
+            'sources': context_chunks,
+            'similarity_scores': [chunk['similarity_score'] for chunk in context_chunks],
+            'context_chunks_count': len(context_chunks),
+            'context_tokens': packed_context['tokens_used'],
+            'context_tokens_saved': packed_context['tokens_saved']
+        }
+    
     async def generate_contextual_response(self, query: str, agent_id: str,
                                          document_id: Optional[str] = None,
                                          max_context_chunks: int = 5,
-                                         include_sources: bool = True) -> Dict[str, Any]:
+                                         include_sources: bool = True,
+                                         deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Generate a contextual response using RAG
         
+        Every stage gets what is left of the request deadline. When time runs
+        out, the sources found so far are returned without an answer and the
+        response is marked as degraded.
+        
         Args:
             query: User query/question
             agent_id: AI Agent ID
             document_id: Optional specific document ID to search in
             max_context_chunks: Maximum number of context chunks to use
             include_sources: Whether to include source information
+            deadline: Request deadline (defaults to the service request timeout)
             
         Returns:
             Response dictionary with answer and sources
         """
         try:
             logger.info(f"Generating contextual response for agent {agent_id}")
+            deadline = deadline or Deadline(self.request_timeout)
             
-            # Retrieve relevant context
-            context_chunks = await self.retrieve_relevant_context(
+            # The semantic answer cache needs the query embedding up front (it is
+            # then reused for retrieval); without it, retrieval embeds the query
+            # only on a retrieval cache miss
+            query_embedding = None
+            if self.answer_cache:
+                query_embedding = await self._embed_query(query, deadline)
+                if not query_embedding and deadline.expired():
+                    return self._degraded_response({}, "", 'embedding', include_sources)
+            
+            corpus_version = await self.vector_storage.get_corpus_version(agent_id)
+            
+            if self.answer_cache and query_embedding:
+                cached_response = self.answer_cache.get(
+                    agent_id=agent_id,
+                    query_embedding=query_embedding,
+                    corpus_version=corpus_version,
+                    document_id=document_id,
+                    max_context_chunks=max_context_chunks
+                )
+                if cached_response:
+                    if not include_sources:
+                        cached_response['sources'] = []
+                    cached_response['cached'] = True
+                    return cached_response
+            
+            # Retrieve relevant context packed within the token budget
+            context = await self.build_context(
                 query=query,
                 agent_id=agent_id,
                 document_id=document_id,
-                max_results=max_context_chunks
+                max_context_chunks=max_context_chunks,
+                query_embedding=query_embedding,
+                deadline=deadline
             )
             
-            if not context_chunks:
-                return {
-                    'answer': "I don't have enough relevant information in the uploaded documents to answer this question accurately. Please try rephrasing your question or upload more relevant documents.",
-                    'sources': [],
-                    'context_used': False
-                }
+            response, answer_generated = await self._answer_from_context(query, agent_id, context, deadline)
             
-            # Prepare context for the AI model
-            context_text = self._prepare_context_text(context_chunks)
+            # Only cache real model answers, never fallbacks
+            if self.answer_cache and query_embedding and answer_generated:
+                self.answer_cache.put(
+                    agent_id=agent_id,
+                    query_embedding=query_embedding,
+                    corpus_version=corpus_version,
+                    response=response,
+                    document_id=document_id,
+                    max_context_chunks=max_context_chunks
+                )
             
-            # Create a prompt that includes the context
-            rag_prompt = self._create_rag_prompt(query, context_text, agent_id)
-            
-            # Generate AI response if model is available
-            if self.ai_model:
-                try:
-                    logger.info("Generating AI response with context...")
-                    loop = asyncio.get_event_loop()
-                    with ThreadPoolExecutor() as executor:
-                        future = executor.submit(lambda: self.ai_model.generate_content(rag_prompt))
-                        ai_response = await loop.run_in_executor(None, lambda: future.result(timeout=30.0))
-                    
-                    if ai_response and ai_response.text:
-                        answer = ai_response.text
-                        logger.info(f"Generated AI response: {len(answer)} characters")
-                    else:
-                        answer = "I couldn't generate a proper response. Here's the context I found:\n\n" + context_text
-                        logger.warning("AI model returned empty response")
-                except Exception as e:
-                    logger.error(f"AI model generation failed: {e}")
-                    answer = "I encountered an error while generating a response. Here's the context I found:\n\n" + context_text
-            else:
-                answer = "AI model not available. Here's the context I found:\n\n" + context_text
-                logger.warning("No AI model available for response generation")
-            
-            return {
-                'answer': answer,
-                'sources': context_chunks if include_sources else [],
-                'context_used': True,
-                'context_chunks_count': len(context_chunks),
-                'context_text': context_text
-            }
+            if not include_sources:
+                response = {**response, 'sources': []}
+            return response
             
         except Exception as e:
             logger.error(f"Failed to generate contextual response: {e}")
@@ -154,32 +453,501 @@ class RAGService:
                 'error': str(e)
             }
     
-    def _prepare_context_text(self, context_chunks: List[Dict[str, Any]]) -> str:
+    async def generate_contextual_responses_batch(self, queries: List[str], agent_id: str,
+                                                  document_id: Optional[str] = None,
+                                                  max_context_chunks: int = 5,
+                                                  include_sources: bool = True,
+                                                  deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """
-        Prepare context text from retrieved chunks
+        Generate contextual responses for several questions to one agent
         
         Args:
-            context_chunks: List of context chunks
+            queries: User questions
+            agent_id: AI Agent ID
+            document_id: Optional specific document ID to search in
+            max_context_chunks: Maximum number of context chunks per question
+            include_sources: Whether to include source information
+            deadline: Request deadline for the whole batch (defaults to the service request timeout)
             
         Returns:
-            Formatted context text
+            Response dictionaries in the order of the questions
+        """
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        async for index, response in self.iter_contextual_responses_batch(
+            queries, agent_id, document_id, max_context_chunks, include_sources, deadline
+        ):
+            responses[index] = response
+        return responses
+    
+    async def iter_contextual_responses_batch(self, queries: List[str], agent_id: str,
+                                              document_id: Optional[str] = None,
+                                              max_context_chunks: int = 5,
+                                              include_sources: bool = True,
+                                              deadline: Optional[Deadline] = None,
+                                              similarity_threshold: float = 0.5) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
         """
+        Answer several questions to one agent, sharing the retrieval work
+        
+        All questions are embedded in one batched call and searched with one
+        multi-query vector search. Answers are then generated concurrently under
+        the LLM executor's concurrency cap and yielded as each one completes.
+        Repeated questions are answered once.
+        
+        Args:
+            queries: User questions
+            agent_id: AI Agent ID
+            document_id: Optional specific document ID to search in
+            max_context_chunks: Maximum number of context chunks per question
+            include_sources: Whether to include source information
+            deadline: Request deadline for the whole batch (defaults to the service request timeout)
+            similarity_threshold: Minimum similarity score threshold
+            
+        Yields:
+            Tuples of the question's index and its response dictionary
+        """
+        deadline = deadline or Deadline(self.request_timeout)
+        logger.info(f"Generating batch of {len(queries)} contextual responses for agent {agent_id}")
+        
+        def finish(response: Dict[str, Any]) -> Dict[str, Any]:
+            return response if include_sources else {**response, 'sources': []}
+        
+        indexes: Dict[str, List[int]] = {}
+        for index, query in enumerate(queries):
+            indexes.setdefault(query, []).append(index)
+        unique_queries = list(indexes)
+        
+        # One upstream call embeds every question
         try:
-            context_parts = []
+            embeddings = await asyncio.wait_for(self.embedding_service.embed_texts(unique_queries),
+                                                timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.warning(f"Batch query embedding ran out of time ({deadline.timeout}s deadline)")
+            for index in range(len(queries)):
+                yield index, self._degraded_response({}, "", 'embedding', include_sources)
+            return
+        except Exception as e:
+            logger.error(f"Failed to embed batch queries: {e}")
+            for index in range(len(queries)):
+                yield index, {
+                    'answer': "I encountered an error while processing your question. Please try again.",
+                    'sources': [],
+                    'context_used': False,
+                    'error': str(e)
+                }
+            return
+        query_embeddings = dict(zip(unique_queries, embeddings))
+        
+        corpus_version = await self.vector_storage.get_corpus_version(agent_id)
+        rerank = self.mmr_lambda < 1.0 and self.mmr_candidate_multiplier > 1
+        mmr_lambda = self.mmr_lambda if rerank else None
+        
+        contexts: Dict[str, List[Dict[str, Any]]] = {}
+        to_search: List[str] = []
+        pending: List[str] = []
+        for query in unique_queries:
+            if self.answer_cache:
+                cached_response = self.answer_cache.get(
+                    agent_id=agent_id,
+                    query_embedding=query_embeddings[query],
+                    corpus_version=corpus_version,
+                    document_id=document_id,
+                    max_context_chunks=max_context_chunks
+                )
+                if cached_response:
+                    for index in indexes[query]:
+                        yield index, finish({**cached_response, 'cached': True})
+                    continue
             
-            for i, chunk in enumerate(context_chunks, 1):
-                source_info = f"[Source {i}: {chunk.get('file_name', 'Unknown')}"
-                if chunk.get('page_number'):
-                    source_info += f", Page {chunk['page_number']}"
-                source_info += f", Similarity: {chunk['similarity_score']:.2f}]"
+            pending.append(query)
+            if self.retrieval_cache:
+                cached_results = self.retrieval_cache.get(
+                    self._context_cache_key(query, agent_id, document_id, max_context_chunks,
+                                            similarity_threshold, mmr_lambda),
+                    corpus_version
+                )
+                if cached_results is not None:
+                    contexts[query] = cached_results
+                    continue
+            to_search.append(query)
+        
+        # One round trip searches for every remaining question
+        if to_search and not deadline.expired():
+            candidate_lists = await self.vector_storage.search_similar_embeddings_multi(
+                [query_embeddings[query] for query in to_search],
+                limit=max_context_chunks * self.mmr_candidate_multiplier if rerank else max_context_chunks,
+                agent_id=agent_id,
+                document_id=document_id,
+                min_similarity=similarity_threshold,
+                include_embeddings=rerank,
+                timeout=deadline.remaining()
+            )
+            for query, candidates in zip(to_search, candidate_lists):
+                contexts[query] = self._select_context(query_embeddings[query], candidates,
+                                                       max_context_chunks, mmr_lambda)
+                if self.retrieval_cache and contexts[query]:
+                    self.retrieval_cache.put(
+                        self._context_cache_key(query, agent_id, document_id, max_context_chunks,
+                                                similarity_threshold, mmr_lambda),
+                        corpus_version,
+                        contexts[query]
+                    )
+        
+        async def answer(query: str) -> Tuple[str, Dict[str, Any]]:
+            try:
+                context = self._context_from_chunks(contexts.get(query, []))
+                response, answer_generated = await self._answer_from_context(query, agent_id, context, deadline)
                 
-                context_parts.append(f"{source_info}\n{chunk['content']}\n")
+                if self.answer_cache and answer_generated:
+                    self.answer_cache.put(
+                        agent_id=agent_id,
+                        query_embedding=query_embeddings[query],
+                        corpus_version=corpus_version,
+                        response=response,
+                        document_id=document_id,
+                        max_context_chunks=max_context_chunks
+                    )
+                return query, response
+            except Exception as e:
+                logger.error(f"Failed to generate contextual response in batch: {e}")
+                return query, {
+                    'answer': "I encountered an error while processing your question. Please try again.",
+                    'sources': [],
+                    'context_used': False,
+                    'error': str(e)
+                }
+        
+        tasks = [asyncio.ensure_future(answer(query)) for query in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                query, response = await next_done
+                for index in indexes[query]:
+                    yield index, finish(response)
+        finally:
+            # Stop generating for a client that went away
+            for task in tasks:
+                task.cancel()
+    
+    async def _answer_from_context(self, query: str, agent_id: str, context: Dict[str, Any],
+                                   deadline: Deadline) -> Tuple[Dict[str, Any], bool]:
+        """
+        Generate the answer for a query from already retrieved context
+        
+        Args:
+            query: User query/question
+            agent_id: AI Agent ID
+            context: Context from build_context
+            deadline: Request deadline
             
-            return "\n".join(context_parts)
+        Returns:
+            Tuple of the response dictionary (with sources) and whether the model produced the answer
+        """
+        if not context['context_used'] and deadline.expired():
+            return self._degraded_response({}, "", 'retrieval', True), False
+        
+        if not context['context_used']:
+            return {
+                'answer': NO_CONTEXT_ANSWER,
+                'sources': [],
+                'context_used': False
+            }, False
+        
+        context_chunks = context['sources']
+        context_text = context['context_text']
+        
+        # Create a prompt that includes the context
+        rag_prompt = self._create_rag_prompt(query, context_text, agent_id)
+        
+        # Not enough time left for the model: hand back the sources right away
+        if self.ai_model and deadline.remaining() < MIN_GENERATION_TIME:
+            logger.warning(f"Skipping generation, {deadline.remaining():.2f}s left of the request deadline")
+            return self._degraded_response(context, context_text, 'generation', True), False
+        
+        # Generate AI response if model is available
+        answer_generated = False
+        if self.ai_model:
+            try:
+                logger.info("Generating AI response with context...")
+                ai_text = await generate_text(
+                    self.ai_model,
+                    rag_prompt,
+                    lambda: self.llm_executor.run(
+                        lambda: self.ai_model.generate_content(rag_prompt),
+                        priority=PRIORITY_INTERACTIVE,
+                        timeout=deadline.budget(cap=GENERATION_TIMEOUT)
+                    ),
+                    cache=self.response_cache,
+                    endpoint='rag_query'
+                )
+                
+                if ai_text:
+                    answer = ai_text
+                    answer_generated = True
+                    logger.info(f"Generated AI response: {len(answer)} characters")
+                else:
+                    answer = "I couldn't generate a proper response. Here's the context I found:\n\n" + context_text
+                    logger.warning("AI model returned empty response")
+            except TimeoutError as e:
+                logger.warning(f"AI model generation ran out of time: {e}")
+                return self._degraded_response(context, context_text, 'generation', True), False
+            except Exception as e:
+                logger.error(f"AI model generation failed: {e}")
+                answer = "I encountered an error while generating a response. Here's the context I found:\n\n" + context_text
+        else:
+            answer = "AI model not available. Here's the context I found:\n\n" + context_text
+            logger.warning("No AI model available for response generation")
+        
+        return {
+            'answer': answer,
+            'sources': context_chunks,
+            'context_used': True,
+            'context_chunks_count': len(context_chunks),
+            'context_text': context_text,
+            'context_tokens': context['context_tokens'],
+            'context_tokens_saved': context['context_tokens_saved']
+        }, answer_generated
+    
+    async def generate_contextual_response_stream(self, query: str, agent_id: str,
+                                                document_id: Optional[str] = None,
+                                                max_context_chunks: int = 5,
+                                                include_sources: bool = True,
+                                                deadline: Optional[Deadline] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a contextual response using RAG, streaming the answer as it is produced
+        
+        Yields a 'sources' event first, then 'token' events as the model streams
+        text, and finally a 'done' event (or an 'error' event on failure). If the
+        request deadline passes, the stream ends with a 'done' event marked as
+        degraded, keeping whatever text was already sent.
+        
+        Args:
+            query: User query/question
+            agent_id: AI Agent ID
+            document_id: Optional specific document ID to search in
+            max_context_chunks: Maximum number of context chunks to use
+            include_sources: Whether to include source information
+            deadline: Request deadline (defaults to the service request timeout)
+            
+        Yields:
+            Event dictionaries with a 'type' key
+        """
+        try:
+            logger.info(f"Streaming contextual response for agent {agent_id}")
+            deadline = deadline or Deadline(self.request_timeout)
+            
+            # As in generate_contextual_response, embed up front only for the answer cache
+            query_embedding = None
+            if self.answer_cache:
+                query_embedding = await self._embed_query(query, deadline)
+                if not query_embedding and deadline.expired():
+                    yield self._sources_event([], include_sources)
+                    yield {'type': 'done', 'answer_length': 0, 'cached': False, 'degraded': True, 'timed_out_stage': 'embedding'}
+                    return
+            
+            corpus_version = await self.vector_storage.get_corpus_version(agent_id)
+            
+            if self.answer_cache and query_embedding:
+                cached_response = self.answer_cache.get(
+                    agent_id=agent_id,
+                    query_embedding=query_embedding,
+                    corpus_version=corpus_version,
+                    document_id=document_id,
+                    max_context_chunks=max_context_chunks
+                )
+                if cached_response:
+                    yield self._sources_event(cached_response['sources'], include_sources, cached=True)
+                    yield {'type': 'token', 'text': cached_response['answer']}
+                    yield {'type': 'done', 'answer_length': len(cached_response['answer']), 'cached': True}
+                    return
+            
+            context = await self.build_context(
+                query=query,
+                agent_id=agent_id,
+                document_id=document_id,
+                max_context_chunks=max_context_chunks,
+                query_embedding=query_embedding,
+                deadline=deadline
+            )
+            context_chunks = context['sources']
+            
+            yield self._sources_event(context_chunks, include_sources)
+            
+            if not context['context_used'] and deadline.expired():
+                yield {'type': 'done', 'answer_length': 0, 'cached': False, 'degraded': True, 'timed_out_stage': 'retrieval'}
+                return
+            
+            if not context['context_used']:
+                yield {'type': 'token', 'text': NO_CONTEXT_ANSWER}
+                yield {'type': 'done', 'answer_length': len(NO_CONTEXT_ANSWER), 'cached': False}
+                return
+            
+            context_text = context['context_text']
+            
+            if not self.ai_model:
+                answer = "AI model not available. Here's the context I found:\n\n" + context_text
+                logger.warning("No AI model available for response generation")
+                yield {'type': 'token', 'text': answer}
+                yield {'type': 'done', 'answer_length': len(answer), 'cached': False}
+                return
+            
+            if deadline.remaining() < MIN_GENERATION_TIME:
+                logger.warning(f"Skipping generation, {deadline.remaining():.2f}s left of the request deadline")
+                yield {'type': 'done', 'answer_length': 0, 'cached': False, 'degraded': True, 'timed_out_stage': 'generation'}
+                return
+            
+            rag_prompt = self._create_rag_prompt(query, context_text, agent_id)
+            answer_parts = []
+            try:
+                async for text in self._stream_model_text(rag_prompt, timeout=deadline.budget(cap=GENERATION_TIMEOUT)):
+                    answer_parts.append(text)
+                    yield {'type': 'token', 'text': text}
+            except TimeoutError as e:
+                # Tokens already sent stay with the client; the partial answer is not cached
+                answer = "".join(answer_parts)
+                logger.warning(f"Streamed generation ran out of time after {len(answer)} characters: {e}")
+                yield {'type': 'done', 'answer_length': len(answer), 'cached': False, 'degraded': True, 'timed_out_stage': 'generation'}
+                return
+            
+            answer = "".join(answer_parts)
+            logger.info(f"Streamed AI response: {len(answer)} characters")
+            
+            if self.answer_cache and query_embedding and answer:
+                self.answer_cache.put(
+                    agent_id=agent_id,
+                    query_embedding=query_embedding,
+                    corpus_version=corpus_version,
+                    response={
+                        'answer': answer,
+                        'sources': context_chunks,
+                        'context_used': True,
+                        'context_chunks_count': len(context_chunks),
+                        'context_text': context_text
+                    },
+                    document_id=document_id,
+                    max_context_chunks=max_context_chunks
+                )
+            
+            yield {'type': 'done', 'answer_length': len(answer), 'cached': False}
             
+        except Exception as e:
+            logger.error(f"Failed to stream contextual response: {e}")
+            yield {
+                'type': 'error',
+                'message': "I encountered an error while processing your question. Please try again.",
+                'error': str(e)
+            }
+    
+    def _degraded_response(self, context: Dict[str, Any], context_text: str, stage: str,
+                           include_sources: bool) -> Dict[str, Any]:
+        """
+        Build the response returned when the request deadline cuts the pipeline short
+        
+        Args:
+            context: Context from build_context (empty if retrieval did not finish)
+            context_text: Packed context text
+            stage: Pipeline stage that ran out of time
+            include_sources: Whether to include source information
+            
+        Returns:
+            Response dictionary with sources but no generated answer
+        """
+        context_chunks = context.get('sources', []) if context else []
+        return {
+            'answer': TIMED_OUT_ANSWER if context_chunks else "I couldn't search your study materials in time. Please try again.",
+            'sources': context_chunks if include_sources else [],
+            'context_used': bool(context_chunks),
+            'context_chunks_count': len(context_chunks),
+            'context_text': context_text,
+            'context_tokens': context.get('context_tokens', 0) if context else 0,
+            'context_tokens_saved': context.get('context_tokens_saved', 0) if context else 0,
+            'degraded': True,
+            'timed_out_stage': stage
+        }
+    
+    def _sources_event(self, context_chunks: List[Dict[str, Any]], include_sources: bool,
+                       cached: bool = False) -> Dict[str, Any]:
+        """Build the leading 'sources' event of a streamed response"""
+        return {
+            'type': 'sources',
+            'sources': context_chunks if include_sources else [],
+            'context_used': bool(context_chunks),
+            'context_chunks_count': len(context_chunks),
+            'similarity_scores': [chunk.get('similarity_score', 0.0) for chunk in context_chunks],
+            'cached': cached
+        }
+    
+    async def _stream_model_text(self, prompt: str, timeout: float = GENERATION_TIMEOUT) -> AsyncIterator[str]:
+        """
+        Stream text from the AI model without blocking the event loop
+        
+        The blocking Gemini stream is consumed on an LLM executor slot and handed
+        over through a queue. Iteration stops early when the consumer goes away
+        or the timeout passes, which also frees the slot.
+        
+        Args:
+            prompt: Prompt to send to the model
+            timeout: Time limit for the whole stream in seconds
+            
+        Yields:
+            Text fragments in the order the model produces them
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stop_requested = threading.Event()
+        
+        def produce():
+            try:
+                response = self.ai_model.generate_content(prompt, stream=True)
+                for chunk in response:
+                    if stop_requested.is_set():
+                        break
+                    if chunk.text:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+        
+        deadline = loop.time() + timeout
+        await self.llm_executor.start(produce, priority=PRIORITY_INTERACTIVE, queue_timeout=timeout)
+        try:
+            while True:
+                item = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop_requested.set()
+    
+    def _pack_context(self, context_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Pack retrieved chunks into token-budgeted context text
+        
+        Args:
+            context_chunks: List of context chunks
+            
+        Returns:
+            Packing result with context_text and token statistics
+        """
+        try:
+            return self.context_packer.pack(context_chunks, token_budget=self.context_token_budget)
         except Exception as e:
             logger.error(f"Failed to prepare context text: {e}")
-            return ""
+            return {'context_text': "", 'tokens_used': 0, 'tokens_saved': 0}
+    
+    def _prepare_context_text(self, context_chunks: List[Dict[str, Any]]) -> str:
+        """
+        Prepare context text from retrieved chunks
+        
+        Args:
+            context_chunks: List of context chunks
+            
+        Returns:
+            Formatted context text
+        """
+        return self._pack_context(context_chunks)['context_text']
     
     def _create_rag_prompt(self, query: str, context_text: str, agent_id: str) -> str:
         """
@@ -232,6 +1000,15 @@ Please provide a comprehensive answer based on the study materials provided, for
         try:
             logger.info(f"Searching documents for: {query[:100]}...")
             
+            corpus_version = await self.vector_storage.get_corpus_version(agent_id)
+            cache_key = None
+            if self.retrieval_cache:
+                cache_key = RetrievalCache.make_key('search', agent_id, document_id, query, max_results)
+                cached_results = self.retrieval_cache.get(cache_key, corpus_version)
+                if cached_results is not None:
+                    logger.info(f"Retrieval cache hit: {len(cached_results)} search results")
+                    return cached_results
+            
             # Generate embedding for the search query
             query_embedding = await self.embedding_service.generate_embedding(query)
             if not query_embedding:
@@ -258,6 +1035,9 @@ Please provide a comprehensive answer based on the study materials provided, for
                     'metadata': result['metadata']
                 })
             
+            if cache_key and formatted_results:
+                self.retrieval_cache.put(cache_key, corpus_version, formatted_results)
+            
             logger.info(f"Found {len(formatted_results)} search results")
             return formatted_results
             
@@ -265,10 +1045,138 @@ Please provide a comprehensive answer based on the study materials provided, for
             logger.error(f"Failed to search documents: {e}")
             return []
     
+    async def refresh_document_summaries(self, chunk_ids: Optional[List[str]] = None,
+                                         documents: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Recompute and store summaries for documents whose embeddings changed
+        
+        Args:
+            chunk_ids: IDs of chunks whose embeddings were stored (optional)
+            documents: Documents to refresh as dictionaries with document_id and agent_id (optional)
+            
+        Returns:
+            Number of summaries refreshed
+        """
+        try:
+            if documents is None:
+                documents = await self.vector_storage.get_documents_for_chunks(chunk_ids or [])
+            
+            refreshed = 0
+            for document in documents:
+                chunks = await self.vector_storage.fetch_document_chunks(document['document_id'])
+                if not chunks:
+                    continue
+                
+                summary = self.summary_builder.build(chunks)
+                summary['file_name'] = chunks[0].get('file_name')
+                summary['original_name'] = chunks[0].get('original_name')
+                
+                if await self.vector_storage.upsert_document_summary(document['document_id'], document['agent_id'], summary):
+                    refreshed += 1
+            
+            logger.info(f"Refreshed {refreshed} document summaries")
+            return refreshed
+            
+        except Exception as e:
+            logger.error(f"Failed to refresh document summaries: {e}")
+            return 0
+    
+    async def backfill_document_summaries(self, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Summarise the embedded documents that have no stored summary
+        
+        Args:
+            progress: Optional dictionary updated with documents_found and summaries_refreshed
+            
+        Returns:
+            Dictionary with documents_found and summaries_refreshed
+        """
+        progress = progress if progress is not None else {}
+        documents = await self.vector_storage.get_unsummarised_documents()
+        progress['documents_found'] = len(documents)
+        progress['summaries_refreshed'] = await self.refresh_document_summaries(documents=documents) if documents else 0
+        return dict(progress)
+    
+    async def update_document_chunks(self, document_id: str, agent_id: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Incrementally re-ingest a new version of a stored document
+        
+        Chunks are matched to the stored ones by content hash, so only new or
+        changed chunks are embedded and stored. Unchanged chunks keep their
+        embeddings (taking the new index and page), and chunks that are no
+        longer in the document are deleted.
+        
+        Args:
+            document_id: Document ID
+            agent_id: AI Agent ID
+            chunks: Chunks of the new version from PDFProcessor
+            
+        Returns:
+            Dictionary with success, chunks_unchanged, chunks_added,
+            chunks_deleted and chunks_embedded (and error on failure, including
+            when the document belongs to another agent)
+        """
+        try:
+            # Only the owning agent may change a document's chunks
+            if await self.vector_storage.get_document_agent_id(document_id) != agent_id:
+                return {'success': False, 'error': f"Document {document_id} does not belong to agent {agent_id}"}
+            
+            stored = await self.vector_storage.get_document_chunk_hashes(document_id)
+            if stored is None:
+                return {'success': False, 'error': f"Failed to read stored chunks of document {document_id}"}
+            
+            # Identical chunks may repeat within a document, so match them one to one
+            stored_by_hash = defaultdict(deque)
+            for row in stored:
+                stored_by_hash[row['content_hash'] or content_hash(row['content'])].append(row)
+            
+            kept, to_embed = [], []
+            for chunk in chunks:
+                matches = stored_by_hash.get(chunk.get('content_hash') or content_hash(chunk['content']))
+                if matches:
+                    row = matches.popleft()
+                    kept.append({'chunk_id': row['chunk_id'], 'chunk': chunk})
+                    if not row['embedded']:
+                        to_embed.append({'chunk_id': row['chunk_id'], 'chunk': chunk})
+                else:
+                    to_embed.append({'chunk_id': None, 'chunk': chunk})
+            deleted = [row['chunk_id'] for rows in stored_by_hash.values() for row in rows]
+            
+            texts = [item['chunk']['content'] for item in to_embed]
+            for start in range(0, len(texts), DOCUMENT_EMBEDDING_BATCH_SIZE):
+                embeddings = await self.embedding_service.embed_texts(texts[start:start + DOCUMENT_EMBEDDING_BATCH_SIZE])
+                for item, embedding in zip(to_embed[start:], embeddings):
+                    item['embedding'] = embedding
+            
+            if not await self.vector_storage.apply_document_chunk_diff(
+                document_id, kept, to_embed, deleted, model=self.embedding_service.model
+            ):
+                return {'success': False, 'error': f"Failed to store chunks of document {document_id}"}
+            
+            await self.refresh_document_summaries(documents=[{'document_id': document_id, 'agent_id': agent_id}])
+            
+            result = {
+                'success': True,
+                'chunks_unchanged': len(kept),
+                'chunks_added': len(chunks) - len(kept),
+                'chunks_deleted': len(deleted),
+                'chunks_embedded': len(to_embed)
+            }
+            logger.info(f"Incrementally updated document {document_id}: {result}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Failed to update document {document_id}: {e}")
+            return {'success': False, 'error': str(e)}
+    
     async def get_document_summary(self, agent_id: str, document_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Get a summary of available documents and their content
         
+        Only reads the summaries precomputed when embeddings were stored;
+        documents ingested before summaries existed are summarised once by
+        backfill_document_summaries.
+        
         Args:
             agent_id: AI Agent ID
             document_id: Optional specific document ID
@@ -277,21 +1185,54 @@ Please provide a comprehensive answer based on the study materials provided, for
             Document summary information
         """
         try:
-            # Get embedding statistics
-            stats = await self.vector_storage.get_embedding_stats(agent_id)
+            summaries = await self.vector_storage.get_document_summaries(agent_id, document_id)
             
-            # Get sample content from documents
-            sample_query = "introduction overview summary main topics"
-            sample_results = await self.search_documents(
-                query=sample_query,
-                agent_id=agent_id,
-                document_id=document_id,
-                max_results=5
-            )
+            documents_info = []
+            sample_content = []
+            total_embeddings = 0
+            total_chunks = 0
+            dimensions = 0
+            
+            for row in summaries:
+                summary = row['summary']
+                total_embeddings += summary.get('embedding_count', 0)
+                total_chunks += summary.get('chunk_count', 0)
+                dimensions = dimensions or summary.get('dimensions', 0)
+                
+                documents_info.append({
+                    'document_id': row['document_id'],
+                    'file_name': summary.get('file_name'),
+                    'original_name': summary.get('original_name'),
+                    'chunk_count': summary.get('chunk_count', 0),
+                    'token_count': summary.get('token_count', 0),
+                    'keywords': summary.get('keywords', []),
+                    'updated_at': row['updated_at']
+                })
+                
+                for chunk in summary.get('representative_chunks', []):
+                    sample_content.append({
+                        'content': chunk['content'],
+                        'file_name': summary.get('file_name'),
+                        'page_number': chunk.get('page_number'),
+                        'relevance_score': chunk.get('centrality', 0.0),
+                        'chunk_index': chunk.get('chunk_index'),
+                        'metadata': chunk.get('metadata')
+                    })
+            
+            sample_content.sort(key=lambda chunk: chunk['relevance_score'], reverse=True)
+            
+            stats = {
+                'total_embeddings': total_embeddings,
+                'unique_chunks': total_chunks,
+                'unique_agents': 1 if summaries else 0,
+                'unique_documents': len(summaries),
+                'avg_dimensions': float(dimensions)
+            }
             
             return {
                 'stats': stats,
-                'sample_content': sample_results,
+                'sample_content': sample_content[:self.summary_builder.sample_size],
+                'documents': documents_info,
                 'agent_id': agent_id,
                 'document_id': document_id
             }
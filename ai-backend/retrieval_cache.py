@@ -0,0 +1,138 @@
+"""
+Retrieval Cache for PrepVista
+Caches vector search results per agent, invalidated by corpus version
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize retrieval cache
+
+        Args:
+            max_entries: Maximum number of cached result lists
+            max_bytes: Approximate upper bound on memory held by cached results
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.evictions = 0
+        logger.info(f"Initialized RetrievalCache (max_entries={max_entries}, max_bytes={max_bytes})")
+
+    @staticmethod
+    def make_key(kind: str, agent_id: str, document_id: Optional[str], query: str, k: int, **params: Any) -> str:
+        """
+        Build a cache key from the search parameters
+
+        Args:
+            kind: Kind of retrieval (e.g. 'context' or 'search')
+            agent_id: AI Agent ID
+            document_id: Optional document ID filter
+            query: Query text
+            k: Number of requested results
+            **params: Any other parameters that change the results
+
+        Returns:
+            Hex digest identifying the search
+        """
+        payload = json.dumps([kind, agent_id, document_id, query, k, sorted(params.items())], default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _estimate_size(results: List[Dict[str, Any]]) -> int:
+        return len(json.dumps(results, default=str))
+
+    def get(self, key: str, corpus_version: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get cached results if they were computed against the current corpus
+
+        Args:
+            key: Cache key from make_key
+            corpus_version: Current corpus version of the agent
+
+        Returns:
+            Cached results or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry['corpus_version'] != corpus_version:
+                self._remove(key)
+                self.invalidated += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry['results'])
+
+    def put(self, key: str, corpus_version: int, results: List[Dict[str, Any]]) -> None:
+        """
+        Store results for a search
+
+        Args:
+            key: Cache key from make_key
+            corpus_version: Corpus version the results were computed against
+            results: Search results to cache
+        """
+        size = self._estimate_size(results)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = {
+                'corpus_version': corpus_version,
+                'results': list(results),
+                'size': size
+            }
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'memory_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'invalidated': self.invalidated,
+                'evictions': self.evictions
+            }
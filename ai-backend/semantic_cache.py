@@ -0,0 +1,183 @@
+"""
+Semantic Answer Cache for PrepVista
+Reuses RAG answers for queries that are semantically close to earlier ones
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticAnswerCache:
+    def __init__(self, max_distance: float = 0.05, ttl_seconds: float = 3600.0,
+                 max_entries_per_agent: int = 256, max_agents: int = 1024):
+        """
+        Initialize semantic answer cache
+
+        Args:
+            max_distance: Maximum cosine distance between queries to count as a hit
+            ttl_seconds: Time after which a cached answer expires
+            max_entries_per_agent: Maximum cached answers kept for one agent
+            max_agents: Maximum number of agents with cached answers
+        """
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_agent = max_entries_per_agent
+        self.max_agents = max_agents
+
+        # agent_id -> OrderedDict of entry_id -> entry, both in LRU order
+        self._agents: "OrderedDict[str, OrderedDict[int, Dict[str, Any]]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+        logger.info(f"Initialized SemanticAnswerCache (max_distance={max_distance}, ttl={ttl_seconds}s)")
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    @staticmethod
+    def _scope(document_id: Optional[str], max_context_chunks: int) -> Tuple[Optional[str], int]:
+        return (document_id, max_context_chunks)
+
+    def get(self, agent_id: str, query_embedding: List[float], corpus_version: int,
+            document_id: Optional[str] = None, max_context_chunks: int = 5) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer for a semantically similar query
+
+        Args:
+            agent_id: AI Agent ID
+            query_embedding: Embedding of the new query
+            corpus_version: Current corpus version of the agent's documents
+            document_id: Optional document the query is restricted to
+            max_context_chunks: Number of context chunks the answer was built from
+
+        Returns:
+            Cached response dictionary or None on a miss
+        """
+        query_vector = self._normalize(query_embedding)
+        if query_vector is None:
+            return None
+
+        scope = self._scope(document_id, max_context_chunks)
+        now = time.time()
+
+        with self._lock:
+            entries = self._agents.get(agent_id)
+            if not entries:
+                self.misses += 1
+                return None
+
+            # Drop entries that are stale before comparing vectors
+            for entry_id in list(entries.keys()):
+                entry = entries[entry_id]
+                if entry['corpus_version'] != corpus_version:
+                    del entries[entry_id]
+                    self.invalidated += 1
+                elif now - entry['created_at'] > self.ttl_seconds:
+                    del entries[entry_id]
+                    self.expired += 1
+
+            candidates = [(entry_id, entry) for entry_id, entry in entries.items() if entry['scope'] == scope]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([entry['vector'] for _, entry in candidates])
+            distances = 1.0 - matrix @ query_vector
+            best = int(np.argmin(distances))
+
+            if distances[best] > self.max_distance:
+                self.misses += 1
+                return None
+
+            entry_id, entry = candidates[best]
+            entries.move_to_end(entry_id)
+            self._agents.move_to_end(agent_id)
+            self.hits += 1
+            logger.info(f"Semantic cache hit for agent {agent_id} (distance={distances[best]:.4f})")
+            return dict(entry['response'])
+
+    def put(self, agent_id: str, query_embedding: List[float], corpus_version: int,
+            response: Dict[str, Any], document_id: Optional[str] = None,
+            max_context_chunks: int = 5) -> None:
+        """
+        Store an answer for a query
+
+        Args:
+            agent_id: AI Agent ID
+            query_embedding: Embedding of the answered query
+            corpus_version: Corpus version the answer was generated against
+            response: Response dictionary to cache
+            document_id: Optional document the query was restricted to
+            max_context_chunks: Number of context chunks the answer was built from
+        """
+        query_vector = self._normalize(query_embedding)
+        if query_vector is None:
+            return
+
+        with self._lock:
+            entries = self._agents.get(agent_id)
+            if entries is None:
+                entries = OrderedDict()
+                self._agents[agent_id] = entries
+            self._agents.move_to_end(agent_id)
+
+            self._next_id += 1
+            entries[self._next_id] = {
+                'vector': query_vector,
+                'scope': self._scope(document_id, max_context_chunks),
+                'corpus_version': corpus_version,
+                'created_at': time.time(),
+                'response': dict(response)
+            }
+
+            while len(entries) > self.max_entries_per_agent:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+            while len(self._agents) > self.max_agents:
+                _, evicted = self._agents.popitem(last=False)
+                self.evictions += len(evicted)
+
+    def invalidate_agent(self, agent_id: str) -> None:
+        """Drop all cached answers for an agent"""
+        with self._lock:
+            entries = self._agents.pop(agent_id, None)
+            if entries:
+                self.invalidated += len(entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Statistics dictionary
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': sum(len(entries) for entries in self._agents.values()),
+                'agents': len(self._agents),
+                'expired': self.expired,
+                'invalidated': self.invalidated,
+                'evictions': self.evictions,
+                'max_distance': self.max_distance,
+                'ttl_seconds': self.ttl_seconds
+            }
@@ -3,16 +3,21 @@ Vector Storage Service for PrepVista
 Handles storing and retrieving embeddings using pgvector
 """
 
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Optional, Tuple
+import uuid
+from typing import List, Dict, Any, Optional, Tuple, Awaitable, Callable
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json, execute_batch, execute_values
 import numpy as np
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# "CorpusVersion" row whose version applies to every agent
+ALL_AGENTS = '*'
+
 class VectorStorageService:
     def __init__(self, database_url: Optional[str] = None):
         """
@@ -26,8 +31,81 @@ class VectorStorageService:
         if not self.database_url:
             raise ValueError("Database URL not provided")
         
+        # Handed out when the version lookup fails, never matching a cached entry
+        self._unknown_versions = itertools.count(-1, -1)
+        
         logger.info("Initialized VectorStorageService")
     
+    async def get_corpus_version(self, agent_id: str) -> int:
+        """
+        Get the current corpus version for an agent
+        
+        Versions live in the "CorpusVersion" table, so a change made by any
+        worker process, or a document created or deleted by the frontend, is
+        seen by all of them.
+        
+        Args:
+            agent_id: AI Agent ID
+            
+        Returns:
+            Version number that changes whenever the agent's embeddings change
+            (a fresh negative number if the lookup failed, so caches miss)
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT COALESCE(MAX(version), 0) FROM "CorpusVersion"
+                        WHERE "agentId" IN (%s, %s)
+                    """, (agent_id, ALL_AGENTS))
+                    return cur.fetchone()[0]
+                    
+        except Exception as e:
+            logger.error(f"Failed to read corpus version for agent {agent_id}: {e}")
+            return next(self._unknown_versions)
+    
+    def bump_corpus_version(self, agent_id: Optional[str] = None) -> None:
+        """
+        Mark an agent's corpus (or every corpus when agent_id is None) as changed
+        
+        Args:
+            agent_id: Optional AI Agent ID
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    # One sequence for every row, so the larger of an agent's and the
+                    # all-agents version changes whenever either is bumped
+                    cur.execute("""
+                        INSERT INTO "CorpusVersion" ("agentId", version)
+                        VALUES (%s, nextval('"CorpusVersionSeq"'))
+                        ON CONFLICT ("agentId") DO UPDATE SET version = EXCLUDED.version
+                    """, (agent_id or ALL_AGENTS,))
+                    conn.commit()
+                    
+        except Exception as e:
+            logger.error(f"Failed to bump corpus version for agent {agent_id or 'all agents'}: {e}")
+    
+    def _bump_versions_for_chunks(self, cur, chunk_ids: List[str]) -> None:
+        """Bump corpus versions of the agents owning the given chunks"""
+        if not chunk_ids:
+            return
+        try:
+            cur.execute("""
+                SELECT DISTINCT d."agentId"
+                FROM "DocumentChunk" dc
+                JOIN "Document" d ON dc."documentId" = d.id
+                WHERE dc.id = ANY(%s)
+            """, (list(chunk_ids),))
+            agent_ids = [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            logger.warning(f"Failed to resolve agents for stored chunks, invalidating all corpora: {e}")
+            self.bump_corpus_version()
+            return
+        
+        for agent_id in agent_ids:
+            self.bump_corpus_version(agent_id)
+    
     @contextmanager
     def get_connection(self):
         """Get database connection with proper cleanup"""
@@ -103,6 +181,56 @@ class VectorStorageService:
                         ON "VectorEmbedding" ("chunkId");
                     """)
                     
+                    # Corpus versions for cache invalidation, shared by every worker process
+                    cur.execute('CREATE SEQUENCE IF NOT EXISTS "CorpusVersionSeq";')
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS "CorpusVersion" (
+                            "agentId" TEXT PRIMARY KEY,
+                            version BIGINT NOT NULL
+                        );
+                    """)
+                    
+                    # Documents created or deleted outside this service (e.g. by the
+                    # frontend through Prisma) bump their agent's version too
+                    cur.execute("""
+                        CREATE OR REPLACE FUNCTION bump_document_corpus_version() RETURNS trigger AS $$
+                        BEGIN
+                            IF TG_OP <> 'INSERT' THEN
+                                INSERT INTO "CorpusVersion" ("agentId", version)
+                                VALUES (OLD."agentId", nextval('"CorpusVersionSeq"'))
+                                ON CONFLICT ("agentId") DO UPDATE SET version = EXCLUDED.version;
+                            END IF;
+                            IF TG_OP <> 'DELETE' THEN
+                                INSERT INTO "CorpusVersion" ("agentId", version)
+                                VALUES (NEW."agentId", nextval('"CorpusVersionSeq"'))
+                                ON CONFLICT ("agentId") DO UPDATE SET version = EXCLUDED.version;
+                            END IF;
+                            RETURN NULL;
+                        END;
+                        $$ LANGUAGE plpgsql;
+                    """)
+                    cur.execute('DROP TRIGGER IF EXISTS document_corpus_version ON "Document";')
+                    cur.execute("""
+                        CREATE TRIGGER document_corpus_version
+                        AFTER INSERT OR UPDATE OR DELETE ON "Document"
+                        FOR EACH ROW EXECUTE FUNCTION bump_document_corpus_version();
+                    """)
+                    
+                    # Precomputed per-document summaries, refreshed when embeddings change
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS "DocumentSummary" (
+                            "documentId" TEXT PRIMARY KEY,
+                            "agentId" TEXT NOT NULL,
+                            summary JSONB NOT NULL,
+                            "updatedAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        );
+                    """)
+                    
+                    cur.execute("""
+                        CREATE INDEX IF NOT EXISTS document_summary_agent_id_idx 
+                        ON "DocumentSummary" ("agentId");
+                    """)
+                    
                     conn.commit()
                     logger.info("Vector storage tables created successfully")
                     return True
@@ -143,6 +271,7 @@ class VectorStorageService:
                     ))
                     
                     conn.commit()
+                    self._bump_versions_for_chunks(cur, [chunk_id])
                     logger.debug(f"Stored embedding for chunk {chunk_id}")
                     return True
                     
@@ -162,6 +291,7 @@ class VectorStorageService:
         """
         try:
             stored_count = 0
+            stored_chunk_ids = []
             
             with self.get_connection() as conn:
                 with conn.cursor() as cur:
@@ -199,6 +329,7 @@ class VectorStorageService:
                             ))
                             
                             stored_count += 1
+                            stored_chunk_ids.append(chunk_id)
                             
                         except Exception as e:
                             chunk_id = data.get('chunk_id', 'unknown') if isinstance(data, dict) else 'unknown'
@@ -206,6 +337,7 @@ class VectorStorageService:
                             continue
                     
                     conn.commit()
+                    self._bump_versions_for_chunks(cur, stored_chunk_ids)
                     logger.info(f"Stored {stored_count} embeddings out of {len(embeddings_data)}")
                     return stored_count
                     
@@ -215,15 +347,25 @@ class VectorStorageService:
     
     async def search_similar_embeddings(self, query_embedding: List[float], limit: int = 10, 
                                       agent_id: Optional[str] = None, 
-                                      document_id: Optional[str] = None) -> List[Dict[str, Any]]:
+                                      document_id: Optional[str] = None,
+                                      min_similarity: Optional[float] = None,
+                                      include_embeddings: bool = False,
+                                      timeout: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         Search for similar embeddings using cosine similarity
         
+        Returns up to `limit` rows whose similarity is at least `min_similarity`.
+        The cutoff is applied in the database as a cosine distance bound, so
+        callers never need to over-fetch and filter afterwards.
+        
         Args:
             query_embedding: Query embedding vector
             limit: Maximum number of results to return
             agent_id: Optional filter by agent ID
             document_id: Optional filter by document ID
+            min_similarity: Optional minimum cosine similarity (0-1) for returned rows
+            include_embeddings: Whether to include each row's vector as a float32 array
+            timeout: Optional time limit for the query in seconds (cancelled by the server)
             
         Returns:
             List of similar embeddings with metadata
@@ -231,6 +373,10 @@ class VectorStorageService:
         try:
             with self.get_connection() as conn:
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if timeout is not None:
+                        # Scoped to this transaction; the server cancels the search once it runs over
+                        cur.execute("SET LOCAL statement_timeout = %s", [max(int(timeout * 1000), 1)])
+                    
                     # Convert query embedding to PostgreSQL vector format
                     query_embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
                     
@@ -267,6 +413,11 @@ class VectorStorageService:
                         base_query += " AND d.id = %s"
                         params.append(document_id)
                     
+                    if min_similarity is not None:
+                        # similarity = 1 - distance, so filter on the distance the index orders by
+                        base_query += " AND (ve.embedding <=> %s) <= %s"
+                        params.extend([query_embedding_str, 1 - min_similarity])
+                    
                     base_query += """
                         ORDER BY ve.embedding <=> %s
                         LIMIT %s
@@ -277,23 +428,7 @@ class VectorStorageService:
                     results = cur.fetchall()
                     
                     # Convert results to list of dictionaries
-                    similar_embeddings = []
-                    for row in results:
-                        similar_embeddings.append({
-                            'id': row['id'],
-                            'chunk_id': row['chunk_id'],
-                            'content': row['content'],
-                            'page_number': row['page_number'],
-                            'chunk_index': row['chunk_index'],
-                            'metadata': row['metadata'],
-                            'agent_id': row['agent_id'],
-                            'document_id': row['document_id'],
-                            'file_name': row['file_name'],
-                            'original_name': row['original_name'],
-                            'similarity_score': float(row['similarity_score']),
-                            'model': row['model'],
-                            'created_at': row['created_at']
-                        })
+                    similar_embeddings = [self._search_result(row, include_embeddings) for row in results]
                     
                     logger.info(f"Found {len(similar_embeddings)} similar embeddings")
                     return similar_embeddings
@@ -302,6 +437,245 @@ class VectorStorageService:
             logger.error(f"Failed to search similar embeddings: {e}")
             return []
     
+    def _search_result(self, row: Dict[str, Any], include_embeddings: bool) -> Dict[str, Any]:
+        """Convert a similarity search row into a result dictionary"""
+        result = {
+            'id': row['id'],
+            'chunk_id': row['chunk_id'],
+            'content': row['content'],
+            'page_number': row['page_number'],
+            'chunk_index': row['chunk_index'],
+            'metadata': row['metadata'],
+            'agent_id': row['agent_id'],
+            'document_id': row['document_id'],
+            'file_name': row['file_name'],
+            'original_name': row['original_name'],
+            'similarity_score': float(row['similarity_score']),
+            'model': row['model'],
+            'created_at': row['created_at']
+        }
+        if include_embeddings:
+            result['embedding'] = self.parse_vector(row['embedding'])
+        return result
+    
+    async def search_similar_embeddings_per_document(self, query_embedding: List[float], document_ids: List[str],
+                                                     per_document_limit: int,
+                                                     min_similarity: Optional[float] = None,
+                                                     include_embeddings: bool = False,
+                                                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Search for similar embeddings with a separate top-k for each document
+        
+        Runs off the event loop, so searches over different document groups
+        can be awaited concurrently.
+        
+        Args:
+            query_embedding: Query embedding vector
+            document_ids: Documents to search
+            per_document_limit: Maximum number of results from each document
+            min_similarity: Optional minimum cosine similarity (0-1) for returned rows
+            include_embeddings: Whether to include each row's vector as a float32 array
+            timeout: Optional time limit for the query in seconds (cancelled by the server)
+            
+        Returns:
+            List of similar embeddings with metadata, most similar first
+        """
+        if not document_ids or per_document_limit <= 0:
+            return []
+        
+        return await asyncio.to_thread(self._search_per_document, query_embedding, document_ids,
+                                       per_document_limit, min_similarity, include_embeddings, timeout)
+    
+    def _search_per_document(self, query_embedding: List[float], document_ids: List[str], per_document_limit: int,
+                             min_similarity: Optional[float], include_embeddings: bool,
+                             timeout: Optional[float]) -> List[Dict[str, Any]]:
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if timeout is not None:
+                        cur.execute("SET LOCAL statement_timeout = %s", [max(int(timeout * 1000), 1)])
+                    
+                    query_embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
+                    
+                    threshold_filter = ""
+                    params: List[Any] = [query_embedding_str, document_ids]
+                    if min_similarity is not None:
+                        threshold_filter = " AND (ve.embedding <=> q.vec) <= %s"
+                        params.append(1 - min_similarity)
+                    params.append(per_document_limit)
+                    
+                    cur.execute(f"""
+                        WITH q AS (SELECT %s::vector as vec)
+                        SELECT r.*
+                        FROM unnest(%s::text[]) AS docs(document_id)
+                        CROSS JOIN q
+                        CROSS JOIN LATERAL (
+                            SELECT 
+                                ve.id,
+                                ve."chunkId" as chunk_id,
+                                ve.embedding,
+                                ve.model,
+                                ve."createdAt" as created_at,
+                                dc.content,
+                                dc."pageNumber" as page_number,
+                                dc."chunkIndex" as chunk_index,
+                                dc.metadata,
+                                d."agentId" as agent_id,
+                                d.id as document_id,
+                                d."fileName" as file_name,
+                                d."originalName" as original_name,
+                                1 - (ve.embedding <=> q.vec) as similarity_score
+                            FROM "VectorEmbedding" ve
+                            JOIN "DocumentChunk" dc ON ve."chunkId" = dc.id
+                            JOIN "Document" d ON dc."documentId" = d.id
+                            WHERE d.id = docs.document_id {threshold_filter}
+                            ORDER BY ve.embedding <=> q.vec
+                            LIMIT %s
+                        ) r
+                        ORDER BY r.similarity_score DESC
+                    """, params)
+                    
+                    return [self._search_result(row, include_embeddings) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to search similar embeddings per document: {e}")
+            return []
+    
+    async def search_similar_embeddings_multi(self, query_embeddings: List[List[float]], limit: int = 10,
+                                            agent_id: Optional[str] = None,
+                                            document_id: Optional[str] = None,
+                                            min_similarity: Optional[float] = None,
+                                            include_embeddings: bool = False,
+                                            timeout: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for similar embeddings for several queries in one round trip
+        
+        Each query vector gets its own top-`limit` through a LATERAL join, so the
+        index is used per query exactly as in search_similar_embeddings. Rows that
+        several queries share are built once, so their vectors are parsed a single
+        time and shared between the per-query results.
+        
+        Args:
+            query_embeddings: Query embedding vectors
+            limit: Maximum number of results per query
+            agent_id: Optional filter by agent ID
+            document_id: Optional filter by document ID
+            min_similarity: Optional minimum cosine similarity (0-1) for returned rows
+            include_embeddings: Whether to include each row's vector as a float32 array
+            timeout: Optional time limit for the query in seconds (cancelled by the server)
+            
+        Returns:
+            One list of similar embeddings per query, in input order
+        """
+        if not query_embeddings:
+            return []
+        
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if timeout is not None:
+                        cur.execute("SET LOCAL statement_timeout = %s", [max(int(timeout * 1000), 1)])
+                    
+                    query_strs = ['[' + ','.join(map(str, embedding)) + ']' for embedding in query_embeddings]
+                    
+                    filters = ""
+                    params: List[Any] = [query_strs]
+                    
+                    if agent_id:
+                        filters += " AND d.\"agentId\" = %s"
+                        params.append(agent_id)
+                    
+                    if document_id:
+                        filters += " AND d.id = %s"
+                        params.append(document_id)
+                    
+                    if min_similarity is not None:
+                        filters += " AND (ve.embedding <=> q.vec) <= %s"
+                        params.append(1 - min_similarity)
+                    
+                    params.append(limit)
+                    
+                    cur.execute(f"""
+                        SELECT q.ord - 1 as query_index, r.*
+                        FROM unnest(%s::text[]) WITH ORDINALITY AS qt(vec_text, ord)
+                        CROSS JOIN LATERAL (SELECT qt.vec_text::vector as vec, qt.ord) q
+                        CROSS JOIN LATERAL (
+                            SELECT 
+                                ve.id,
+                                ve."chunkId" as chunk_id,
+                                ve.embedding,
+                                ve.model,
+                                ve."createdAt" as created_at,
+                                dc.content,
+                                dc."pageNumber" as page_number,
+                                dc."chunkIndex" as chunk_index,
+                                dc.metadata,
+                                d."agentId" as agent_id,
+                                d.id as document_id,
+                                d."fileName" as file_name,
+                                d."originalName" as original_name,
+                                1 - (ve.embedding <=> q.vec) as similarity_score
+                            FROM "VectorEmbedding" ve
+                            JOIN "DocumentChunk" dc ON ve."chunkId" = dc.id
+                            JOIN "Document" d ON dc."documentId" = d.id
+                            WHERE 1=1 {filters}
+                            ORDER BY ve.embedding <=> q.vec
+                            LIMIT %s
+                        ) r
+                        ORDER BY q.ord, r.similarity_score DESC
+                    """, params)
+                    rows = cur.fetchall()
+                    
+                    results: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+                    shared_rows: Dict[str, Dict[str, Any]] = {}
+                    for row in rows:
+                        shared = shared_rows.get(row['chunk_id'])
+                        if shared is None:
+                            shared = {
+                                'id': row['id'],
+                                'chunk_id': row['chunk_id'],
+                                'content': row['content'],
+                                'page_number': row['page_number'],
+                                'chunk_index': row['chunk_index'],
+                                'metadata': row['metadata'],
+                                'agent_id': row['agent_id'],
+                                'document_id': row['document_id'],
+                                'file_name': row['file_name'],
+                                'original_name': row['original_name'],
+                                'model': row['model'],
+                                'created_at': row['created_at']
+                            }
+                            if include_embeddings:
+                                shared['embedding'] = self.parse_vector(row['embedding'])
+                            shared_rows[row['chunk_id']] = shared
+                        
+                        results[row['query_index']].append({
+                            **shared,
+                            'similarity_score': float(row['similarity_score'])
+                        })
+                    
+                    logger.info(f"Found {len(rows)} similar embeddings ({len(shared_rows)} unique) for {len(query_embeddings)} queries")
+                    return results
+                    
+        except Exception as e:
+            logger.error(f"Failed to search similar embeddings for multiple queries: {e}")
+            return [[] for _ in query_embeddings]
+    
+    @staticmethod
+    def parse_vector(value: Any) -> np.ndarray:
+        """
+        Parse a pgvector value into a float32 array
+        
+        Args:
+            value: Vector as returned by psycopg2 (text such as '[0.1,0.2]') or a sequence
+            
+        Returns:
+            float32 numpy array
+        """
+        if isinstance(value, str):
+            return np.fromstring(value.strip('[]'), sep=',', dtype=np.float32)
+        return np.asarray(value, dtype=np.float32)
+    
     async def delete_embeddings_by_document(self, document_id: str) -> bool:
         """
         Delete all embeddings for a specific document
@@ -325,8 +699,15 @@ class VectorStorageService:
                     """, (document_id,))
                     
                     deleted_count = cur.rowcount
+                    
+                    # The precomputed summary no longer matches the corpus
+                    cur.execute('DELETE FROM "DocumentSummary" WHERE "documentId" = %s', (document_id,))
                     conn.commit()
                     
+                    cur.execute('SELECT "agentId" FROM "Document" WHERE id = %s', (document_id,))
+                    row = cur.fetchone()
+                    self.bump_corpus_version(row[0] if row else None)
+                    
                     logger.info(f"Deleted {deleted_count} embeddings for document {document_id}")
                     return True
                     
@@ -334,6 +715,468 @@ class VectorStorageService:
             logger.error(f"Failed to delete embeddings for document {document_id}: {e}")
             return False
     
+    async def get_document_agent_id(self, document_id: str) -> Optional[str]:
+        """
+        Get the agent a document belongs to
+        
+        Args:
+            document_id: Document ID
+            
+        Returns:
+            AI Agent ID, or None if the document does not exist or the lookup failed
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT "agentId" FROM "Document" WHERE id = %s', (document_id,))
+                    row = cur.fetchone()
+                    return row[0] if row else None
+                    
+        except Exception as e:
+            logger.error(f"Failed to look up the agent of document {document_id}: {e}")
+            return None
+    
+    async def get_document_chunk_hashes(self, document_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the stored chunks of a document for diffing against a new version
+        
+        Args:
+            document_id: Document ID
+            
+        Returns:
+            List of dictionaries with chunk_id, content, content_hash (None for
+            chunks stored without one) and embedded, or None if the lookup failed
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT 
+                            dc.id as chunk_id,
+                            dc.content,
+                            dc.metadata->>'content_hash' as content_hash,
+                            EXISTS (SELECT 1 FROM "VectorEmbedding" ve WHERE ve."chunkId" = dc.id) as embedded
+                        FROM "DocumentChunk" dc
+                        WHERE dc."documentId" = %s
+                        ORDER BY dc."chunkIndex"
+                    """, (document_id,))
+                    return [dict(row) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to fetch chunk hashes for document {document_id}: {e}")
+            return None
+    
+    async def apply_document_chunk_diff(self, document_id: str, kept: List[Dict[str, Any]],
+                                        embedded: List[Dict[str, Any]], deleted_chunk_ids: List[str],
+                                        model: str) -> bool:
+        """
+        Update a document's chunks to a new version in one transaction
+        
+        Args:
+            document_id: Document ID
+            kept: Stored chunks that are unchanged, as dictionaries with chunk_id
+                and chunk (the new chunk, whose index, page and metadata are applied)
+            embedded: Chunks to store embeddings for, as dictionaries with chunk,
+                embedding and chunk_id (None for chunks that are not stored yet)
+            deleted_chunk_ids: Stored chunks that are no longer in the document
+            model: Model the embeddings were generated with
+            
+        Returns:
+            True if the document was updated, False otherwise
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    if deleted_chunk_ids:
+                        cur.execute('DELETE FROM "VectorEmbedding" WHERE "chunkId" = ANY(%s)', (deleted_chunk_ids,))
+                        cur.execute('DELETE FROM "DocumentChunk" WHERE id = ANY(%s)', (deleted_chunk_ids,))
+                    
+                    execute_batch(cur, """
+                        UPDATE "DocumentChunk" SET "chunkIndex" = %s, "pageNumber" = %s, metadata = %s
+                        WHERE id = %s
+                    """, [
+                        (item['chunk']['chunk_index'], item['chunk'].get('page_number'),
+                         Json(item['chunk'].get('metadata') or {}), item['chunk_id'])
+                        for item in kept
+                    ])
+                    
+                    for item in embedded:
+                        if item['chunk_id'] is None:
+                            item['chunk_id'] = f"chunk_{uuid.uuid4().hex}"
+                            chunk = item['chunk']
+                            cur.execute("""
+                                INSERT INTO "DocumentChunk" (id, "documentId", content, "pageNumber", "chunkIndex", metadata)
+                                VALUES (%s, %s, %s, %s, %s, %s)
+                            """, (item['chunk_id'], document_id, chunk['content'], chunk.get('page_number'),
+                                  chunk['chunk_index'], Json(chunk.get('metadata') or {})))
+                    
+                    execute_batch(cur, """
+                        INSERT INTO "VectorEmbedding" (id, "chunkId", embedding, model)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (id) DO UPDATE SET
+                            embedding = EXCLUDED.embedding,
+                            model = EXCLUDED.model
+                    """, [
+                        (f"emb_{item['chunk_id']}", item['chunk_id'], '[' + ','.join(map(str, item['embedding'])) + ']', model)
+                        for item in embedded
+                    ])
+                    
+                    # The precomputed summary no longer matches the corpus
+                    cur.execute('DELETE FROM "DocumentSummary" WHERE "documentId" = %s', (document_id,))
+                    conn.commit()
+                    
+                    cur.execute('SELECT "agentId" FROM "Document" WHERE id = %s', (document_id,))
+                    row = cur.fetchone()
+                    self.bump_corpus_version(row[0] if row else None)
+                    
+                    logger.info(f"Updated document {document_id}: {len(kept)} chunks kept, "
+                                f"{len(embedded)} embedded, {len(deleted_chunk_ids)} deleted")
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"Failed to update chunks of document {document_id}: {e}")
+            return False
+    
+    async def begin_document_ingest(self, document_id: str, agent_id: str, original_name: str,
+                                    file_size: int, file_type: str = "application/pdf") -> bool:
+        """
+        Create (or reset) a document record for a server-side ingest
+        
+        An existing document with the same ID keeps its record, but its chunks,
+        embeddings and summary are removed so the new version replaces them.
+        Documents of other agents are left untouched.
+        
+        Args:
+            document_id: Document ID
+            agent_id: AI Agent ID
+            original_name: Uploaded file name
+            file_size: File size in bytes
+            file_type: MIME type of the file
+            
+        Returns:
+            True if the document is ready for chunks, False otherwise (including
+            when the document belongs to another agent)
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO "Document" (id, "agentId", "fileName", "originalName", "fileSize", "fileType", "filePath", status)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, 'PROCESSING')
+                        ON CONFLICT (id) DO UPDATE SET
+                            "originalName" = EXCLUDED."originalName",
+                            "fileSize" = EXCLUDED."fileSize",
+                            status = 'PROCESSING',
+                            "processedAt" = NULL
+                        WHERE "Document"."agentId" = EXCLUDED."agentId"
+                    """, (
+                        document_id,
+                        agent_id,
+                        f"agent_{agent_id}_{document_id}.pdf",
+                        original_name,
+                        file_size,
+                        file_type,
+                        f"/uploads/agents/{agent_id}/{original_name}"
+                    ))
+                    
+                    # The document exists but belongs to another agent
+                    if cur.rowcount == 0:
+                        conn.rollback()
+                        logger.error(f"Document {document_id} does not belong to agent {agent_id}")
+                        return False
+                    
+                    cur.execute("""
+                        DELETE FROM "VectorEmbedding" 
+                        WHERE "chunkId" IN (
+                            SELECT id FROM "DocumentChunk" 
+                            WHERE "documentId" = %s
+                        )
+                    """, (document_id,))
+                    cur.execute('DELETE FROM "DocumentChunk" WHERE "documentId" = %s', (document_id,))
+                    cur.execute('DELETE FROM "DocumentSummary" WHERE "documentId" = %s', (document_id,))
+                    conn.commit()
+                    
+                    self.bump_corpus_version(agent_id)
+                    logger.info(f"Started server-side ingest of document {document_id} for agent {agent_id}")
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"Failed to start ingest of document {document_id}: {e}")
+            return False
+    
+    async def store_document_chunks(self, document_id: str, chunks: List[Dict[str, Any]],
+                                    embeddings: List[List[float]], model: str,
+                                    run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread) -> int:
+        """
+        Store a batch of chunks with their embeddings in one transaction
+        
+        Runs on a worker thread so an ingest can extract and embed the next
+        batches while this one is written.
+        
+        Args:
+            document_id: Document ID (from begin_document_ingest)
+            chunks: Chunks from PDFProcessor
+            embeddings: Embedding vectors in chunk order
+            model: Model the embeddings were generated with
+            run_blocking: Runs the blocking write off the event loop (background
+                jobs pass their own thread pool)
+            
+        Returns:
+            Number of chunks stored (0 on failure)
+        """
+        return await run_blocking(self._store_document_chunks, document_id, chunks, embeddings, model)
+    
+    def _store_document_chunks(self, document_id: str, chunks: List[Dict[str, Any]],
+                               embeddings: List[List[float]], model: str) -> int:
+        try:
+            # Same chunk IDs the frontend assigns, so both ingest paths look alike
+            chunk_ids = [f"chunk_{document_id}_{chunk['chunk_index']}" for chunk in chunks]
+            
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO "DocumentChunk" (id, "documentId", content, "pageNumber", "chunkIndex", metadata)
+                        VALUES %s
+                    """, [
+                        (chunk_id, document_id, chunk['content'], chunk.get('page_number'),
+                         chunk['chunk_index'], Json(chunk.get('metadata') or {}))
+                        for chunk_id, chunk in zip(chunk_ids, chunks)
+                    ])
+                    
+                    execute_values(cur, """
+                        INSERT INTO "VectorEmbedding" (id, "chunkId", embedding, model)
+                        VALUES %s
+                        ON CONFLICT (id) DO UPDATE SET
+                            embedding = EXCLUDED.embedding,
+                            model = EXCLUDED.model
+                    """, [
+                        (f"emb_{chunk_id}", chunk_id, '[' + ','.join(map(str, embedding)) + ']', model)
+                        for chunk_id, embedding in zip(chunk_ids, embeddings)
+                    ])
+                    
+                    conn.commit()
+                    logger.debug(f"Stored {len(chunks)} chunks of document {document_id}")
+                    return len(chunks)
+                    
+        except Exception as e:
+            logger.error(f"Failed to store chunks of document {document_id}: {e}")
+            return 0
+    
+    async def finish_document_ingest(self, document_id: str, agent_id: str, success: bool) -> bool:
+        """
+        Mark a server-side ingest as finished
+        
+        Args:
+            document_id: Document ID
+            agent_id: AI Agent ID
+            success: Whether every chunk was stored
+            
+        Returns:
+            True if the document status was updated, False otherwise
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE "Document" SET status = %s, "processedAt" = CURRENT_TIMESTAMP
+                        WHERE id = %s AND "agentId" = %s
+                    """, ('PROCESSED' if success else 'ERROR', document_id, agent_id))
+                    conn.commit()
+                    
+                    self.bump_corpus_version(agent_id)
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"Failed to finish ingest of document {document_id}: {e}")
+            return False
+    
+    async def get_documents_for_chunks(self, chunk_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Get the documents (and their agents) that own the given chunks
+        
+        Args:
+            chunk_ids: DocumentChunk IDs
+            
+        Returns:
+            List of dictionaries with document_id and agent_id
+        """
+        if not chunk_ids:
+            return []
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT DISTINCT dc."documentId" as document_id, d."agentId" as agent_id
+                        FROM "DocumentChunk" dc
+                        JOIN "Document" d ON dc."documentId" = d.id
+                        WHERE dc.id = ANY(%s)
+                    """, (list(chunk_ids),))
+                    return [dict(row) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to resolve documents for chunks: {e}")
+            return []
+    
+    async def get_agent_documents(self, agent_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the documents of an agent that have embedded chunks
+        
+        Args:
+            agent_id: AI Agent ID
+            
+        Returns:
+            List of dictionaries with document_id and agent_id
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT DISTINCT d.id as document_id, d."agentId" as agent_id
+                        FROM "Document" d
+                        JOIN "DocumentChunk" dc ON dc."documentId" = d.id
+                        JOIN "VectorEmbedding" ve ON ve."chunkId" = dc.id
+                        WHERE d."agentId" = %s
+                    """, (agent_id,))
+                    return [dict(row) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to get documents for agent {agent_id}: {e}")
+            return []
+    
+    async def get_unsummarised_documents(self) -> List[Dict[str, Any]]:
+        """
+        Get the documents that have embedded chunks but no stored summary
+        
+        Returns:
+            List of dictionaries with document_id and agent_id
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT d.id as document_id, d."agentId" as agent_id
+                        FROM "Document" d
+                        WHERE EXISTS (
+                            SELECT 1 FROM "DocumentChunk" dc
+                            JOIN "VectorEmbedding" ve ON ve."chunkId" = dc.id
+                            WHERE dc."documentId" = d.id
+                        )
+                        AND NOT EXISTS (
+                            SELECT 1 FROM "DocumentSummary" ds WHERE ds."documentId" = d.id
+                        )
+                    """)
+                    return [dict(row) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to get unsummarised documents: {e}")
+            return []
+    
+    async def fetch_document_chunks(self, document_id: str, include_embeddings: bool = True) -> List[Dict[str, Any]]:
+        """
+        Fetch all chunks of a document, optionally with their embeddings
+        
+        Args:
+            document_id: Document ID
+            include_embeddings: Whether to include embeddings as float32 arrays
+            
+        Returns:
+            List of chunk dictionaries ordered by chunk index
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(f"""
+                        SELECT 
+                            dc.id as chunk_id,
+                            dc.content,
+                            dc."pageNumber" as page_number,
+                            dc."chunkIndex" as chunk_index,
+                            dc.metadata,
+                            d."agentId" as agent_id,
+                            d."fileName" as file_name,
+                            d."originalName" as original_name,
+                            {'ve.embedding' if include_embeddings else 'NULL'} as embedding
+                        FROM "DocumentChunk" dc
+                        JOIN "Document" d ON dc."documentId" = d.id
+                        LEFT JOIN "VectorEmbedding" ve ON ve."chunkId" = dc.id
+                        WHERE dc."documentId" = %s
+                        ORDER BY dc."chunkIndex"
+                    """, (document_id,))
+                    
+                    chunks = []
+                    for row in cur.fetchall():
+                        chunk = dict(row)
+                        chunk['document_id'] = document_id
+                        if chunk['embedding'] is not None:
+                            chunk['embedding'] = self.parse_vector(chunk['embedding'])
+                        chunks.append(chunk)
+                    return chunks
+                    
+        except Exception as e:
+            logger.error(f"Failed to fetch chunks for document {document_id}: {e}")
+            return []
+    
+    async def upsert_document_summary(self, document_id: str, agent_id: str, summary: Dict[str, Any]) -> bool:
+        """
+        Store the precomputed summary of a document
+        
+        Args:
+            document_id: Document ID
+            agent_id: AI Agent ID
+            summary: Summary dictionary
+            
+        Returns:
+            True if stored successfully, False otherwise
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO "DocumentSummary" ("documentId", "agentId", summary, "updatedAt")
+                        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                        ON CONFLICT ("documentId") DO UPDATE SET
+                            "agentId" = EXCLUDED."agentId",
+                            summary = EXCLUDED.summary,
+                            "updatedAt" = EXCLUDED."updatedAt"
+                    """, (document_id, agent_id, Json(summary)))
+                    conn.commit()
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"Failed to store summary for document {document_id}: {e}")
+            return False
+    
+    async def get_document_summaries(self, agent_id: str, document_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Read precomputed document summaries
+        
+        Args:
+            agent_id: AI Agent ID
+            document_id: Optional filter by document ID
+            
+        Returns:
+            List of dictionaries with document_id, summary and updated_at
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    query = """
+                        SELECT "documentId" as document_id, summary, "updatedAt" as updated_at
+                        FROM "DocumentSummary"
+                        WHERE "agentId" = %s
+                    """
+                    params = [agent_id]
+                    if document_id:
+                        query += ' AND "documentId" = %s'
+                        params.append(document_id)
+                    
+                    cur.execute(query, params)
+                    return [dict(row) for row in cur.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"Failed to get document summaries for agent {agent_id}: {e}")
+            return []
+    
     async def get_embedding_stats(self, agent_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Get statistics about stored embeddings
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Benchmark for the single-pass token-offset chunker
+Chunks a generated ~1M-token document with the previous sentence-by-sentence
+chunker and with PDFProcessor.iter_chunks, checks token counts are exact, and
+checks that a sentence inserted at sampled pages of an 80-page document only
+changes the chunks around it (with and without sentence punctuation).
+
+Both chunkers are bound by tokenization, which is reported as the floor: the
+token-offset chunker is for exact token counts and stable cuts, not speed.
+Text cleaning is timed separately against the previous regex cleaner.
+"""
+
+import os
+import re
+import sys
+import time
+
+# Add ai-backend to path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-backend"))
+
+from pdf_processor import PDFProcessor
+
+TARGET_TOKENS = 1_000_000
+EDIT_PAGES = 80
+EDIT_STEP = 8                  # Pages between the sampled edit positions
+MAX_MEAN_CHANGED_CHUNKS = 3.0
+MAX_CHANGED_CHUNKS = 8
+MIN_MEAN_CHUNK_FRACTION = 0.8  # Content-defined cuts must not shrink chunks far below chunk_size
+INSERTED_SENTENCE = "An inserted remark about the catalyst changes nothing else. "
+
+WORDS = ("thermodynamics entropy equilibrium enthalpy reaction kinetics catalyst molecule "
+         "electron orbital valence bond lattice crystal polymer solution acid base oxidation "
+         "reduction gradient vector matrix integral derivative theorem proof lemma the of and "
+         "is a in to that which for with as by on").split()
+
+def generate_pages(target_tokens=TARGET_TOKENS, words_per_page=450):
+    """Build pages of sentences totalling roughly target_tokens tokens"""
+    pages = []
+    words_so_far = 0
+    page_number = 1
+    while words_so_far * 1.2 < target_tokens:
+        sentences = []
+        count = 0
+        i = page_number * 31
+        while count < words_per_page:
+            length = 8 + (i % 17)
+            words = [WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(length)]
+            sentences.append(" ".join(words).capitalize() + (". " if i % 5 else "? "))
+            count += length
+            i += 1
+        pages.append({'page_number': page_number, 'text': "".join(sentences)})
+        words_so_far += count
+        page_number += 1
+    return pages
+
+def legacy_chunks(processor, text):
+    """The previous chunker: encode every sentence, re-encode each new chunk, overlap by word count"""
+    cleaned_text = processor.clean_text(text)
+    sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+
+    chunks = []
+    current_chunk = ""
+    current_tokens = 0
+    overlap_words = processor.chunk_overlap // 4
+    for sentence in sentences:
+        sentence_tokens = len(processor.encoding.encode(sentence))
+        if current_tokens + sentence_tokens > processor.chunk_size and current_chunk:
+            chunks.append({'content': current_chunk.strip(), 'token_count': current_tokens})
+            words = current_chunk.split()
+            overlap_text = current_chunk if len(words) <= overlap_words else " ".join(words[-overlap_words:])
+            current_chunk = overlap_text + " " + sentence
+            current_tokens = len(processor.encoding.encode(current_chunk))
+        else:
+            current_chunk += " " + sentence if current_chunk else sentence
+            current_tokens += sentence_tokens
+    if current_chunk.strip():
+        chunks.append({'content': current_chunk.strip(), 'token_count': current_tokens})
+    return chunks
+
+LEGACY_ARTIFACTS = re.compile(
+    r'^[ \t]*\d+[ \t]*$|[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\/\@\#\$\%\&\*\+\=\<\>\|\\\~\`]',
+    re.MULTILINE
+)
+
+def legacy_clean(text):
+    """The previous cleaner: one regex pass for artifacts, one for whitespace"""
+    return re.sub(r'\s+', ' ', LEGACY_ARTIFACTS.sub('', text)).strip()
+
+def count_mismatches(processor, chunks):
+    """Number of chunks whose token_count differs from re-encoding their content"""
+    return sum(1 for chunk in chunks if len(processor.encoding.encode(chunk['content'])) != chunk['token_count'])
+
+def changed_chunks(processor, pages, page_index):
+    """Chunks whose content hash is new after inserting a sentence mid-page"""
+    edited = [dict(page) for page in pages]
+    text = edited[page_index]['text']
+    cut = text.index(' ', len(text) // 2) + 1
+    edited[page_index]['text'] = text[:cut] + INSERTED_SENTENCE + text[cut:]
+
+    before = {chunk['content_hash'] for chunk in processor.iter_chunks(pages)}
+    return sum(1 for chunk in processor.iter_chunks(edited) if chunk['content_hash'] not in before)
+
+def best_time(function, runs=3):
+    """Fastest of several runs, returning seconds and the last result"""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    """Main benchmark function"""
+    print("🧪 Benchmarking single-pass token-offset chunking")
+    print("=" * 40)
+    target_tokens = int(sys.argv[1]) if len(sys.argv) > 1 else TARGET_TOKENS
+
+    processor = PDFProcessor(chunk_size=1000, chunk_overlap=200, extraction_workers=1)
+    pages = generate_pages(target_tokens)
+    full_text = "\n\n".join(page['text'] for page in pages)
+    document_tokens = len(processor.encoding.encode(full_text))
+    print(f"📄 Generated {len(pages)} pages, {document_tokens:,} tokens")
+
+    old_clean_time, old_cleaned = best_time(lambda: [legacy_clean(page['text']) for page in pages])
+    clean_time, cleaned = best_time(lambda: [processor.clean_text(page['text']) for page in pages])
+    print(f"🧹 Cleaning: {clean_time:.2f}s (previous regex cleaner {old_clean_time:.2f}s, "
+          f"{'same' if cleaned == old_cleaned else 'DIFFERENT'} output)")
+
+    floor_time, _ = best_time(lambda: processor.encoding.encode_ordinary(full_text))
+    print(f"📊 Tokenizing the whole text:    {floor_time:.2f}s (floor for both chunkers)")
+
+    old_time, old_chunks = best_time(lambda: legacy_chunks(processor, full_text))
+    print(f"📊 Sentence-by-sentence chunker: {old_time:.2f}s, {len(old_chunks)} chunks, "
+          f"{count_mismatches(processor, old_chunks)} inexact token counts")
+
+    new_time, new_chunks = best_time(lambda: list(processor.iter_chunks(pages)))
+    new_mismatches = count_mismatches(processor, new_chunks)
+    print(f"📊 Token-offset chunker:         {new_time:.2f}s, {len(new_chunks)} chunks, "
+          f"{new_mismatches} inexact token counts")
+
+    sizes = [chunk['token_count'] for chunk in new_chunks]
+    largest = max(sizes)
+    mean_size = sum(sizes) / len(sizes)
+    overlap_share = processor.chunk_overlap * (len(sizes) - 1) / sum(sizes)
+    print(f"   largest chunk {largest} tokens (limit {processor.chunk_size}), "
+          f"mean chunk {mean_size:.0f} tokens, {overlap_share:.0%} of stored tokens are overlap")
+
+    # Incremental re-ingest only re-embeds changed chunks, so an edit must not shift later cuts
+    edit_pages = pages[:EDIT_PAGES]
+    unpunctuated = [{**page, 'text': re.sub(r'[.!?]', '', page['text'])} for page in edit_pages]
+    stable = True
+    for label, variant in (("sentences", edit_pages), ("no punctuation", unpunctuated)):
+        total_chunks = sum(1 for _ in processor.iter_chunks(variant))
+        changed = [changed_chunks(processor, variant, page_index) for page_index in range(1, len(variant), EDIT_STEP)]
+        mean_changed = sum(changed) / len(changed)
+        stable = stable and mean_changed <= MAX_MEAN_CHANGED_CHUNKS and max(changed) <= MAX_CHANGED_CHUNKS
+        print(f"✏️  {label}: a sentence inserted on one of {len(changed)} pages changed {mean_changed:.1f} "
+              f"(at most {max(changed)}) of {total_chunks} chunks")
+
+    print("=" * 40)
+    print(f"⏱️  Token-offset chunker vs previous chunker: {old_time / new_time:.2f}x "
+          f"(tokenization is {floor_time / new_time:.0%} of its time)")
+    print(f"⏱️  Cleaning vs previous cleaner: {old_clean_time / clean_time:.1f}x")
+    full_enough = mean_size >= MIN_MEAN_CHUNK_FRACTION * processor.chunk_size
+    if new_mismatches == 0 and largest <= processor.chunk_size and full_enough and stable and cleaned == old_cleaned:
+        print("✅ Every chunk is an exact token window within the size limit, chunks stay close to it, "
+              "and edits stay local")
+        return True
+    print("❌ Token counts were inexact, a chunk exceeded the size limit, chunks were too small, "
+          "an edit shifted later chunks or cleaning changed its output")
+    return False
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
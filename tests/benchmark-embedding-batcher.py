@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark for cross-request micro-batching of query embeddings
+Runs concurrent single-text embedding requests through the Gemini SDK against a
+local fake embedding server (REST, with simulated round-trip latency)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Add ai-backend to path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-backend"))
+
+from embedding_service import EmbeddingService, OfflineEmbeddingService
+
+CONCURRENT_REQUESTS = 200
+ROUND_TRIP_MS = 40.0  # Fixed cost of one upstream call
+PER_TEXT_MS = 0.5     # Extra cost per text in a call
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    """Answers embedContent and batchEmbedContents with hashed vectors after a simulated delay"""
+    vectors = OfflineEmbeddingService()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        method = self.path.split('?')[0].rsplit(':', 1)[-1]
+        if method == 'batchEmbedContents':
+            texts = [request['content']['parts'][0]['text'] for request in body['requests']]
+        else:
+            texts = [body['content']['parts'][0]['text']]
+        time.sleep((ROUND_TRIP_MS + PER_TEXT_MS * len(texts)) / 1000)
+
+        embeddings = [{'values': self.vectors._embed_text(text)} for text in texts]
+        reply = {'embeddings': embeddings} if method == 'batchEmbedContents' else {'embedding': embeddings[0]}
+        data = json.dumps(reply).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_server():
+    """Start the fake embedding server on a free local port"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeEmbeddingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run_load(service, label):
+    """Fire concurrent single-text requests and report throughput and latency"""
+    latencies = []
+
+    async def one_request(i):
+        start = time.perf_counter()
+        embedding = await service.generate_embedding(f"student question number {i} about thermodynamics")
+        latencies.append((time.perf_counter() - start) * 1000)
+        return embedding is not None
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_request(i) for i in range(CONCURRENT_REQUESTS)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies)
+    print(f"📊 {label}")
+    print(f"   {sum(results)}/{CONCURRENT_REQUESTS} ok in {elapsed:.2f}s -> {CONCURRENT_REQUESTS / elapsed:.0f} req/s")
+    print(f"   latency p50 {np.percentile(latencies, 50):.1f} ms | p99 {np.percentile(latencies, 99):.1f} ms")
+    print(f"   upstream calls: {service.upstream_calls}")
+    return CONCURRENT_REQUESTS / elapsed
+
+async def benchmark(window_ms, endpoint):
+    """Compare unbatched and micro-batched embedding"""
+    unbatched = EmbeddingService(api_key="benchmark", api_endpoint=endpoint)
+    batched = EmbeddingService(api_key="benchmark", api_endpoint=endpoint,
+                               batch_window_ms=window_ms, max_batch_size=32)
+
+    baseline = await run_load(unbatched, "Unbatched (one upstream call per request)")
+    print()
+    improved = await run_load(batched, f"Micro-batched (window {window_ms} ms, max 32 texts)")
+    print(f"   batcher: {batched.batcher.get_stats()}")
+    return baseline, improved
+
+def main():
+    """Main benchmark function"""
+    print("🧪 Benchmarking embedding micro-batching")
+    print("=" * 40)
+    window_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    server = start_fake_server()
+    try:
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+        baseline, improved = asyncio.run(benchmark(window_ms, endpoint))
+    finally:
+        server.shutdown()
+    print("=" * 40)
+    if improved > baseline:
+        print(f"✅ Micro-batching raised throughput {improved / baseline:.1f}x")
+    else:
+        print("❌ Micro-batching did not improve throughput")
+    return improved > baseline
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
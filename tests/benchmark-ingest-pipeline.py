@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Benchmark for the server-side ingest pipeline
+Ingests a generated PDF sequentially (extract everything, then embed, then store)
+and through the pipelined stages, with the offline embedding backend simulating
+round-trip latency. Stores into DATABASE_URL when set, otherwise into an
+in-memory store with simulated write latency.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Add ai-backend to path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-backend"))
+
+from embedding_service import OfflineEmbeddingService
+from ingest_pipeline import IngestPipeline
+from pdf_processor import PDFProcessor
+
+PAGES = 200
+LINES_PER_PAGE = 45
+BATCH_SIZE = 25
+ROUND_TRIP_MS = 150.0  # Fixed cost of one embedding call
+PER_TEXT_MS = 0.5      # Extra cost per text in an embedding call
+WRITE_MS = 20.0        # Fixed cost of one storage transaction
+PER_ROW_MS = 0.1       # Extra cost per stored chunk
+
+WORDS = ("thermodynamics entropy equilibrium enthalpy reaction kinetics catalyst molecule "
+         "electron orbital valence bond lattice crystal polymer solution acid base oxidation "
+         "reduction gradient vector matrix integral derivative theorem proof lemma").split()
+
+def generate_pdf(path, pages=PAGES, lines_per_page=LINES_PER_PAGE):
+    """Write a plain text PDF with numbered pages, headers and footers"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Chapter {page // 20 + 1} - Physical Chemistry Notes"]
+        for line in range(lines_per_page):
+            words = [WORDS[(page * 7 + line * 3 + i * (line % 5 + 1)) % len(WORDS)] for i in range(11)]
+            lines.append(f"{page + 1}.{line + 1} " + " ".join(words) + ".")
+        lines.append(f"Page {page + 1}")
+
+        commands = ["BT", "/F1 9 Tf", "11 TL", "50 800 Td"]
+        for text in lines:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            commands.append(f"({escaped}) Tj T*")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1")
+
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+
+class MemoryVectorStore:
+    """Stands in for the database: keeps rows in memory and sleeps like a write round trip"""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def store_document_chunks(self, document_id, chunks, embeddings, model):
+        return await asyncio.to_thread(self._store, document_id, chunks, embeddings)
+
+    def _store(self, document_id, chunks, embeddings):
+        time.sleep((WRITE_MS + PER_ROW_MS * len(chunks)) / 1000)
+        for chunk, embedding in zip(chunks, embeddings):
+            self.rows[f"chunk_{document_id}_{chunk['chunk_index']}"] = (chunk['content'], embedding)
+        return len(chunks)
+
+def make_storage():
+    """Database storage when DATABASE_URL is set, otherwise the in-memory store"""
+    if os.getenv("DATABASE_URL"):
+        from vector_storage import VectorStorageService
+        return VectorStorageService(), "PostgreSQL"
+    return MemoryVectorStore(), f"in-memory ({WRITE_MS:.0f} ms + {PER_ROW_MS} ms/row per write)"
+
+async def ingest_sequential(processor, embedding_service, storage, pdf_path, document_id):
+    """Extract every chunk, then embed every batch, then store every batch"""
+    chunks = processor.process_pdf(pdf_path, "bench-agent", document_id)['chunks']
+    batches = [chunks[start:start + BATCH_SIZE] for start in range(0, len(chunks), BATCH_SIZE)]
+    embedded = [(batch, await embedding_service.embed_texts([chunk['content'] for chunk in batch])) for batch in batches]
+    stored = 0
+    for batch, embeddings in embedded:
+        stored += await storage.store_document_chunks(document_id, batch, embeddings, embedding_service.model)
+    return stored, chunks, [embedding for _, embeddings in embedded for embedding in embeddings]
+
+async def ingest_pipelined(processor, embedding_service, storage, pdf_path, document_id):
+    """Stream the chunks through the overlapping pipeline stages"""
+    pipeline = IngestPipeline(embedding_service, storage, batch_size=BATCH_SIZE)
+    progress = {}
+    chunks = processor.iter_pdf_chunks(pdf_path, "bench-agent", document_id, progress)
+    result = await pipeline.ingest(chunks, document_id, progress)
+    return result
+
+async def benchmark(pdf_path):
+    """Compare sequential and pipelined ingest of the same PDF"""
+    processor = PDFProcessor(extraction_workers=1)
+    embedding_service = OfflineEmbeddingService(latency_ms=ROUND_TRIP_MS, per_text_ms=PER_TEXT_MS)
+    storage, storage_label = make_storage()
+    print(f"🗄️  Storage: {storage_label}")
+
+    start = time.perf_counter()
+    sequential_stored, chunks, embeddings = await ingest_sequential(
+        processor, embedding_service, storage, pdf_path, "bench-sequential"
+    )
+    sequential_time = time.perf_counter() - start
+    print(f"\n📊 Sequential: {sequential_stored} chunks in {sequential_time:.2f}s "
+          f"-> {sequential_stored / sequential_time:.0f} chunks/s")
+
+    start = time.perf_counter()
+    result = await ingest_pipelined(processor, embedding_service, storage, pdf_path, "bench-pipelined")
+    pipelined_time = time.perf_counter() - start
+    print(f"📊 Pipelined:  {result['embeddings_stored']} chunks in {pipelined_time:.2f}s "
+          f"-> {result['embeddings_stored'] / pipelined_time:.0f} chunks/s")
+    print(f"   stage time: extract {result['extract_seconds']:.2f}s, embed {result['embed_seconds']:.2f}s, "
+          f"store {result['store_seconds']:.2f}s over {result['batches']} batches")
+
+    # What the client-driven flow sends over the wire versus the server-side response
+    client_bytes = (len(json.dumps({'chunks': chunks}))
+                    + len(json.dumps({'embeddings': [{'chunk_id': f"chunk_{i}", 'embedding': embedding}
+                                                     for i, embedding in enumerate(embeddings)]})) * 2)
+    server_bytes = len(json.dumps({'document_id': "bench-pipelined", 'chunks_created': len(chunks),
+                                   'chunks_embedded': result['chunks_embedded'],
+                                   'embeddings_stored': result['embeddings_stored']}))
+    print(f"\n📦 Payload: client-driven ingest ~{client_bytes / 1e6:.1f} MB of JSON, server-side response {server_bytes} bytes")
+
+    complete = sequential_stored == result['embeddings_stored'] == len(chunks)
+    return complete, sequential_time, pipelined_time
+
+def main():
+    """Main benchmark function"""
+    print("🧪 Benchmarking server-side ingest pipeline")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tmp, "ingest.pdf")
+        if len(sys.argv) == 1:
+            generate_pdf(pdf_path)
+        complete, sequential_time, pipelined_time = asyncio.run(benchmark(pdf_path))
+
+    print("=" * 40)
+    if not complete:
+        print("❌ Not every chunk was stored")
+        return False
+    print(f"✅ Every chunk stored; pipelining ran {sequential_time / pipelined_time:.2f}x the sequential throughput")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Benchmark for per-page PDF engine selection
+Extracts a corpus with PyPDF2 only, pdfplumber only and the auto selector,
+reporting pages/sec and how closely each engine's text matches the ground
+truth. The generated corpus knows each page's text in reading order; a sample
+corpus directory may give it as a .txt beside each PDF, pages split by form feeds.
+"""
+
+import difflib
+import glob
+import os
+import sys
+import tempfile
+import time
+
+# Add ai-backend to path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-backend"))
+
+from pdf_processor import PDFProcessor
+
+PAGES = 40
+ENGINES = ('pypdf2', 'pdfplumber', 'auto')
+
+WORDS = ("thermodynamics entropy equilibrium enthalpy reaction kinetics catalyst molecule "
+         "electron orbital valence bond lattice crystal polymer solution acid base oxidation "
+         "reduction gradient vector matrix integral derivative theorem proof lemma").split()
+
+def page_lines(layout, page):
+    """
+    Text of a generated page as (x, y, text) placements in content stream order,
+    and the page's ground-truth lines in reading order
+    """
+    header = (50, 800, f"Chapter {page // 20 + 1} - Physical Chemistry Notes")
+    footer = (280, 40, f"Page {page + 1}")
+    if layout == 'text':
+        body = []
+        for line in range(45):
+            words = [WORDS[(page * 7 + line * 3 + i) % len(WORDS)] for i in range(11)]
+            body.append((50, 785 - line * 15, f"{page + 1}.{line + 1} " + " ".join(words) + "."))
+        placements = [header] + body + [footer]
+        return placements, [text for _, _, text in placements]
+    if layout == 'columns':
+        # Each left-column line ends in padding, as in PDFs printed from preformatted text
+        columns = ([], [])
+        for line in range(45):
+            for column, x in enumerate((50, 310)):
+                words = [WORDS[(page * 5 + line * 3 + column * 11 + i) % len(WORDS)] for i in range(4)]
+                columns[column].append((x, 785 - line * 15, " ".join(words)))
+        body = [(x, y, text + " " * 6) for x, y, text in columns[0]]
+        body = [placement for pair in zip(body, columns[1]) for placement in pair]
+        truth = [header[2]] + [text for _, _, text in columns[0] + columns[1]] + [footer[2]]
+        return [header] + body + [footer], truth
+    # Tables: 'table' draws row by row, 'table_by_column' column by column as many report generators do
+    rows = []
+    for row in range(40):
+        cells = [f"{row + 1}", f"{(page + 1) * (row + 3) % 97}.{row % 10}", f"{(row * 37 + page) % 1000}",
+                 f"{(row + page) % 13 * 7.5:.1f}%"]
+        rows.append([(60 + column * 120, 785 - row * 16, cell) for column, cell in enumerate(cells)])
+    cells = [cell for row in rows for cell in row]
+    if layout == 'table_by_column':
+        cells = [row[column] for column in range(4) for row in rows]
+    truth = [header[2]] + [" ".join(text for _, _, text in row) for row in rows] + [footer[2]]
+    return [header] + cells + [footer], truth
+
+def generate_pdf(path, layouts, pages=PAGES):
+    """
+    Write a PDF whose pages cycle through the given layouts (text, columns,
+    table, table_by_column), returning each page's ground-truth text
+    """
+    objects = []
+    truths = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page in range(pages):
+        commands = ["BT", "/F1 9 Tf"]
+        placements, truth = page_lines(layouts[page % len(layouts)], page)
+        truths.append("\n".join(truth))
+        for x, y, text in placements:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            commands.append(f"1 0 0 1 {x} {y} Tm ({escaped}) Tj")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1")
+
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return truths
+
+def text_equivalence(processor, pages, truths):
+    """Mean per-page word sequence similarity (0-1) against the ground-truth page texts"""
+    extracted = {page['page_number']: processor.clean_text(page['text']).split() for page in pages}
+    ratios = [
+        difflib.SequenceMatcher(None, extracted.get(number, []), processor.clean_text(truth).split(),
+                                autojunk=False).ratio()
+        for number, truth in enumerate(truths, 1)
+    ]
+    return sum(ratios) / len(ratios)
+
+def load_truths(path):
+    """Ground-truth page texts of a sample PDF from a .txt beside it (pages split by form feeds), if any"""
+    truth_path = os.path.splitext(path)[0] + ".txt"
+    if not os.path.exists(truth_path):
+        return None
+    with open(truth_path, encoding="utf-8") as file:
+        return file.read().split("\f")
+
+def main():
+    """Main benchmark function"""
+    print("🧪 Benchmarking per-page PDF engine selection")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            corpus = [(path, load_truths(path)) for path in sorted(glob.glob(os.path.join(sys.argv[1], "*.pdf")))]
+        else:
+            corpus = []
+            for name, layouts in (("text", ['text']), ("columns", ['columns']), ("table", ['table']),
+                                  ("table_by_column", ['table_by_column']),
+                                  ("mixed", ['text', 'text', 'text', 'columns', 'table_by_column'])):
+                path = os.path.join(tmp, f"{name}.pdf")
+                corpus.append((path, generate_pdf(path, layouts)))
+        print(f"📄 Corpus: {len(corpus)} PDFs")
+
+        success = True
+        totals = {engine: [0, 0.0] for engine in ENGINES}
+        for path, truths in corpus:
+            results = {}
+            for engine in ENGINES:
+                processor = PDFProcessor(extraction_workers=1, page_engine=engine)
+                start = time.perf_counter()
+                results[engine] = processor.extract_text_from_pdf(path)
+                elapsed = time.perf_counter() - start
+                totals[engine][0] += results[engine]['total_pages']
+                totals[engine][1] += elapsed
+                success = success and results[engine]['success']
+
+            print(f"\n📁 {os.path.basename(path)} ({results['auto']['total_pages']} pages)")
+            equivalence = {}
+            for engine in ENGINES:
+                if truths:
+                    equivalence[engine] = text_equivalence(processor, results[engine]['pages'], truths)
+                    quality = f"text equivalence {equivalence[engine]:.3f}"
+                else:
+                    quality = "no ground truth"
+                print(f"   {engine:<10} {quality}, pages by method {results[engine]['pages_by_method']}")
+            print(f"   auto escalations: {results['auto']['escalations'] or 'none'}")
+
+            # Escalating a page must never make its text worse than the fast path's
+            if equivalence and equivalence['auto'] < equivalence['pypdf2'] - 0.001:
+                print("   ❌ auto extracted worse text than PyPDF2 alone")
+                success = False
+
+    print("\n" + "=" * 40)
+    for engine in ENGINES:
+        pages, elapsed = totals[engine]
+        print(f"📊 {engine:<10} {pages / elapsed if elapsed else 0:.1f} pages/s")
+
+    if success:
+        print("✅ Corpus extracted with every engine, and escalation never lost text quality")
+        return True
+    print("❌ Extraction failed for at least one engine, or escalation lost text quality")
+    return False
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark for parallel page-level PDF text extraction
+Generates a multi-hundred-page text PDF and extracts it with 1..N worker processes
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add ai-backend to path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-backend"))
+
+from pdf_processor import PDFProcessor
+
+PAGES = 300
+LINES_PER_PAGE = 45
+
+WORDS = ("thermodynamics entropy equilibrium enthalpy reaction kinetics catalyst molecule "
+         "electron orbital valence bond lattice crystal polymer solution acid base oxidation "
+         "reduction gradient vector matrix integral derivative theorem proof lemma").split()
+
+def generate_pdf(path, pages=PAGES, lines_per_page=LINES_PER_PAGE):
+    """Write a plain text PDF with numbered pages, headers and footers"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Chapter {page // 20 + 1} - Physical Chemistry Notes"]
+        for line in range(lines_per_page):
+            words = [WORDS[(page * 7 + line * 3 + i) % len(WORDS)] for i in range(11)]
+            lines.append(f"{page + 1}.{line + 1} " + " ".join(words) + ".")
+        lines.append(f"Page {page + 1}")
+
+        commands = ["BT", "/F1 9 Tf", "11 TL", "50 800 Td"]
+        for text in lines:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            commands.append(f"({escaped}) Tj T*")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1")
+
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    with open(path, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+
+def time_extraction(pdf_path, workers):
+    """Extract the PDF with a given worker count, returning seconds and the result"""
+    processor = PDFProcessor(extraction_workers=workers)
+    try:
+        # Warm the pool so process start-up is not counted
+        if workers > 1:
+            processor._get_extraction_pool().submit(int).result()
+        start = time.perf_counter()
+        result = processor.extract_text_from_pdf(pdf_path)
+        return time.perf_counter() - start, result
+    finally:
+        processor.shutdown()
+
+def main():
+    """Main benchmark function"""
+    print("🧪 Benchmarking parallel PDF page extraction")
+    print("=" * 40)
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else PAGES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "textbook.pdf")
+        generate_pdf(pdf_path, pages)
+        print(f"📄 Generated {pages}-page PDF ({os.path.getsize(pdf_path) / 1024:.0f} KB)")
+        print(f"🖥️  CPU cores: {os.cpu_count()}")
+
+        worker_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+        baseline_time, baseline = time_extraction(pdf_path, 1)
+        print(f"📊 1 worker: {baseline_time:.2f}s ({pages / baseline_time:.0f} pages/s)")
+
+        consistent = True
+        for workers in worker_counts[1:]:
+            elapsed, result = time_extraction(pdf_path, workers)
+            same_output = result['full_text'] == baseline['full_text']
+            consistent = consistent and same_output
+            print(f"📊 {workers} workers: {elapsed:.2f}s ({pages / elapsed:.0f} pages/s) "
+                  f"speedup {baseline_time / elapsed:.2f}x, same output: {same_output}")
+
+    print("=" * 40)
+    if baseline['success'] and len(baseline['pages']) == pages and consistent:
+        print("✅ All pages extracted in order with every worker count")
+        return True
+    print("❌ Extraction output differed or pages were missing")
+    return False
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)